@@ -659,6 +659,40 @@ class LanguageServer:
 
         return multilspy_types.Hover(**response)
 
+    async def request_hover_many(
+        self, relative_file_path: str, positions: List[Tuple[int, int]], max_concurrency: Union[int, None] = None
+    ) -> List[Union[multilspy_types.Hover, None]]:
+        """
+        Raise [textDocument/hover](https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#textDocument_hover) requests to the Language Server
+        for all the given positions in the given file at once, and wait for all of the responses.
+
+        :param relative_file_path: The relative path of the file that has the hover information
+        :param positions: A list of (line, column) pairs
+        :param max_concurrency: The maximum number of requests in flight at any time (unbounded if None)
+
+        :return List[Union[multilspy_types.Hover, None]]: The hover results, in the order of the given positions
+        """
+        uri = pathlib.Path(os.path.join(self.repository_root_path, relative_file_path)).as_uri()
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def hover(line: int, column: int) -> Union[multilspy_types.Hover, None]:
+            params = {
+                "textDocument": {"uri": uri},
+                "position": {"line": line, "character": column},
+            }
+            if semaphore is None:
+                response = await self.server.send.hover(params)
+            else:
+                async with semaphore:
+                    response = await self.server.send.hover(params)
+            if response is None:
+                return None
+            assert isinstance(response, dict)
+            return multilspy_types.Hover(**response)
+
+        with self.open_file(relative_file_path):
+            return list(await asyncio.gather(*[hover(line, column) for line, column in positions]))
+
 
 @ensure_all_methods_implemented(LanguageServer)
 class SyncLanguageServer:
@@ -837,3 +871,22 @@ class SyncLanguageServer:
                 relative_file_path, line, column), self.loop
         ).result()
         return result
+
+    def request_hover_many(
+        self, relative_file_path: str, positions: List[Tuple[int, int]], max_concurrency: Union[int, None] = None
+    ) -> List[Union[multilspy_types.Hover, None]]:
+        """
+        Raise [textDocument/hover](https://microsoft.github.io/language-server-protocol/specifications/lsp/3.17/specification/#textDocument_hover) requests to the Language Server
+        for all the given positions in the given file at once, and wait for all of the responses.
+
+        :param relative_file_path: The relative path of the file that has the hover information
+        :param positions: A list of (line, column) pairs
+        :param max_concurrency: The maximum number of requests in flight at any time (unbounded if None)
+
+        :return List[Union[multilspy_types.Hover, None]]: The hover results, in the order of the given positions
+        """
+        result = asyncio.run_coroutine_threadsafe(
+            self.language_server.request_hover_many(
+                relative_file_path, positions, max_concurrency), self.loop
+        ).result()
+        return result
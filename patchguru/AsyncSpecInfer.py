@@ -0,0 +1,291 @@
+"""
+Asyncio driver of the SpecInfer pipeline.
+
+Every stage of `spec_infer`/`spec_generalization` is an awaitable coroutine, so a single process
+keeps many PRs in flight: while one PR waits for the LLM, another one executes its specification
+in a container. The stages reuse the synchronous stage functions of `SpecInfer`, which run in
+worker threads bridged to the event loop (see `EventLoopBridge`): their LLM queries are sent
+with AsyncOpenAI from the loop, and LLM requests, container executions and clone leases are
+bounded by global limits.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from patchguru import Config
+from patchguru.SpecInfer import (
+    prepare_analysis,
+    get_phase2_arguments,
+    is_analysis_finished,
+    load_states,
+    finalize_states,
+    intent_analysis,
+    bug_trigger_generation,
+    error_repair,
+    assertion_errors_review,
+    save_results_to_cache,
+)
+from patchguru.analysis.PRRetriever import get_repo
+from patchguru.analysis.BatchPlanner import plan_batch
+from patchguru.execution.AsyncDockerExecutor import AsyncDockerExecutor
+from patchguru.llms.LLMCache import LLM_CACHE_MODES, set_llm_cache_mode
+from patchguru.llms.LLMBudget import can_query, llm_budget
+from patchguru.prompts.AnswerParser import parse_statistics
+from patchguru.utils.GitHubHttpCache import GITHUB_CACHE_MODES, get_github_http_cache, set_github_cache_mode
+from patchguru.utils.EventLoopBridge import ResourceLimits, bridge_to
+from patchguru.llms.OpenAI import init_llm
+from patchguru.utils.Tracker import append_event, Event, init_tracker, pr_log_dir
+
+
+async def run_stage(stage, *args):
+    """
+    Awaits a synchronous stage in a worker thread.
+    """
+    return await asyncio.to_thread(stage, *args)
+
+
+async def warm_up_container(limits, cloned_repo_manager, commit):
+    """
+    Starts the warm worker of the container of the commit's clone in the background, e.g., while
+    the first stage waits for the LLM. Returns None if no clone is checked out at the commit.
+    """
+    cloned_repo = await run_stage(cloned_repo_manager.find_cloned_repo, commit)
+    if cloned_repo is None:
+        return None
+    return asyncio.create_task(AsyncDockerExecutor(
+        cloned_repo.container_name, cloned_repo.module_name, cloned_repo.container_repo_dir,
+        limits=limits, commit=cloned_repo.commit).warm_up())
+
+
+async def error_repair_and_review(
+        states,
+        limits,
+        pr_nb,
+        cache_dir,
+        pull_request_details,
+        prev_fut_code,
+        post_fut_code,
+        prev_fut_names,
+        post_fut_signatures,
+        enclosing_class,
+        pr,
+        cloned_repo_manager,
+        fut_name,
+        code_changes,
+    ):
+    # the specification is executed in the container of the pre-PR clone, which must not be checked out by other PRs meanwhile
+    async with limits.clones:
+        await run_stage(cloned_repo_manager.acquire, [pr.pre_commit])
+        try:
+            while states["stage"] not in ["completed", "failed"] and states["llm_queries"] < Config.MAX_LLM_QUERIES and can_query():
+                states = await run_stage(error_repair, states, pr_nb, cache_dir, pr, cloned_repo_manager, prev_fut_code, post_fut_code, fut_name, Config.REPAIR_ATTEMPTS)
+
+                if not states["error_repair"]:
+                    states["stage"] = "failed"
+                    break
+
+                states = await run_stage(assertion_errors_review, states, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, pr.import_string, enclosing_class, code_changes)
+
+                if not states["assert_review"]:
+                    states["stage"] = "failed"
+                    break
+        finally:
+            await run_stage(cloned_repo_manager.release, [pr.pre_commit])
+    return states
+
+
+async def spec_infer_async(
+        limits,
+        pr_nb: int,
+        force: bool = False,
+        cache_dir: str = None,
+        pull_request_details: str = None,
+        prev_fut_code: str = None,
+        post_fut_code: str = None,
+        prev_fut_names: str = None,
+        post_fut_signatures: str = None,
+        enclosing_class: str = None,
+        pr = None,
+        cloned_repo_manager = None,
+        fut_name: str = None,
+        code_changes: str = None,
+        summary_queries: int = 0,
+    ) -> dict:
+    is_complete, states = await run_stage(load_states, cache_dir, pr_nb, force, "Intent analysis results already cached. Loading from cache...")
+    if is_complete:
+        return states
+
+    # Stage 1: Intent Analysis
+    if states["stage"] == "init":
+        warm_up = await warm_up_container(limits, cloned_repo_manager, pr.pre_commit)
+        states = await run_stage(intent_analysis, states, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr_nb, cache_dir, pr.import_string)
+        if warm_up is not None:
+            await warm_up
+        states["llm_queries"] += summary_queries
+        if not states["intent_analysis"]:
+            states["stage"] = "failed"
+            await run_stage(save_results_to_cache, cache_dir, states)
+            return states
+
+    # Stage 2: Error Repair and Bug Review
+    states = await error_repair_and_review(states, limits, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr, cloned_repo_manager, fut_name, code_changes)
+
+    return await run_stage(finalize_states, states, pr_nb, cache_dir, "Specification inference")
+
+
+async def spec_generalization_async(
+        limits,
+        pr_nb: int,
+        force: bool = False,
+        cache_dir: str = None,
+        original_specification: str = None,
+        pull_request_details: str = None,
+        prev_fut_code: str = None,
+        post_fut_code: str = None,
+        prev_fut_names: str = None,
+        post_fut_signatures: str = None,
+        enclosing_class: str = None,
+        pr = None,
+        cloned_repo_manager = None,
+        fut_name: str = None,
+        code_changes: str = None,
+    ) -> dict:
+    is_complete, states = await run_stage(load_states, cache_dir, pr_nb, force, "Bug trigger generation results already cached. Loading from cache...")
+    if is_complete:
+        return states
+
+    # Stage 1: Bug Trigger Generation
+    if states["stage"] == "init":
+        states = await run_stage(bug_trigger_generation, states, original_specification, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr_nb, cache_dir, pr.import_string)
+        if not states["bug_trigger_generation"]:
+            states["stage"] = "failed"
+            await run_stage(save_results_to_cache, cache_dir, states)
+            return states
+
+    # Stage 2: Error Repair and Bug Review
+    states = await error_repair_and_review(states, limits, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr, cloned_repo_manager, fut_name, code_changes)
+
+    return await run_stage(finalize_states, states, pr_nb, cache_dir, "Specification generalization")
+
+
+async def analyze_async(project: str, pr_nb: int, limits, force: bool = False, repo = None) -> None:
+    with llm_budget(f"PR #{pr_nb}", Config.LLM_PR_MAX_TOKENS, Config.LLM_PR_MAX_COST, pr_nb):
+        # retrieving the PR checks out its pre- and post-PR commits
+        async with limits.clones:
+            phase1_arguments = await run_stage(prepare_analysis, project, pr_nb, repo)
+        if phase1_arguments is None:
+            return
+
+        phase1_ending_stages = await spec_infer_async(limits, pr_nb=pr_nb, force=force, **phase1_arguments)
+
+        phase2_arguments = await run_stage(get_phase2_arguments, project, pr_nb, phase1_arguments, phase1_ending_stages)
+        if phase2_arguments is None:
+            return
+
+        await spec_generalization_async(limits, pr_nb=pr_nb, force=force, **phase2_arguments)
+
+
+async def analyze_many_async(project: str, pr_nbs: list, max_prs: int = Config.ASYNC_MAX_PRS, force: bool = False, max_cost: float = Config.LLM_BATCH_MAX_COST) -> None:
+    """
+    Analyzes many PRs in one event loop, keeping up to `max_prs` of them in flight.
+    PRs whose cached results reached a final stage are skipped unless `force` is set.
+    The LLM queries of all PRs are charged to a batch budget of at most `max_cost` USD.
+    """
+    loop = asyncio.get_running_loop()
+    # stage threads block on the loop while they wait for a limit, so each PR in flight may hold one
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_prs + Config.ASYNC_MAX_EXECUTIONS))
+    limits = ResourceLimits()
+
+    if not force:
+        pending_pr_nbs = [pr_nb for pr_nb in pr_nbs if not is_analysis_finished(project, pr_nb)]
+    else:
+        pending_pr_nbs = list(pr_nbs)
+    append_event(Event(
+        level="INFO",
+        message=f"Analyzing {len(pending_pr_nbs)} PRs of project {project} with up to {max_prs} PRs in flight ({len(pr_nbs) - len(pending_pr_nbs)} already finished).",
+        type="BatchStart",
+        info={
+            "project": project,
+            "pr_nbs": pending_pr_nbs,
+            "max_prs": max_prs
+        }
+    ))
+    repo = await asyncio.to_thread(get_repo, project)
+    cloned_repo_manager = repo[1]
+    # the tasks acquire their clones in creation order, consecutive PRs share checkouts
+    pending_pr_nbs = await asyncio.to_thread(plan_batch, *repo, pending_pr_nbs)
+    checkouts_before = cloned_repo_manager.statistics["misses"]
+    start_time = time.time()
+    in_flight = asyncio.Semaphore(max_prs)
+
+    async def analyze_one(pr_nb):
+        async with in_flight:
+            with pr_log_dir(pr_nb):
+                try:
+                    await analyze_async(project, pr_nb, limits, force, repo)
+                except Exception as e:
+                    import traceback
+                    append_event(Event(
+                        level="ERROR", pr_nb=pr_nb,
+                        message=f"Analysis of PR #{pr_nb} failed: {e}\n ----- Stack Trace -----\n{traceback.format_exc()}"
+                    ))
+            return pr_nb
+
+    n_done = 0
+    with llm_budget(f"batch of {project}", Config.LLM_BATCH_MAX_TOKENS, max_cost) as batch_budget:
+        # the tasks run in copies of this context, so that their PR budgets are nested in the batch budget
+        with bridge_to(loop, limits):
+            tasks = [asyncio.create_task(analyze_one(pr_nb)) for pr_nb in pending_pr_nbs]
+        for task in asyncio.as_completed(tasks):
+            pr_nb = await task
+            n_done += 1
+            elapsed_hours = (time.time() - start_time) / 3600
+            append_event(Event(
+                level="INFO", pr_nb=pr_nb,
+                message=f"Finished PR #{pr_nb} ({n_done}/{len(pending_pr_nbs)}), throughput {n_done / elapsed_hours:.1f} PRs/hour, LLM cost ${batch_budget.cost:.2f}.",
+                type="BatchProgress",
+                info={
+                    "n_done": n_done,
+                    "n_total": len(pending_pr_nbs),
+                    "elapsed_time": time.time() - start_time,
+                    "prs_per_hour": n_done / elapsed_hours,
+                    "llm_cost": batch_budget.cost,
+                    "llm_tokens": batch_budget.prompt_tokens + batch_budget.completion_tokens
+                }
+            ))
+
+    elapsed_hours = (time.time() - start_time) / 3600
+    append_event(Event(
+        level="INFO",
+        message=f"Analyzed {n_done} PRs in {elapsed_hours * 60:.1f} minutes ({n_done / elapsed_hours if n_done > 0 else 0:.1f} PRs/hour, {cloned_repo_manager.statistics['misses'] - checkouts_before} checkouts).",
+        type="BatchEnd",
+        info={
+            "n_done": n_done,
+            "elapsed_time": time.time() - start_time,
+            "prs_per_hour": n_done / elapsed_hours if n_done > 0 else 0,
+            "checkouts": cloned_repo_manager.statistics["misses"] - checkouts_before,
+            "clone_statistics": dict(cloned_repo_manager.statistics),
+            "llm_usage": batch_budget.summary(),
+            "parse_statistics": parse_statistics(),
+            "github_cache": get_github_http_cache().statistics
+        }
+    ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Patch Reviewer CLI (asyncio pipeline)")
+    parser.add_argument("--project", type=str, required=True, help="Project name (e.g., pandas, scikit-learn)")
+    parser.add_argument("--pr_file", "--pr-file", type=str, required=True, help="File with one Pull Request number per line to review")
+    parser.add_argument("--max_prs", "--max-prs", type=int, default=Config.ASYNC_MAX_PRS, help="Maximum number of Pull Requests in flight")
+    parser.add_argument("--force", action="store_true", help="Force re-analysis even if results are cached")
+    parser.add_argument("--llm_cache", "--llm-cache", type=str, choices=LLM_CACHE_MODES, default=Config.LLM_CACHE_MODE, help="LLM response cache mode (replay-strict fails on a miss)")
+    parser.add_argument("--github_cache", "--github-cache", type=str, choices=GITHUB_CACHE_MODES, default=Config.GITHUB_HTTP_CACHE_MODE, help="GitHub response cache mode (offline fails on a miss)")
+    parser.add_argument("--max_cost", "--max-cost", type=float, default=Config.LLM_BATCH_MAX_COST, help="Maximum estimated LLM cost in USD of the batch")
+    args = parser.parse_args()
+    init_tracker()
+    set_llm_cache_mode(args.llm_cache)
+    set_github_cache_mode(args.github_cache)
+    init_llm()
+    with open(args.pr_file, "r") as f:
+        pr_nbs = [int(line.strip()) for line in f if line.strip()]
+    asyncio.run(analyze_many_async(args.project, pr_nbs, args.max_prs, args.force, args.max_cost))
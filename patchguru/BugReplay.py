@@ -38,7 +38,8 @@ def replay(repo_name: str, pr_number: int, timeout: int):
     print(f"post-change commit: {pr.post_commit}")
     cloned_repo = cloned_repo_manager.get_cloned_repo(commit)
     container_name = cloned_repo.container_name
-    docker_executor = DockerExecutor(container_name)
+    docker_executor = DockerExecutor(
+        container_name, cloned_repo.module_name, cloned_repo.container_repo_dir, commit=cloned_repo.commit)
 
     spec_path = result_path.replace("results.json", "specification.py")
     print(f"Replaying bug triggering code from specification: {spec_path}")
@@ -5,6 +5,10 @@ LOG_DIR = "logs/final_logs/marshmallow"
 # LOG_DIR = "logs/debug"
 
 LLM_MODEL = "gpt-5-mini"  # Default model for LLM queries
+LLM_BACKEND = "openai"  # LLM backend: openai (also for OpenAI-compatible servers such as llms/StubServer.py) or fixture (recorded responses)
+OPENAI_BASE_URL = None  # Base URL of an OpenAI-compatible server (e.g., "http://localhost:8400/v1"), None for the OpenAI API
+LLM_FIXTURE_FILES = ["logs/**/llm_usage.json"]  # Recorded llm_usage.json files (or glob patterns) answering queries of the fixture backend
+LLM_FIXTURE_LATENCY = 0.0  # Seconds the fixture backend and the stub server wait before answering
 
 USE_REFERENCE = True
 USE_REFERENCE_SUMMARY = True
@@ -18,16 +22,79 @@ SELF_REVIEW_PROMPT = "v1"  # Default prompt version for self review
 BUG_TRIGGER_PROMPT = "v2"  # Default prompt version for bug trigger generation
 
 REPAIR_ATTEMPTS = 5  # Number of attempts to repair errors in code
+REPAIR_CANDIDATES = 1  # Repair candidates generated and executed concurrently per repair round (1 repairs serially), within REPAIR_ATTEMPTS
 ANALYSIS_ATTEMPTS = 5  # Number of attempts to re-run the analysis if output is invalid
 GENERALIZED_ATTEMPTS = 3  # Number of attempts to generalize specifications
 REVIEW_ATTEMPTS = 3  # Number of attempts to re-run the review if output is invalid
+ANALYSIS_SAMPLES = 1  # Concurrent candidate completions per round of intent analysis and bug trigger generation (1 queries sequentially)
 
 MAX_LLM_QUERIES = 20  # Maximum number of LLM queries to ask during analysis
+LLM_PR_MAX_TOKENS = None  # Maximum number of tokens spent on one PR (None for no limit)
+LLM_PR_MAX_COST = None  # Maximum estimated cost in USD spent on one PR (None for no limit)
+LLM_BATCH_MAX_TOKENS = None  # Maximum number of tokens spent on a batch of PRs (None for no limit)
+LLM_BATCH_MAX_COST = None  # Maximum estimated cost in USD spent on a batch of PRs (None for no limit)
+LLM_EXPECTED_COMPLETION_TOKENS = 4000  # Completion tokens assumed for a query before its usage is known
+LLM_REQUESTS_PER_MINUTE = 500  # Requests per minute allowed by the API, shared by all PRs of the process (None for no limit)
+LLM_TOKENS_PER_MINUTE = 500000  # Tokens per minute allowed by the API, shared by all PRs of the process (None for no limit)
+LLM_REQUEST_TIMEOUT = 600  # Seconds before an LLM request is abandoned (and retried)
+LLM_MAX_RETRIES = 4  # Retries of an LLM request after rate limits, timeouts, connection or server errors
+LLM_RETRY_BASE_DELAY = 2.0  # Seconds of the first retry backoff, doubled at each retry (with full jitter)
+LLM_RETRY_MAX_DELAY = 60.0  # Maximum seconds of a retry backoff
+LLM_HEDGE_REQUESTS = False  # Send a second identical request when the first one is slower than the hedge quantile of its stage
+LLM_HEDGE_QUANTILE = 0.95  # Latency quantile of a stage after which a request is hedged
+LLM_HEDGE_MIN_SAMPLES = 20  # Latencies of a stage observed before its requests are hedged
+LLM_STRUCTURED_OUTPUT = False  # Ask for JSON answers following the schema of each prompt (structured outputs) instead of tagged free text
+LLM_CACHED_PROMPT_PRICE_RATIO = 0.1  # Price of prompt tokens served from the provider's prompt cache, relative to uncached ones
+LLM_PRICES = {  # USD per million (prompt, completion) tokens, for cost estimates
+    "gpt-5": (1.25, 10.0),
+    "gpt-5-mini": (0.25, 2.0),
+    "gpt-5-nano": (0.05, 0.4),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+}
 
 PL = "python"  # Default programming language for analysis
 
+# Execute specifications in children forked from a pre-warmed interpreter inside the containers (opt-in).
+# The children inherit the pre-imported module and its process state (e.g., KERAS_BACKEND, TensorFlow's
+# thread pools and global settings), so their results can differ from those of cold runs.
+USE_WARM_WORKER = False
+WARM_WORKER_STARTUP_TIMEOUT = 300  # Seconds to wait for the warm worker to import the target project
+BATCH_PARALLELISM = 4  # Number of scripts run concurrently inside a container by DockerExecutor.execute_many
+
+CLONE_POOL_SIZE = 3  # Checkouts of the analyzed repository (clone1 is a full clone, missing ones are created as local clones of it)
+CLONE_POOL_PROCESSES = 1  # Processes expected to share a clone pool, each locks its share of the slots (at least two)
+CLONE_FETCH_TTL = 3600  # Seconds after a fetch of the clones during which starting a run does not fetch them again (0 always fetches)
+
+ASYNC_MAX_PRS = 32  # Maximum number of PRs in flight in the asyncio pipeline (AsyncSpecInfer)
+ASYNC_MAX_LLM_REQUESTS = 16  # Maximum number of concurrent LLM requests in the asyncio pipeline
+ASYNC_MAX_EXECUTIONS = 6  # Maximum number of concurrent container executions in the asyncio pipeline
+ASYNC_MAX_EXECUTIONS_PER_CONTAINER = 2  # Maximum number of concurrent executions in one container
+ASYNC_MAX_CLONE_LEASES = 3  # Maximum number of PRs holding clones at the same time (at most the number of clones)
+
 CACHE_DIR = ".cache"  # Default cache directory for storing results
 
+LLM_CACHE_MODE = "off"  # LLM response cache mode: off, read-write, read-only or replay-strict (fails on a miss)
+LLM_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Size limit of the on-disk LLM response cache before LRU eviction
+
+LSP_IDLE_TIMEOUT = 600  # Seconds without requests before a language server session is shut down (0 disables idle shutdown)
+LSP_MAX_CONCURRENT_REQUESTS = 16  # Maximum number of language server requests in flight for batched hovers
+HOVER_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Size limit of the on-disk hover cache before LRU eviction
+GIT_DIFF_CACHE_SIZE = 1000  # Maximum number of PR diffs kept in memory between their computation and their use
+GIT_DIFF_BATCH_SIZE = 100  # PR diffs computed per git process when collecting PRs
+
+GITHUB_HTTP_CACHE_MODE = "revalidate"  # GitHub REST response cache mode: off, revalidate (conditional requests) or offline (replays stored responses, fails on a miss)
+GITHUB_HTTP_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # Size limit of the on-disk GitHub REST response cache before LRU eviction
+GITHUB_PREFETCH = True  # Fetch the context of PRs and of their references in bulk GraphQL requests (False uses the paginated REST API)
+GITHUB_PREFETCH_MAX_COMMENTS = 100  # Comments, review threads and comments per thread fetched for the analyzed PR (at most 100)
+GITHUB_REFERENCE_MAX_COMMENTS = 30  # Comments, review threads and comments per thread fetched for each referenced issue/PR
+GITHUB_PREFETCH_BATCH_SIZE = 20  # Referenced issues/PRs fetched per GraphQL request
+GITHUB_REQUEST_TIMEOUT = 60  # Seconds before a GitHub request is abandoned
+GITHUB_CACHE_TTL = 7 * 24 * 3600  # Seconds before prefetched GitHub data is fetched again (None never expires)
+GITHUB_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Size limit of the on-disk cache of prefetched GitHub data before LRU eviction
+
 PR_CUT_OFF = {
     "pandas": 59900,
     "scipy": 21652,
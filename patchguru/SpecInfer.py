@@ -1,8 +1,13 @@
 import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from patchguru.utils.Logger import format_info_frame
 import os
 import json
-from patchguru.analysis.PRRetriever import retrieve_pr
+import time
+from patchguru.analysis.PRRetriever import get_repo, retrieve_pr
+from patchguru.analysis.GitHubPrefetcher import GitHubPrefetchError, get_prefetcher
+from patchguru.analysis.BatchPlanner import plan_batch
 from patchguru import Config
 from patchguru.analysis.IntentAnalysis import analyze_intent
 from patchguru.analysis.BugTrigger import generalize_spec
@@ -12,78 +17,119 @@ from patchguru.analysis.TestDriverRepair import repair
 from patchguru.analysis.TestDriverReview import review_test_driver
 import github
 import re
-from patchguru.utils.Tracker import append_event, Event
-from patchguru.llms.OpenAI import query_llm
-
-
-def extract_pr_reference(pr):
-    comments = ""
-    comments += f"Comment by {pr.user.login}:\n"
-    comments += f"{pr.body}\n\n"
-    for comment in pr.get_issue_comments():
-        new_comment = f"Comment by {comment.user.login}:\n"
-        new_comment += f"{comment.body}\n\n"
-        if len(comments) + len(new_comment) > 1000:
-            comments += "(...truncated...)\n\n"
-            break
-        comments += new_comment
-
-    review_comments = ""
-    for comment in pr.get_comments():
-        new_review_comment = f"Comment by {comment.user.login}:\n"
-        new_review_comment += f"{comment.body}\n\n"
-        if len(review_comments) + len(new_review_comment) > 1000:
-            review_comments += "(...truncated...)\n\n"
-            break
-        review_comments += new_review_comment
-
-    commit_messages = ""
-    for commit in pr.get_commits():
-        new_commit_message = f"{commit.commit.message}\n\n"
-        if len(commit_messages) + len(new_commit_message) > 1000:
-            commit_messages += "(...truncated...)\n\n"
+from patchguru.utils.Tracker import append_event, Event, init_tracker, pr_log_dir
+from patchguru.llms.OpenAI import init_llm, query_llm
+from patchguru.llms.LLMCache import LLM_CACHE_MODES, set_llm_cache_mode
+from patchguru.llms.LLMBudget import can_query, llm_budget
+from patchguru.prompts.AnswerParser import parse_statistics
+from patchguru.utils.GitHubHttpCache import GITHUB_CACHE_MODES, get_github_http_cache, set_github_cache_mode
+
+
+def _truncate(sections, limit, text=""):
+    """
+    Appends the sections to the text until it would exceed `limit` characters. A None section
+    stands for content that was not fetched.
+    """
+    for section in sections:
+        if section is None or len(text) + len(section) > limit:
+            text += "(...truncated...)\n\n"
             break
-        commit_messages += new_commit_message
+        text += section
+    return text
+
+def _rest_context(item, is_pull_request):
+    """
+    Context of a PyGithub PR or issue in the format of the GitHubPrefetcher entries. Lists are
+    generators, so that pages are only requested until the context is truncated.
+    """
+    context = {
+        "number": item.number,
+        "title": item.title,
+        "author": item.user.login,
+        "body": item.body,
+        "comments": ([comment.user.login, comment.body] for comment in (item.get_issue_comments() if is_pull_request else item.get_comments())),
+    }
+    if is_pull_request:
+        context["review_comments"] = ([comment.user.login, comment.body] for comment in item.get_comments())
+        context["commit_messages"] = (commit.commit.message for commit in item.get_commits())
+    return context
+
+def _format_comments(context, limit):
+    comments = f"Comment by {context['author']}:\n"
+    comments += f"{context['body']}\n\n"
+    return _truncate(
+        (None if comment is None else f"Comment by {comment[0]}:\n{comment[1]}\n\n" for comment in context["comments"]),
+        limit, comments)
+
+def _format_review_comments(context, limit):
+    return _truncate(
+        (None if comment is None else f"Comment by {comment[0]}:\n{comment[1]}\n\n" for comment in context["review_comments"]),
+        limit)
+
+def _format_commit_messages(context, limit):
+    return _truncate(
+        (None if message is None else f"{message}\n\n" for message in context["commit_messages"]),
+        limit)
 
-    result = "#### Reference PR #" + str(pr.number) + "\n\n"
+def extract_pr_reference(pr):
+    """
+    `pr` is a GitHubPrefetcher entry or a PyGithub pull request.
+    """
+    context = pr if isinstance(pr, dict) else _rest_context(pr, is_pull_request=True)
+    result = "#### Reference PR #" + str(context["number"]) + "\n\n"
     result += "##### Title"
-    result += "#" + str(pr.number) + ": " + pr.title + "\n"
+    result += "#" + str(context["number"]) + ": " + context["title"] + "\n"
     result += "\n##### Comments\n"
-    result += comments
+    result += _format_comments(context, 1000)
     result += "\n##### Review comments\n"
-    result += review_comments
+    result += _format_review_comments(context, 1000)
     result += "\n##### Commit messages\n"
-    result += commit_messages
+    result += _format_commit_messages(context, 1000)
 
     return result
 
 def extract_issue_reference(issue):
-    comments = ""
-    comments += f"Comment by {issue.user.login}:\n"
-    comments += f"{issue.body}\n\n"
-    for comment in issue.get_comments():
-        new_comment = f"Comment by {comment.user.login}:\n"
-        new_comment += f"{comment.body}\n\n"
-        if len(comments) + len(new_comment) > 1000:
-            comments += "(...truncated...)\n\n"
-            break
-        comments += new_comment
-
-    result = "#### Reference Issue #" + str(issue.number) + "\n\n"
+    """
+    `issue` is a GitHubPrefetcher entry or a PyGithub issue.
+    """
+    context = issue if isinstance(issue, dict) else _rest_context(issue, is_pull_request=False)
+    result = "#### Reference Issue #" + str(context["number"]) + "\n\n"
     result += "##### Title\n"
-    result += "#" + str(issue.number) + ": " + issue.title + "\n"
+    result += "#" + str(context["number"]) + ": " + context["title"] + "\n"
     result += "\n##### Comments\n"
-    result += comments
+    result += _format_comments(context, 1000)
 
     return result
 
-def extract_references(github_repo, comments):
+def _prefetch_failed(pr_nb, error):
+    append_event(Event(
+        level="WARNING", pr_nb=pr_nb,
+        message=f"Failed to prefetch GitHub data ({error}). Falling back to the REST API.",
+        type="GitHubPrefetchFailed",
+        info={"error": str(error)}
+    ))
+
+def extract_references(github_repo, comments, pr_nb=-1):
     # Find issue/PR references in the comments and review comments
     pattern = r"(#\d+)"
     matched_refs = re.findall(pattern, comments)
     unique_refs = list(set(matched_refs))
     unique_refs = [int(ref[1:]) for ref in unique_refs]
 
+    if Config.GITHUB_PREFETCH:
+        try:
+            number_to_entry = get_prefetcher(github_repo.full_name).get_references(unique_refs, pr_nb)
+            result = ""
+            for ref in unique_refs:
+                entry = number_to_entry.get(ref)
+                if entry is None:
+                    continue
+                ref_details = extract_pr_reference(entry) if entry["type"] == "pull_request" else extract_issue_reference(entry)
+                result += ref_details + "\n\n"
+            return result
+        except GitHubPrefetchError as e:
+            _prefetch_failed(pr_nb, e)
+
     result = ""
     for ref in unique_refs:
         try:
@@ -102,38 +148,23 @@ def extract_references(github_repo, comments):
             pass
     return result
 
-def extract_pr_details(pr, use_reference=False, github_repo= None) -> str:
-    comments = ""
-    comments += f"Comment by {pr.github_pr.user.login}:\n"
-    comments += f"{pr.github_pr.body}\n\n"
-    for comment in pr.github_pr.get_issue_comments():
-        new_comment = f"Comment by {comment.user.login}:\n"
-        new_comment += f"{comment.body}\n\n"
-        if len(comments) + len(new_comment) > 2000:
-            comments += "(...truncated...)\n\n"
-            break
-        comments += new_comment
-
-    review_comments = ""
-    for comment in pr.github_pr.get_comments():
-        new_review_comment = f"Comment by {comment.user.login}:\n"
-        new_review_comment += f"{comment.body}\n\n"
-        if len(review_comments) + len(new_review_comment) > 2000:
-            review_comments += "(...truncated...)\n\n"
-            break
-        review_comments += new_review_comment
+def _pr_context(pr):
+    if Config.GITHUB_PREFETCH:
+        try:
+            return get_prefetcher(pr.repo_full_name).get_pull_request(pr.number, pr.number)
+        except GitHubPrefetchError as e:
+            _prefetch_failed(pr.number, e)
+    return _rest_context(pr.github_pr, is_pull_request=True)
 
-    commit_messages = ""
-    for commit in pr.github_pr.get_commits():
-        new_commit_message = f"{commit.commit.message}\n\n"
-        if len(commit_messages) + len(new_commit_message) > 2000:
-            commit_messages += "(...truncated...)\n\n"
-            break
-        commit_messages += new_commit_message
+def extract_pr_details(pr, use_reference=False, github_repo= None) -> str:
+    context = _pr_context(pr)
+    comments = _format_comments(context, 2000)
+    review_comments = _format_review_comments(context, 2000)
+    commit_messages = _format_commit_messages(context, 2000)
 
     result = ""
     result += "### Title\n"
-    result += "#" + str(pr.github_pr.number) + ": " + pr.github_pr.title + "\n"
+    result += "#" + str(context["number"]) + ": " + context["title"] + "\n"
     result += "\n### Comments\n"
     result += comments
     result += "\n### Review comments\n"
@@ -145,7 +176,7 @@ def extract_pr_details(pr, use_reference=False, github_repo= None) -> str:
     n_queries = 0
     if use_reference:
         assert github_repo is not None, "github_repo must be provided when use_reference is True"
-        reference_details = extract_references(github_repo, comments)
+        reference_details = extract_references(github_repo, comments, pr.number)
         if Config.USE_REFERENCE_SUMMARY:
             # Create prompt to summarize references
             from patchguru.prompts.reference_summary.ReferenceSummaryPromptV1 import ReferenceSummaryPrompt
@@ -162,7 +193,7 @@ def extract_pr_details(pr, use_reference=False, github_repo= None) -> str:
                     "prompt": prompt
                 }
             ))
-            response = query_llm(prompt, model=Config.LLM_MODEL)
+            response = query_llm(prompt, model=Config.LLM_MODEL, stage="reference_summary", response_format=reference_prompt.response_format())
             summary = reference_prompt.parse_answer(response)
 
             n_queries = 1
@@ -171,7 +202,7 @@ def extract_pr_details(pr, use_reference=False, github_repo= None) -> str:
                     level="ERROR",
                     message=f"Failed to parse LLM response for reference summary generation. Retrying..."
                 ))
-                response = query_llm(prompt, model=Config.LLM_MODEL)
+                response = query_llm(prompt, model=Config.LLM_MODEL, stage="reference_summary", response_format=reference_prompt.response_format())
                 summary = reference_prompt.parse_answer(response)
                 n_queries += 1
 
@@ -373,6 +404,55 @@ def intent_analysis(
     save_results_to_cache(cache_dir, states)
     return states
 
+def is_post_pr_assertion_error(stdout, fut_name):
+    """
+    Whether the execution ended with an AssertionError outside of the pre-PR function, i.e., a potential bug in the PR.
+    """
+    return "AssertionError" in stdout and not (("pre-pr" in stdout.lower() and "post-pr" not in stdout.lower()) or ("pre_" + fut_name in stdout.lower() and "post_" + fut_name not in stdout.lower()))
+
+def repair_speculatively(states, executor, specification, stdout, prev_fut_code, post_fut_code, fut_name, n_candidates, pr_nb):
+    """
+    Generates `n_candidates` repairs of the specification concurrently and executes them all in one
+    batch. Keeps the first candidate that passes, else the first one ending with a post-PR
+    AssertionError, else the first one. Records every candidate and its outcome in the states.
+    Returns the kept (specification, exit code, output), or None if no candidate was generated.
+    """
+    with ThreadPoolExecutor(max_workers=n_candidates) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, repair, specification, stdout, prev_fut_code, post_fut_code)
+            for _ in range(n_candidates)
+        ]
+        candidates = [future.result() for future in futures]
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    if len(candidates) == 0:
+        return None
+
+    results = executor.execute_many(candidates, timeout_each=900)
+    states["specification_traces"].extend(candidates)
+    states.setdefault("repair_candidates", []).append([
+        {"specification": candidate, "exit_code": result["exit_code"], "error_message": result["output"]}
+        for candidate, result in zip(candidates, results)
+    ])
+    kept_idx = next(
+        (idx for idx, result in enumerate(results) if result["exit_code"] == 0),
+        next((idx for idx, result in enumerate(results) if is_post_pr_assertion_error(result["output"], fut_name)), 0))
+    append_event(Event(
+        level="INFO", pr_nb=pr_nb,
+        message=[
+            f"Executed {len(candidates)} repair candidates, exit codes {[result['exit_code'] for result in results]}. Keeping candidate {kept_idx + 1}:",
+            format_info_frame(candidates[kept_idx], "REPAIRED SPECIFICATION (CANDIDATE " + str(kept_idx + 1) + ")")
+        ],
+        type="RepairResult",
+        info={
+            "specification_before_repair": specification,
+            "repaired_specification": candidates[kept_idx],
+            "candidates": candidates,
+            "exit_codes": [result["exit_code"] for result in results],
+            "kept_candidate": kept_idx
+        }
+    ))
+    return candidates[kept_idx], results[kept_idx]["exit_code"], results[kept_idx]["output"]
+
 def error_repair(
         states,
         pr_nb,
@@ -386,7 +466,8 @@ def error_repair(
     ):
     execution_status = states.get(f"execution_status", None)
     cloned_repo = cloned_repo_manager.get_cloned_repo(pr.pre_commit)
-    executor = DockerExecutor(container_name=cloned_repo.container_name)
+    executor = DockerExecutor(
+        cloned_repo.container_name, cloned_repo.module_name, cloned_repo.container_repo_dir, commit=cloned_repo.commit)
     specification = states["specification"]
     if states["stage"] != "error_repair":
         states["stage"] = "error_repair"
@@ -414,15 +495,13 @@ def error_repair(
         stdout = execution_status[-1]["error_message"]
         repair_attempts = execution_status[-1]["repair_attempts"]
 
-    # reset llm_queries for repair attempts
-    states["llm_queries"] -= repair_attempts
-
     is_assertion_error = False
+    is_budget_exhausted = False
     # Repair loop until success or max attempts reached
     while (exit_code != 0 and repair_attempts < max_attempts):
 
         # If assertion error happens in post-PR functions, we stop the repair attempts
-        if "AssertionError" in stdout and not (("pre-pr" in stdout.lower() and "post-pr" not in stdout.lower()) or ("pre_" + fut_name in stdout.lower() and "post_" + fut_name not in stdout.lower())):
+        if is_post_pr_assertion_error(stdout, fut_name):
             append_event(Event(
                 level="INFO", pr_nb=pr_nb,
                 message="Validation ended with AssertionError indicating potential bugs in the PR. Stopping repair attempts."
@@ -430,6 +509,35 @@ def error_repair(
             is_assertion_error = True
             break
 
+        if not can_query():
+            is_budget_exhausted = True
+            break
+
+        if Config.REPAIR_CANDIDATES > 1:
+            n_candidates = min(Config.REPAIR_CANDIDATES, max_attempts - repair_attempts)
+            append_event(Event(
+                level="INFO", pr_nb=pr_nb,
+                message=f"Validation failed! => Generating {n_candidates} repair candidates (Attempts {repair_attempts + 1}-{repair_attempts + n_candidates})..."
+            ))
+            kept = repair_speculatively(states, executor, specification, stdout, prev_fut_code, post_fut_code, fut_name, n_candidates, pr_nb)
+            states["llm_queries"] += n_candidates
+            repair_attempts += n_candidates
+            if kept is None:
+                append_event(Event(
+                    level="WARNING", pr_nb=pr_nb,
+                    message="No repair candidate generated. Re-trying..."
+                ))
+                continue
+            specification, exit_code, stdout = kept
+            states["specification"] = specification
+            states["execution_status"].append({
+                "exit_code": exit_code,
+                "error_message": stdout,
+                "repair_attempts": repair_attempts
+            })
+            save_results_to_cache(cache_dir, states)
+            continue
+
         append_event(Event(
             level="INFO", pr_nb=pr_nb,
             message=f"Validation failed! => Attempting to repair the specification (Attempt {repair_attempts + 1})..."
@@ -442,6 +550,8 @@ def error_repair(
             prev_fut_code=prev_fut_code,
             post_fut_code=post_fut_code
         )
+        # counted as soon as it is asked, so that resumed runs do not count it again
+        states["llm_queries"] += 1
 
         if fixed_specification is None:
             append_event(Event(
@@ -480,18 +590,16 @@ def error_repair(
         save_results_to_cache(cache_dir, states)
 
     if exit_code != 0 and not is_assertion_error:
-        assert repair_attempts >= max_attempts, "If exit_code is not 0, repair_attempts should reach max_attempts."
+        assert repair_attempts >= max_attempts or is_budget_exhausted, "If exit_code is not 0, repair_attempts should reach max_attempts unless the LLM budget is exhausted."
         append_event(Event(
             level="ERROR", pr_nb=pr_nb,
-            message=f"Failed to validate specification after {max_attempts} attempts. Exiting..."
+            message=f"Failed to validate specification after {repair_attempts} attempts. Exiting..."
         ))
 
-        states["llm_queries"] += repair_attempts
         states[f"error_repair"] = False
         save_results_to_cache(cache_dir, states)
         return states
 
-    states["llm_queries"] += repair_attempts
     states[f"error_repair"] = True
     save_results_to_cache(cache_dir, states)
     return states
@@ -679,24 +787,10 @@ def bug_trigger_generation(
     save_results_to_cache(cache_dir, states)
     return states
 
-def spec_infer(
-        pr_nb: int,
-        force: bool = False,
-        cache_dir: str = None,
-        pull_request_details: str = None,
-        prev_fut_code: str = None,
-        post_fut_code: str = None,
-        prev_fut_names: str = None,
-        post_fut_signatures: str = None,
-        enclosing_class: str = None,
-        pr = None,
-        cloned_repo_manager = None,
-        fut_name: str = None,
-        code_changes: str = None,
-        summary_queries: int = 0,
-    ) -> int:
-
-    ### Check and load from cache if available
+def load_states(cache_dir, pr_nb, force, cached_message):
+    """
+    Returns whether the phase is already complete and its states, loaded from cache if available.
+    """
     states = {
         "stage": "init",
         "llm_queries": 0,
@@ -706,41 +800,20 @@ def spec_infer(
             Event(
                 level="INFO",
                 pr_nb=pr_nb,
-                message="Intent analysis results already cached. Loading from cache..."
+                message=cached_message
             )
         )
+        return load_from_cache(cache_dir, pr_nb)
+    return False, states
 
-        is_complete, states = load_from_cache(cache_dir, pr_nb)
-        if is_complete:
-            return states
-
-    # Stage 1: Intent Analysis
-    if states["stage"] == "init":
-        states = intent_analysis(states, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr_nb, cache_dir, pr.import_string)
-        states["llm_queries"] += summary_queries
-        if not states["intent_analysis"]:
-            states["stage"] = "failed"
-            save_results_to_cache(cache_dir, states)
-            return states
-
-    # Stage 2: Error Repair and Bug Review
-    while states["stage"] not in ["completed", "failed"] and states["llm_queries"] < Config.MAX_LLM_QUERIES:
-        states = error_repair(states, pr_nb, cache_dir, pr, cloned_repo_manager, prev_fut_code, post_fut_code, fut_name, Config.REPAIR_ATTEMPTS)
-
-        if not states[f"error_repair"]:
-            states["stage"] = "failed"
-            break
-
-        states = assertion_errors_review(states, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, pr.import_string, enclosing_class, code_changes)
-
-        if not states["assert_review"]:
-            states["stage"] = "failed"
-            break
-
+def finalize_states(states, pr_nb, cache_dir, phase_name):
+    """
+    Reports the conclusion of a phase once its stage loop ended and saves its states.
+    """
     if states["stage"] != "completed":
         append_event(Event(
             level="ERROR", pr_nb=pr_nb,
-            message="Analysis did not complete successfully within the allowed number of LLM queries. Exiting."
+            message="Analysis did not complete successfully within the allowed number of LLM queries and LLM budget. Exiting."
         ))
         states["stage"] = "failed"
         save_results_to_cache(cache_dir, states)
@@ -752,7 +825,7 @@ def spec_infer(
         append_event(Event(
             level="WARNING", pr_nb=pr_nb,
             message= [
-                "Specification inference completed. Issues found in the Pull Request.",
+                f"{phase_name} completed. Issues found in the Pull Request.",
                 "Please review the final specification and execution message.",
                 format_info_frame(states["specification"], "FINAL SPECIFICATION"),
                 format_info_frame(error_message, "EXECUTION MESSAGE")
@@ -761,7 +834,7 @@ def spec_infer(
     elif states["review_conclusion"] == "NORMAL":
         append_event(Event(
             level="INFO", pr_nb=pr_nb,
-            message="Specification inference completed successfully. No issues found in the Pull Request.",
+            message=f"{phase_name} completed successfully. No issues found in the Pull Request.",
             type="AnalysisComplete",
         ))
     else:
@@ -770,11 +843,10 @@ def spec_infer(
     save_results_to_cache(cache_dir, states)
     return states
 
-def spec_generalization(
+def spec_infer(
         pr_nb: int,
         force: bool = False,
         cache_dir: str = None,
-        original_specification: str = None,
         pull_request_details: str = None,
         prev_fut_code: str = None,
         post_fut_code: str = None,
@@ -785,26 +857,63 @@ def spec_generalization(
         cloned_repo_manager = None,
         fut_name: str = None,
         code_changes: str = None,
+        summary_queries: int = 0,
     ) -> int:
 
     ### Check and load from cache if available
-    states = {
-        "stage": "init",
-        "llm_queries": 0,
-    }
-    if os.path.exists(os.path.join(cache_dir, "results.json")) and not force:
-        append_event(
-            Event(
-                level="INFO",
-                pr_nb=pr_nb,
-                message="Bug trigger generation results already cached. Loading from cache..."
-            )
-        )
+    is_complete, states = load_states(cache_dir, pr_nb, force, "Intent analysis results already cached. Loading from cache...")
+    if is_complete:
+        return states
 
-        is_complete, states = load_from_cache(cache_dir, pr_nb)
-        if is_complete:
+    # Stage 1: Intent Analysis
+    if states["stage"] == "init":
+        states = intent_analysis(states, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr_nb, cache_dir, pr.import_string)
+        states["llm_queries"] += summary_queries
+        if not states["intent_analysis"]:
+            states["stage"] = "failed"
+            save_results_to_cache(cache_dir, states)
             return states
 
+    # Stage 2: Error Repair and Bug Review
+    # the specification is executed in the container of the pre-PR clone, which must not be checked out by other PRs meanwhile
+    with cloned_repo_manager.lease([pr.pre_commit]):
+        while states["stage"] not in ["completed", "failed"] and states["llm_queries"] < Config.MAX_LLM_QUERIES and can_query():
+            states = error_repair(states, pr_nb, cache_dir, pr, cloned_repo_manager, prev_fut_code, post_fut_code, fut_name, Config.REPAIR_ATTEMPTS)
+
+            if not states["error_repair"]:
+                states["stage"] = "failed"
+                break
+
+            states = assertion_errors_review(states, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, pr.import_string, enclosing_class, code_changes)
+
+            if not states["assert_review"]:
+                states["stage"] = "failed"
+                break
+
+    return finalize_states(states, pr_nb, cache_dir, "Specification inference")
+
+def spec_generalization(
+        pr_nb: int,
+        force: bool = False,
+        cache_dir: str = None,
+        original_specification: str = None,
+        pull_request_details: str = None,
+        prev_fut_code: str = None,
+        post_fut_code: str = None,
+        prev_fut_names: str = None,
+        post_fut_signatures: str = None,
+        enclosing_class: str = None,
+        pr = None,
+        cloned_repo_manager = None,
+        fut_name: str = None,
+        code_changes: str = None,
+    ) -> int:
+
+    ### Check and load from cache if available
+    is_complete, states = load_states(cache_dir, pr_nb, force, "Bug trigger generation results already cached. Loading from cache...")
+    if is_complete:
+        return states
+
     # Stage 1: Bug Trigger Generation
     if states["stage"] == "init":
         states = bug_trigger_generation(states, original_specification, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, pr_nb, cache_dir, pr.import_string)
@@ -814,53 +923,28 @@ def spec_generalization(
             return states
 
     # Stage 2: Error Repair and Bug Review
-    while states["stage"] not in ["completed", "failed"] and states["llm_queries"] < Config.MAX_LLM_QUERIES:
-        states = error_repair(states, pr_nb, cache_dir, pr, cloned_repo_manager, prev_fut_code, post_fut_code, fut_name, Config.REPAIR_ATTEMPTS)
-
-        if not states[f"error_repair"]:
-            states["stage"] = "failed"
-            break
-
-        states = assertion_errors_review(states, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, pr.import_string, enclosing_class, code_changes)
-
-        if not states["assert_review"]:
-            states["stage"] = "failed"
-            break
+    # the specification is executed in the container of the pre-PR clone, which must not be checked out by other PRs meanwhile
+    with cloned_repo_manager.lease([pr.pre_commit]):
+        while states["stage"] not in ["completed", "failed"] and states["llm_queries"] < Config.MAX_LLM_QUERIES and can_query():
+            states = error_repair(states, pr_nb, cache_dir, pr, cloned_repo_manager, prev_fut_code, post_fut_code, fut_name, Config.REPAIR_ATTEMPTS)
 
-    if states["stage"] != "completed":
-        append_event(Event(
-            level="ERROR", pr_nb=pr_nb,
-            message="Analysis did not complete successfully within the allowed number of LLM queries. Exiting."
-        ))
-        states["stage"] = "failed"
-        save_results_to_cache(cache_dir, states)
-        return states
+            if not states["error_repair"]:
+                states["stage"] = "failed"
+                break
 
-    if states["review_conclusion"] == "BUG":
-        error_message = states["execution_status"][-1]["error_message"]
+            states = assertion_errors_review(states, pr_nb, cache_dir, pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, pr.import_string, enclosing_class, code_changes)
 
-        append_event(Event(
-            level="WARNING", pr_nb=pr_nb,
-            message= [
-                "Specification generalization completed. Issues found in the Pull Request.",
-                "Please review the final specification and execution message.",
-                format_info_frame(states["specification"], "FINAL SPECIFICATION"),
-                format_info_frame(error_message, "EXECUTION MESSAGE")
-            ]
-        ))
-    elif states["review_conclusion"] == "NORMAL":
-        append_event(Event(
-            level="INFO", pr_nb=pr_nb,
-            message="Specification generalization completed successfully. No issues found in the Pull Request.",
-            type="AnalysisComplete",
-        ))
-    else:
-        raise ValueError(f"Unknown review conclusion: {states['review_conclusion']}")
+            if not states["assert_review"]:
+                states["stage"] = "failed"
+                break
 
-    save_results_to_cache(cache_dir, states)
-    return states
+    return finalize_states(states, pr_nb, cache_dir, "Specification generalization")
 
-def analyze(project: str, pr_nb: int, force: bool = False) -> None:
+def prepare_analysis(project: str, pr_nb: int, repo = None) -> dict:
+    """
+    Saves the configuration, retrieves the PR and extracts the information shared by both phases.
+    Returns the arguments of `spec_infer` (besides `pr_nb` and `force`), or None if the PR cannot be retrieved.
+    """
     append_event(
         Event(
             level="INFO",
@@ -882,6 +966,8 @@ def analyze(project: str, pr_nb: int, force: bool = False) -> None:
         "ANALYSIS_ATTEMPTS": Config.ANALYSIS_ATTEMPTS,
         "REVIEW_ATTEMPTS": Config.REVIEW_ATTEMPTS,
         "REPAIR_ATTEMPTS": Config.REPAIR_ATTEMPTS,
+        "ANALYSIS_SAMPLES": Config.ANALYSIS_SAMPLES,
+        "REPAIR_CANDIDATES": Config.REPAIR_CANDIDATES,
         "USE_REFERENCE": Config.USE_REFERENCE,
         "LLM_MODEL": Config.LLM_MODEL,
         "USE_REFERENCE_SUMMARY": Config.USE_REFERENCE_SUMMARY,
@@ -900,13 +986,13 @@ def analyze(project: str, pr_nb: int, force: bool = False) -> None:
     )
 
     ## Retrieve and do lightweight analysis of the target PR
-    pr, cloned_repo_manager, github_repo = retrieve_pr(project, pr_nb)
+    pr, cloned_repo_manager, github_repo = retrieve_pr(project, pr_nb, repo)
     if pr is None:
         append_event(Event(
             level="ERROR", pr_nb=pr_nb,
             message=f"Failed to retrieve Pull Request. Exiting."
         ))
-        return
+        return None
 
     pull_request_details, prev_fut_code, post_fut_code, prev_fut_names, post_fut_signatures, enclosing_class, code_changes, has_reference, summary_queries = prepare_information(pr, github_repo, pr_nb)
 
@@ -914,32 +1000,34 @@ def analyze(project: str, pr_nb: int, force: bool = False) -> None:
 
     fut_name = prev_fut_names.split(",")[0].split(".")[-1]
 
-    phase1_ending_stages = spec_infer(
-        pr_nb= pr_nb,
-        force= force,
-        cache_dir= cache_dir,
-        pull_request_details= pull_request_details,
-        prev_fut_code= prev_fut_code,
-        post_fut_code= post_fut_code,
-        prev_fut_names= prev_fut_names,
-        post_fut_signatures= post_fut_signatures,
-        enclosing_class= enclosing_class,
-        pr = pr,
-        cloned_repo_manager = cloned_repo_manager,
-        fut_name= fut_name,
-        code_changes= code_changes,
-        summary_queries = summary_queries
-    )
+    return {
+        "cache_dir": cache_dir,
+        "pull_request_details": pull_request_details,
+        "prev_fut_code": prev_fut_code,
+        "post_fut_code": post_fut_code,
+        "prev_fut_names": prev_fut_names,
+        "post_fut_signatures": post_fut_signatures,
+        "enclosing_class": enclosing_class,
+        "pr": pr,
+        "cloned_repo_manager": cloned_repo_manager,
+        "fut_name": fut_name,
+        "code_changes": code_changes,
+        "summary_queries": summary_queries
+    }
 
+def get_phase2_arguments(project: str, pr_nb: int, phase1_arguments: dict, phase1_ending_stages: dict) -> dict:
+    """
+    Returns the arguments of `spec_generalization` (besides `pr_nb` and `force`), or None if phase 2 does not apply.
+    """
     if not Config.USE_PHASE2:
-        return
+        return None
 
     if phase1_ending_stages["stage"] != "completed":
         append_event(Event(
             level="ERROR", pr_nb=pr_nb,
             message="Specification inference failed. Exiting."
         ))
-        return
+        return None
 
     phase1_specification = phase1_ending_stages["specification"]
     phase1_conclusion = phase1_ending_stages["review_conclusion"]
@@ -955,27 +1043,125 @@ def analyze(project: str, pr_nb: int, force: bool = False) -> None:
                 "execution_message": phase1_ending_stages["execution_status"][-1]["error_message"]
             }
         ))
-        return
-
-    cache_dir_phase2 = os.path.join(Config.CACHE_DIR, "oracles", project, str(pr_nb), "phase2")
-    specification = spec_generalization(
-        pr_nb= pr_nb,
-        force= force,
-        cache_dir= cache_dir_phase2,
-        original_specification= phase1_specification,
-        pull_request_details= pull_request_details,
-        prev_fut_code= prev_fut_code,
-        post_fut_code= post_fut_code,
-        prev_fut_names= prev_fut_names,
-        post_fut_signatures= post_fut_signatures,
-        enclosing_class= enclosing_class,
-        pr = pr,
-        cloned_repo_manager = cloned_repo_manager,
-        fut_name= fut_name,
-        code_changes= code_changes
-    )
+        return None
+
+    phase2_arguments = {key: value for key, value in phase1_arguments.items() if key != "summary_queries"}
+    phase2_arguments["cache_dir"] = os.path.join(Config.CACHE_DIR, "oracles", project, str(pr_nb), "phase2")
+    phase2_arguments["original_specification"] = phase1_specification
+    return phase2_arguments
 
+def analyze(project: str, pr_nb: int, force: bool = False, repo = None) -> None:
+    with llm_budget(f"PR #{pr_nb}", Config.LLM_PR_MAX_TOKENS, Config.LLM_PR_MAX_COST, pr_nb):
+        phase1_arguments = prepare_analysis(project, pr_nb, repo)
+        if phase1_arguments is None:
+            return
 
+        phase1_ending_stages = spec_infer(pr_nb=pr_nb, force=force, **phase1_arguments)
+
+        phase2_arguments = get_phase2_arguments(project, pr_nb, phase1_arguments, phase1_ending_stages)
+        if phase2_arguments is None:
+            return
+
+        spec_generalization(pr_nb=pr_nb, force=force, **phase2_arguments)
+
+
+def is_analysis_finished(project: str, pr_nb: int) -> bool:
+    """
+    Returns whether the cached results of the PR already reached a final stage in all phases.
+    """
+    def final_states(cache_dir):
+        results_path = os.path.join(cache_dir, "results.json")
+        if not os.path.exists(results_path):
+            return None
+        with open(results_path, "r") as f:
+            states = json.load(f)
+        return states if states.get("stage") in ["completed", "failed"] else None
+
+    cache_dir = os.path.join(Config.CACHE_DIR, "oracles", project, str(pr_nb))
+    states = final_states(cache_dir)
+    if states is None:
+        return False
+    if not Config.USE_PHASE2 or states["stage"] == "failed" or states.get("review_conclusion") == "BUG":
+        return True
+    return final_states(os.path.join(cache_dir, "phase2")) is not None
+
+def analyze_many(project: str, pr_nbs: list, workers: int = 1, force: bool = False, max_cost: float = Config.LLM_BATCH_MAX_COST) -> None:
+    """
+    Analyzes many PRs with a pool of workers sharing the clones and containers of the project.
+    PRs whose cached results reached a final stage are skipped unless `force` is set; the others
+    resume from their cached stage. The LLM queries of all PRs are charged to a batch budget of at
+    most `max_cost` USD, after which the remaining PRs stop querying the LLM.
+    """
+    if not force:
+        pending_pr_nbs = [pr_nb for pr_nb in pr_nbs if not is_analysis_finished(project, pr_nb)]
+    else:
+        pending_pr_nbs = list(pr_nbs)
+    append_event(Event(
+        level="INFO",
+        message=f"Analyzing {len(pending_pr_nbs)} PRs of project {project} with {workers} workers ({len(pr_nbs) - len(pending_pr_nbs)} already finished).",
+        type="BatchStart",
+        info={
+            "project": project,
+            "pr_nbs": pending_pr_nbs,
+            "workers": workers
+        }
+    ))
+    repo = get_repo(project)
+    cloned_repo_manager = repo[1]
+    # the workers pick the PRs up in submission order, consecutive PRs share checkouts
+    pending_pr_nbs = plan_batch(*repo, pending_pr_nbs)
+    checkouts_before = cloned_repo_manager.statistics["misses"]
+    start_time = time.time()
+
+    def analyze_one(pr_nb):
+        with pr_log_dir(pr_nb):
+            try:
+                analyze(project, pr_nb, force, repo)
+            except Exception as e:
+                import traceback
+                append_event(Event(
+                    level="ERROR", pr_nb=pr_nb,
+                    message=f"Analysis of PR #{pr_nb} failed: {e}\n ----- Stack Trace -----\n{traceback.format_exc()}"
+                ))
+
+    n_done = 0
+    with llm_budget(f"batch of {project}", Config.LLM_BATCH_MAX_TOKENS, max_cost) as batch_budget, ThreadPoolExecutor(max_workers=workers) as pool:
+        # the workers run in copies of this context, so that their PR budgets are nested in the batch budget
+        futures = {pool.submit(contextvars.copy_context().run, analyze_one, pr_nb): pr_nb for pr_nb in pending_pr_nbs}
+        for future in as_completed(futures):
+            future.result()
+            n_done += 1
+            elapsed_hours = (time.time() - start_time) / 3600
+            append_event(Event(
+                level="INFO", pr_nb=futures[future],
+                message=f"Finished PR #{futures[future]} ({n_done}/{len(pending_pr_nbs)}), throughput {n_done / elapsed_hours:.1f} PRs/hour, LLM cost ${batch_budget.cost:.2f}.",
+                type="BatchProgress",
+                info={
+                    "n_done": n_done,
+                    "n_total": len(pending_pr_nbs),
+                    "elapsed_time": time.time() - start_time,
+                    "prs_per_hour": n_done / elapsed_hours,
+                    "llm_cost": batch_budget.cost,
+                    "llm_tokens": batch_budget.prompt_tokens + batch_budget.completion_tokens
+                }
+            ))
+
+    elapsed_hours = (time.time() - start_time) / 3600
+    append_event(Event(
+        level="INFO",
+        message=f"Analyzed {n_done} PRs in {elapsed_hours * 60:.1f} minutes ({n_done / elapsed_hours if n_done > 0 else 0:.1f} PRs/hour, {cloned_repo_manager.statistics['misses'] - checkouts_before} checkouts).",
+        type="BatchEnd",
+        info={
+            "n_done": n_done,
+            "elapsed_time": time.time() - start_time,
+            "prs_per_hour": n_done / elapsed_hours if n_done > 0 else 0,
+            "checkouts": cloned_repo_manager.statistics["misses"] - checkouts_before,
+            "clone_statistics": dict(cloned_repo_manager.statistics),
+            "llm_usage": batch_budget.summary(),
+            "parse_statistics": parse_statistics(),
+            "github_cache": get_github_http_cache().statistics
+        }
+    ))
 
 def save_results_to_cache(cache_dir, results):
     if not os.path.exists(cache_dir):
@@ -992,7 +1178,22 @@ def save_results_to_cache(cache_dir, results):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Patch Reviewer CLI")
     parser.add_argument("--project", type=str, required=True, help="Project name (e.g., pandas, scikit-learn)")
-    parser.add_argument("--pr_nb", type=int, required=True, help="Pull Request number to review")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--pr_nb", type=int, help="Pull Request number to review")
+    target.add_argument("--pr_file", "--pr-file", type=str, help="File with one Pull Request number per line to review in batch")
+    parser.add_argument("--workers", type=int, default=1, help="Number of Pull Requests analyzed concurrently in batch mode")
     parser.add_argument("--force", action="store_true", help="Force re-analysis even if results are cached")
+    parser.add_argument("--llm_cache", "--llm-cache", type=str, choices=LLM_CACHE_MODES, default=Config.LLM_CACHE_MODE, help="LLM response cache mode (replay-strict fails on a miss)")
+    parser.add_argument("--github_cache", "--github-cache", type=str, choices=GITHUB_CACHE_MODES, default=Config.GITHUB_HTTP_CACHE_MODE, help="GitHub response cache mode (offline fails on a miss)")
+    parser.add_argument("--max_cost", "--max-cost", type=float, default=Config.LLM_BATCH_MAX_COST, help="Maximum estimated LLM cost in USD of a batch")
     args = parser.parse_args()
-    analyze(args.project, args.pr_nb, args.force)
+    init_tracker()
+    set_llm_cache_mode(args.llm_cache)
+    set_github_cache_mode(args.github_cache)
+    init_llm()
+    if args.pr_file is not None:
+        with open(args.pr_file, "r") as f:
+            pr_nbs = [int(line.strip()) for line in f if line.strip()]
+        analyze_many(args.project, pr_nbs, args.workers, args.force, args.max_cost)
+    else:
+        analyze(args.project, args.pr_nb, args.force)
@@ -0,0 +1,106 @@
+"""
+Orders the PRs of a batch so that consecutive PRs reuse the checkouts of the clone pool.
+
+Each PR needs its pre-commit (the first parent of its merge commit) and its post-commit (the
+merge commit) checked out. PRs merged one after the other on the main branch form chains in the
+commit graph: the pre-commit of a PR is the post-commit of the previous one, so processing a chain
+in order needs one checkout per PR instead of two. The planner resolves all the commits up front
+(the merge commits from GitHub, their parents and dates from the local clone), follows the
+chains in merge order, and estimates the checkouts of the planned and original orders with a
+simulation of the LRU pool.
+"""
+from patchguru.utils.GitDiff import commit_times, first_parents, missing_commits
+from patchguru.utils.Tracker import Event, append_event
+
+
+def count_checkouts(commit_pairs, nb_clones, checked_out=()) -> int:
+    """
+    Number of checkouts needed to process the (pre_commit, post_commit) pairs in order with a
+    pool of `nb_clones` clones reused in least recently used order.
+    """
+    pool = list(checked_out)[-nb_clones:]  # last = last used
+    n_checkouts = 0
+    for pair in commit_pairs:
+        for commit in pair:
+            if commit in pool:
+                pool.remove(commit)
+            else:
+                n_checkouts += 1
+                if len(pool) >= nb_clones:
+                    # the other commit of the pair is leased, never evict it
+                    evicted = next((c for c in pool if c not in pair), None)
+                    if evicted is not None:
+                        pool.remove(evicted)
+            pool.append(commit)
+    return n_checkouts
+
+
+def order_by_adjacency(pr_to_commits, commit_to_time) -> list:
+    """
+    Orders the PRs by the date of their merge commit, each PR directly followed by the PR whose
+    pre-commit is its post-commit, if any.
+    """
+    pre_commit_to_prs = {}
+    for pr_nb, (pre_commit, _) in pr_to_commits.items():
+        pre_commit_to_prs.setdefault(pre_commit, []).append(pr_nb)
+
+    ordered_pr_nbs = []
+    visited = set()
+    for pr_nb in sorted(pr_to_commits, key=lambda pr_nb: commit_to_time.get(pr_to_commits[pr_nb][1], 0)):
+        # follow the chain that starts at this PR
+        while pr_nb is not None and pr_nb not in visited:
+            visited.add(pr_nb)
+            ordered_pr_nbs.append(pr_nb)
+            next_pr_nbs = [next_pr_nb for next_pr_nb in pre_commit_to_prs.get(pr_to_commits[pr_nb][1], []) if next_pr_nb not in visited]
+            pr_nb = next_pr_nbs[0] if len(next_pr_nbs) > 0 else None
+    return ordered_pr_nbs
+
+
+def plan_commits(repo_dir, pr_to_post_commit, nb_clones, checked_out=(), pr_nb=-1) -> list:
+    """
+    Orders the PRs given their merge commits. PRs whose merge commit is unknown or missing in the
+    clone come last, in their original order.
+    """
+    post_commits = [commit for commit in pr_to_post_commit.values() if commit]
+    missing = missing_commits(repo_dir, post_commits)
+    commit_to_parent = first_parents(repo_dir, [commit for commit in post_commits if commit not in missing])
+    pr_to_commits = {
+        pr_nb: (commit_to_parent[post_commit], post_commit)
+        for pr_nb, post_commit in pr_to_post_commit.items() if post_commit in commit_to_parent
+    }
+    commit_to_time = commit_times(repo_dir, [post_commit for _, post_commit in pr_to_commits.values()])
+    ordered_pr_nbs = order_by_adjacency(pr_to_commits, commit_to_time)
+    unresolved_pr_nbs = [pr_nb for pr_nb in pr_to_post_commit if pr_nb not in pr_to_commits]
+
+    original_checkouts = count_checkouts([pr_to_commits[pr_nb] for pr_nb in pr_to_post_commit if pr_nb in pr_to_commits], nb_clones, checked_out)
+    planned_checkouts = count_checkouts([pr_to_commits[pr_nb] for pr_nb in ordered_pr_nbs], nb_clones, checked_out)
+    append_event(Event(
+        level="INFO", pr_nb=pr_nb,
+        message=f"Planned {len(pr_to_commits)} PRs: {planned_checkouts} checkouts instead of {original_checkouts} in the original order ({len(unresolved_pr_nbs)} PRs with unresolved commits).",
+        type="BatchPlan",
+        info={
+            "pr_nbs": ordered_pr_nbs + unresolved_pr_nbs,
+            "planned_checkouts": planned_checkouts,
+            "original_checkouts": original_checkouts,
+            "unresolved_pr_nbs": unresolved_pr_nbs
+        }
+    ))
+    return ordered_pr_nbs + unresolved_pr_nbs
+
+
+def plan_batch(github_repo, cloned_repo_manager, pr_nbs) -> list:
+    """
+    Orders the PRs of a batch to minimize the checkouts of the clone pool of `cloned_repo_manager`.
+    """
+    pr_to_post_commit = {}
+    for pr_nb in dict.fromkeys(pr_nbs):
+        try:
+            pr_to_post_commit[pr_nb] = github_repo.get_pull(pr_nb).merge_commit_sha
+        except Exception as e:
+            append_event(Event(
+                level="WARNING", pr_nb=pr_nb,
+                message=f"Failed to resolve the merge commit of PR #{pr_nb} for planning: {e}"
+            ))
+            pr_to_post_commit[pr_nb] = None
+    checked_out = [cloned_repo_manager.clone_id_to_state[clone_id]["commit"] for clone_id in cloned_repo_manager.usage_order]
+    return plan_commits(cloned_repo_manager.git_dir(), pr_to_post_commit, len(cloned_repo_manager.clone_ids), checked_out)
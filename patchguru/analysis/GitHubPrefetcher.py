@@ -0,0 +1,236 @@
+"""
+Bulk prefetch of the GitHub context of PRs through the GraphQL API.
+
+Walking the comments, review comments and commits of a PR and of every issue/PR it references
+through the paginated REST API costs dozens of sequential requests per PR. The prefetcher pulls
+a PR with all of them in one GraphQL request, and all the issues/PRs referenced by it in one
+aliased request per `GITHUB_PREFETCH_BATCH_SIZE` references. Results are stored in an on-disk
+cache, so that re-analyzing a PR does not hit the network at all.
+
+Entries are plain dicts:
+    {"type": "pull_request" | "issue", "number", "title", "author", "body",
+     "comments": [[author, body], ...],
+     "review_comments": [[author, body], ...],  # pull requests only
+     "commit_messages": [message, ...]}         # pull requests only
+A list ends with None when it has more items than were fetched.
+"""
+import json
+import os
+import threading
+import time
+import urllib.request
+from patchguru import Config
+from patchguru.utils.DiskCache import DiskCache
+from patchguru.utils.GitHubHttpCache import get_github_http_cache
+from patchguru.utils.Tracker import Event, append_event
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+_CONNECTION = "{name}(first: {first}) {{ nodes {{ {fields} }} pageInfo {{ hasNextPage }} }}"
+_AUTHOR_FIELDS = "author { __typename login }"
+_COMMENT_FIELDS = _AUTHOR_FIELDS + " body"
+# bumped when the conversion of the entries changes, so that stale cached entries are not reused
+_ENTRY_VERSION = 2
+
+
+def _comments(max_comments):
+    return _CONNECTION.format(name="comments", first=max_comments, fields=_COMMENT_FIELDS)
+
+
+def _pull_request_fragment(max_comments):
+    review_comments = _CONNECTION.format(
+        name="reviewThreads", first=max_comments,
+        fields=_CONNECTION.format(name="comments", first=max_comments, fields="databaseId " + _COMMENT_FIELDS))
+    commits = _CONNECTION.format(name="commits", first=100, fields="commit { message }")
+    return f"fragment PullRequestContext on PullRequest {{ number title body {_AUTHOR_FIELDS} {_comments(max_comments)} {review_comments} {commits} }}\n"
+
+
+def _issue_fragment(max_comments):
+    return f"fragment IssueContext on Issue {{ number title body {_AUTHOR_FIELDS} {_comments(max_comments)} }}\n"
+
+
+def _login(node):
+    # deleted accounts have no author, the REST API reports them as "ghost"
+    if not node.get("author"):
+        return "ghost"
+    # GraphQL reports apps by their slug, the REST API by their bot user (e.g., "dependabot[bot]")
+    if node["author"].get("__typename") == "Bot":
+        return node["author"]["login"] + "[bot]"
+    return node["author"]["login"]
+
+
+def _nodes(connection, convert):
+    items = [convert(node) for node in connection["nodes"] if node is not None]
+    if connection["pageInfo"]["hasNextPage"]:
+        items.append(None)
+    return items
+
+
+def _to_entry(node):
+    entry = {
+        "type": "pull_request" if "commits" in node else "issue",
+        "number": node["number"],
+        "title": node["title"],
+        "author": _login(node),
+        # the REST API reports an empty description as None, keep the rendered context identical
+        "body": node["body"] or None,
+        "comments": _nodes(node["comments"], lambda comment: [_login(comment), comment["body"]]),
+    }
+    if entry["type"] == "pull_request":
+        # the REST API lists review comments by creation, GraphQL groups them by thread
+        review_comments = []
+        has_more = node["reviewThreads"]["pageInfo"]["hasNextPage"]
+        for thread in node["reviewThreads"]["nodes"]:
+            review_comments.extend(thread["comments"]["nodes"])
+            has_more = has_more or thread["comments"]["pageInfo"]["hasNextPage"]
+        review_comments.sort(key=lambda comment: comment["databaseId"])
+        entry["review_comments"] = [[_login(comment), comment["body"]] for comment in review_comments]
+        if has_more:
+            entry["review_comments"].append(None)
+        entry["commit_messages"] = _nodes(node["commits"], lambda commit: commit["commit"]["message"])
+    return entry
+
+
+class GitHubPrefetchError(Exception):
+    """
+    Raised when a GraphQL request fails, callers then fall back to the REST API.
+    """
+
+
+class GitHubPrefetcher:
+    """
+    Prefetches and caches the context of the issues and PRs of one repository.
+    """
+
+    def __init__(self, repo_full_name, token=None, cache=None):
+        self.owner, self.name = repo_full_name.split("/")
+        self.repo_full_name = repo_full_name
+        self.token = token
+        self.cache = cache if cache is not None else DiskCache(os.path.join(Config.CACHE_DIR, "github"), Config.GITHUB_CACHE_MAX_BYTES)
+
+    def _key(self, number):
+        return f"{self.repo_full_name}#{number}:v{_ENTRY_VERSION}"
+
+    def _cached(self, number):
+        """
+        Returns the cached entry of the number ({"type": None} if it does not exist), or None on a miss.
+        """
+        cached = self.cache.get(self._key(number))
+        if cached is None:
+            return None
+        if Config.GITHUB_CACHE_TTL is not None and time.time() - cached["fetched_at"] > Config.GITHUB_CACHE_TTL:
+            return None
+        return cached["entry"]
+
+    def _store(self, number, entry):
+        self.cache.set(self._key(number), {"fetched_at": time.time(), "entry": entry})
+
+    def _query(self, query, variables):
+        if get_github_http_cache().mode == "offline":
+            raise GitHubPrefetchError("GraphQL requests are disabled in offline mode.")
+        if self.token is None:
+            try:
+                with open(".github_token", "r") as f:
+                    self.token = f.read().strip()
+            except OSError as e:
+                raise GitHubPrefetchError(f"No GitHub token: {e}") from e
+        request = urllib.request.Request(
+            GRAPHQL_URL,
+            data=json.dumps({"query": query, "variables": variables}).encode("utf-8"),
+            headers={"Authorization": f"bearer {self.token}", "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=Config.GITHUB_REQUEST_TIMEOUT) as response:
+                result = json.loads(response.read().decode("utf-8"))
+        except (OSError, ValueError) as e:
+            raise GitHubPrefetchError(f"GraphQL request failed: {e}") from e
+        # unknown numbers are reported as NOT_FOUND errors next to the data of the others
+        errors = [error for error in result.get("errors", []) if error.get("type") != "NOT_FOUND"]
+        if errors or result.get("data") is None:
+            raise GitHubPrefetchError(f"GraphQL request failed: {errors or result}")
+        return result["data"]["repository"]
+
+    def get_pull_request(self, number, pr_nb=-1) -> dict:
+        """
+        Returns the context of the PR, fetched in one request on a cache miss.
+        """
+        entry = self._cached(number)
+        if entry is not None:
+            return entry
+        start_time = time.time()
+        query = _pull_request_fragment(Config.GITHUB_PREFETCH_MAX_COMMENTS) + (
+            "query($owner: String!, $name: String!, $number: Int!) {\n"
+            "  repository(owner: $owner, name: $name) { pullRequest(number: $number) { ...PullRequestContext } }\n"
+            "}"
+        )
+        repository = self._query(query, {"owner": self.owner, "name": self.name, "number": number})
+        if repository["pullRequest"] is None:
+            raise GitHubPrefetchError(f"Pull request #{number} not found in {self.repo_full_name}.")
+        entry = _to_entry(repository["pullRequest"])
+        self._store(number, entry)
+        append_event(Event(
+            level="DEBUG", pr_nb=pr_nb,
+            message=f"Prefetched the context of PR #{number} in {time.time() - start_time:.2f}s.",
+            type="GitHubPrefetch",
+            info={"numbers": [number], "requests": 1, "duration": time.time() - start_time}
+        ))
+        return entry
+
+    def get_references(self, numbers, pr_nb=-1) -> dict:
+        """
+        Returns the contexts of the referenced issues/PRs that exist, by number. Cache misses are
+        fetched together, `GITHUB_PREFETCH_BATCH_SIZE` per request.
+        """
+        number_to_entry = {}
+        missing = []
+        for number in numbers:
+            entry = self._cached(number)
+            if entry is None:
+                missing.append(number)
+            else:
+                number_to_entry[number] = entry
+
+        start_time = time.time()
+        batch_size = Config.GITHUB_PREFETCH_BATCH_SIZE
+        fragments = _pull_request_fragment(Config.GITHUB_REFERENCE_MAX_COMMENTS) + _issue_fragment(Config.GITHUB_REFERENCE_MAX_COMMENTS)
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i:i + batch_size]
+            aliases = "\n".join(
+                f"    ref{number}: issueOrPullRequest(number: {number}) {{ __typename ...PullRequestContext ...IssueContext }}"
+                for number in batch)
+            query = fragments + (
+                "query($owner: String!, $name: String!) {\n"
+                f"  repository(owner: $owner, name: $name) {{\n{aliases}\n  }}\n"
+                "}"
+            )
+            repository = self._query(query, {"owner": self.owner, "name": self.name})
+            for number in batch:
+                node = repository.get(f"ref{number}")
+                # discussions and unknown numbers are recorded as missing, not re-fetched
+                entry = _to_entry(node) if node is not None and node["__typename"] in ("PullRequest", "Issue") else {"type": None}
+                self._store(number, entry)
+                number_to_entry[number] = entry
+
+        if len(missing) > 0:
+            append_event(Event(
+                level="DEBUG", pr_nb=pr_nb,
+                message=f"Prefetched the context of {len(missing)} referenced issues/PRs in {time.time() - start_time:.2f}s ({len(numbers) - len(missing)} cached).",
+                type="GitHubPrefetch",
+                info={
+                    "numbers": missing,
+                    "cached": len(numbers) - len(missing),
+                    "requests": (len(missing) + batch_size - 1) // batch_size,
+                    "duration": time.time() - start_time
+                }
+            ))
+        return {number: entry for number, entry in number_to_entry.items() if entry["type"] is not None}
+
+
+_PREFETCHERS = {}
+_PREFETCHERS_LOCK = threading.Lock()
+
+
+def get_prefetcher(repo_full_name) -> GitHubPrefetcher:
+    with _PREFETCHERS_LOCK:
+        if repo_full_name not in _PREFETCHERS:
+            _PREFETCHERS[repo_full_name] = GitHubPrefetcher(repo_full_name)
+        return _PREFETCHERS[repo_full_name]
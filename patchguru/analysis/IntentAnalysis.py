@@ -2,7 +2,7 @@ from __future__ import annotations
 import json
 from typing import Any
 from patchguru import Config
-from patchguru.llms.OpenAI import query_llm
+from patchguru.llms.OpenAI import query_valid_answer
 from patchguru.utils.Logger import format_info_frame
 from patchguru.utils.Tracker import Event, append_event
 
@@ -57,31 +57,10 @@ def analyze_intent(
     assert "," not in prev_fut_names, "Currently only support analyzing one function at a time."
     function_name = prev_fut_names.split(".")[-1]
 
-    is_valid = False
-    llm_queries = 0
-    max_retries = Config.ANALYSIS_ATTEMPTS
-    while not is_valid and llm_queries < max_retries:
-        append_event(Event(
-            level="DEBUG",
-            message=f"Querying LLM for intent analysis (Attempt {llm_queries + 1}/{max_retries})..."
-        ))
-        response = query_llm(prompt)
-
-        parsed_response = PromptTemplate.parse_answer(response)
-        if parsed_response is None:
-            append_event(Event(
-                level="ERROR",
-                message=f"Failed to parse LLM response for intent analysis"
-            ))
-            return None
-        is_valid = PromptTemplate.check_valid(parsed_response, function_name)
-        llm_queries += 1
-
-    if not is_valid:
-        append_event(Event(
-            level="ERROR",
-            message=f"Failed to get a valid response from LLM after {max_retries} attempts"
-        ))
+    parsed_response, llm_queries = query_valid_answer(
+        prompt, PromptTemplate, function_name, Config.ANALYSIS_ATTEMPTS, "intent_analysis", "intent analysis",
+        samples=Config.ANALYSIS_SAMPLES)
+    if parsed_response is None:
         return None
 
     inserted_spec = PromptTemplate.insert_code(
@@ -1,58 +1,80 @@
 from patchguru.utils.ClonedRepoManager import ClonedRepoManager
 from patchguru.utils.PullRequest import PullRequest
 # from change_reviewer.utils.Logger import get_logger
-from github import Github, Auth
+from patchguru.utils.GitHubHttpCache import get_github, get_github_http_cache
 from patchguru.utils.Tracker import append_event, Event
+from patchguru import Config
+import threading
 
 # logger = get_logger(__name__)
 
+# project name -> (github_repo, cloned_repo_manager), shared by all retrievals of the process
+_REPOS = {}
+_REPO_LOCKS = {}
+_REPOS_LOCK = threading.Lock()
+
 def get_repo(project_name):
+    """
+    Returns the (github_repo, cloned_repo_manager) pair of the project, created once per process.
+    The clone slots are locked by their manager, so a second manager of the project would wait for them.
+    """
+    with _REPOS_LOCK:
+        project_lock = _REPO_LOCKS.setdefault(project_name, threading.Lock())
+    with project_lock:
+        if project_name not in _REPOS:
+            _REPOS[project_name] = _create_repo(project_name)
+        return _REPOS[project_name]
+
+def _create_repo(project_name):
+    # offline runs never fetch the clones
+    fetch_ttl = None if get_github_http_cache().mode == "offline" else Config.CLONE_FETCH_TTL
     if project_name == "pandas":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "pandas", "pandas-dev/pandas", "pandas-dev", "pandas")
+            "../clones", "pandas", "pandas-dev/pandas", "pandas-dev", "pandas", fetch_ttl=fetch_ttl)
     elif project_name == "scikit-learn":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "scikit-learn", "scikit-learn/scikit-learn", "scikit-learn-dev", "sklearn")
+            "../clones", "scikit-learn", "scikit-learn/scikit-learn", "scikit-learn-dev", "sklearn", fetch_ttl=fetch_ttl)
     elif project_name == "scipy":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "scipy", "scipy/scipy", "scipy-dev", "scipy")
+            "../clones", "scipy", "scipy/scipy", "scipy-dev", "scipy", fetch_ttl=fetch_ttl)
     elif project_name == "numpy":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "numpy", "numpy/numpy", "numpy-dev", "numpy")
+            "../clones", "numpy", "numpy/numpy", "numpy-dev", "numpy", fetch_ttl=fetch_ttl)
     elif project_name == "transformers":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "transformers", "huggingface/transformers", "transformers-dev", "transformers")
+            "../clones", "transformers", "huggingface/transformers", "transformers-dev", "transformers", fetch_ttl=fetch_ttl)
     elif project_name == "keras":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "keras", "keras-team/keras", "keras-dev", "keras")
+            "../clones", "keras", "keras-team/keras", "keras-dev", "keras", fetch_ttl=fetch_ttl)
     elif project_name == "marshmallow":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "marshmallow", "marshmallow-code/marshmallow", "marshmallow-dev", "marshmallow")
+            "../clones", "marshmallow", "marshmallow-code/marshmallow", "marshmallow-dev", "marshmallow", fetch_ttl=fetch_ttl)
     elif project_name == "pytorch_geometric":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "pytorch_geometric", "pyg-team/pytorch_geometric", "pytorch_geometric-dev", "torch_geometric")
+            "../clones", "pytorch_geometric", "pyg-team/pytorch_geometric", "pytorch_geometric-dev", "torch_geometric", fetch_ttl=fetch_ttl)
     elif project_name == "scapy":
         cloned_repo_manager = ClonedRepoManager(
-            "../clones", "scapy", "secdev/scapy", "scapy-dev", "scapy")
+            "../clones", "scapy", "secdev/scapy", "scapy-dev", "scapy", fetch_ttl=fetch_ttl)
     else:
         raise ValueError(f"Project {project_name} is not supported.")
 
-    cloned_repo = cloned_repo_manager.get_cloned_repo("main")
-    cloned_repo.repo.git.pull()
-    token = open(".github_token", "r").read().strip()
-    github = Github(auth=Auth.Token(token))
-    github_repo = github.get_repo(cloned_repo_manager.repo_id)
+    # the manager has fetched origin (at most once per CLONE_FETCH_TTL), which brings the commits of recently merged PRs
+    github_repo = get_github().get_repo(cloned_repo_manager.repo_id)
 
     return github_repo, cloned_repo_manager
 
-def retrieve_pr(project, pr_nb):
+def retrieve_pr(project, pr_nb, repo=None):
+    """
+    Retrieves the PR. `repo` optionally is a (github_repo, cloned_repo_manager) pair returned by
+    `get_repo`, to share the clones across the PRs of a batch.
+    """
     #logger.info(f"Retrieving information of Pull Request #{pr_nb} for project {project}...")
     append_event(Event(
         level="INFO", pr_nb=pr_nb,
         message=f"Retrieving information of Pull Request #{pr_nb} for project {project}..."
     ))
     try:
-        github_repo, cloned_repo_manager = get_repo(project)
+        github_repo, cloned_repo_manager = repo if repo is not None else get_repo(project)
         github_pr = github_repo.get_pull(pr_nb)
         append_event(Event(
             level="DEBUG", pr_nb=pr_nb,
@@ -101,7 +101,7 @@ def repair_runtime_error(code, error_message, prev_fut_code, post_fut_code):
             "prompt": query
         }
     ))
-    answer = query_llm(query, model=Config.LLM_MODEL)
+    answer = query_llm(query, model=Config.LLM_MODEL, stage="error_repair", response_format=prompt_template.response_format())
     parsed_answer = prompt_template.parse_answer(answer)
     if parsed_answer is None:
         append_event(Event(
@@ -155,7 +155,7 @@ def repair_syntax_error(code, error_message, prev_fut_code, post_fut_code):
     prompt_template = load_syntax_error_repair_prompt_template()
     query = prompt_template.create_prompt(code, error_message)
 
-    answer = query_llm(query, model=Config.LLM_MODEL)
+    answer = query_llm(query, model=Config.LLM_MODEL, stage="error_repair", response_format=prompt_template.response_format())
     parsed_answer = prompt_template.parse_answer(answer)
     if parsed_answer is None:
         return None
@@ -179,7 +179,7 @@ def repair_assertion_error(code, error_message, prev_fut_code, post_fut_code):
     prompt_template = load_assertion_error_repair_prompt_template()
     query = prompt_template.create_prompt(code, error_message)
 
-    answer = query_llm(query, model=Config.LLM_MODEL)
+    answer = query_llm(query, model=Config.LLM_MODEL, stage="error_repair", response_format=prompt_template.response_format())
     parsed_answer = prompt_template.parse_answer(answer)
     if parsed_answer is None:
         return None
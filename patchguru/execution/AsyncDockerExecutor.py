@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import functools
+from typing import List, Optional, Tuple
+from patchguru.execution.DockerExecutor import DockerExecutor
+from patchguru.utils.EventLoopBridge import bridge_to
+
+
+class AsyncDockerExecutor:
+    """
+    Awaitable wrapper around `DockerExecutor`.
+
+    The blocking docker calls run in a thread pool (the loop's default executor unless `pool`
+    is given), so the event loop keeps serving other PRs meanwhile. With `limits`, executions
+    wait for the pipeline's global and per-container execution limits.
+    """
+
+    def __init__(self, container_name, module_name=None, repo_dir=None, limits=None, pool=None, commit=None):
+        self.container_name = container_name
+        self.module_name = module_name
+        self.repo_dir = repo_dir
+        self.commit = commit
+        self.limits = limits
+        self.pool = pool
+        self._executor = None
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # keep the caller's context (e.g., the PR's log directory) in the worker thread
+        context = contextvars.copy_context()
+
+        def call():
+            if self.limits is None:
+                return fn(*args, **kwargs)
+            with bridge_to(loop, self.limits):
+                return fn(*args, **kwargs)
+
+        return await loop.run_in_executor(self.pool, functools.partial(context.run, call))
+
+    async def _get_executor(self) -> DockerExecutor:
+        if self._executor is None:
+            self._executor = await self._run(
+                DockerExecutor, self.container_name, self.module_name, self.repo_dir, commit=self.commit)
+        return self._executor
+
+    async def warm_up(self) -> bool:
+        executor = await self._get_executor()
+        return await self._run(executor.warm_up)
+
+    async def execute_python_code(self, code: str, python_executable: str = "python3", timeout: Optional[int] = 900) -> Tuple[int, str]:
+        executor = await self._get_executor()
+        return await self._run(executor.execute_python_code, code, python_executable, timeout)
+
+    async def execute_many(self, codes: List[str], timeout_each: Optional[int] = 300, **kwargs) -> List[dict]:
+        executor = await self._get_executor()
+        return await self._run(executor.execute_many, codes, timeout_each, **kwargs)
+
+    async def execute_shell_command(self, command: str, timeout: int = 3600) -> Tuple[int, str]:
+        executor = await self._get_executor()
+        return await self._run(executor.execute_shell_command, command, timeout)
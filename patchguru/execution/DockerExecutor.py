@@ -1,58 +1,89 @@
 import docker
-import tempfile
+import io
+import json
 import tarfile
 import os
-from os import chdir, getcwd
-from typing import Optional, Tuple
+import threading
+import uuid
+from typing import Dict, List, Optional, Tuple
 import argparse
 import time
+from patchguru import Config
 from patchguru.utils.PullRequest import PullRequest
 from patchguru.analysis.PRRetriever import get_repo
 from patchguru.utils.Tracker import append_event, Event
+from patchguru.utils.EventLoopBridge import limited
+
+WORK_DIR = "/tmp/PatchGuru"
+RUN_DIR = f"{WORK_DIR}/run"
+WORKER_DIR = f"{WORK_DIR}/worker"
+WORKER_SOCKET = f"{WORKER_DIR}/worker.sock"
+WORKER_SCRIPT = f"{WORKER_DIR}/WarmWorker.py"
+INSTALL_STAMP = f"{WORK_DIR}/install_stamp"
+
+# projects that are installed in editable mode inside their containers
+INSTALL_COMMANDS = {
+    "keras": "pip install -e .",
+    "marshmallow": "pip install -e \".[dev]\"",
+}
+INSTALL_METADATA_FILES = ["pyproject.toml", "setup.py", "setup.cfg", "requirements.txt"]
+
+# one lock per container so that concurrent executors do not start duplicate workers
+_WORKER_LOCKS = {}
+_WORKER_LOCKS_GUARD = threading.Lock()
+
 
 class DockerExecutor:
-    def __init__(self, container_name):
+    def __init__(self, container_name, module_name=None, repo_dir=None, use_warm_worker=None, commit=None):
+        """
+        `module_name` is the top-level module the warm worker pre-imports, `repo_dir` the path of
+        the clone in the container and `commit` the commit the clone is checked out at (see `ClonedRepo`);
+        without a module name, executions are cold. The commit is known on the host, whereas the
+        `.git` file of a clone may point outside of the container's mount.
+        """
         client = docker.from_env()
         self.container = client.containers.get(container_name)
         self.container.start()
+        # containers are named after the clone's repository, `{repo_name}-dev{i}`
+        self.project_name = container_name.split("-dev")[0]
+        self.module_name = module_name
+        self.repo_dir = repo_dir if repo_dir is not None else f"/home/{self.project_name}"
+        self.commit = commit
+        self._head_argument = f" --head {commit}" if commit is not None else ""
+        if use_warm_worker is None:
+            use_warm_worker = Config.USE_WARM_WORKER
+        self.use_warm_worker = use_warm_worker and module_name is not None
+        self._warm_worker_ready = False
+        self.install_time = 0
+        with _WORKER_LOCKS_GUARD:
+            self._worker_lock = _WORKER_LOCKS.setdefault(container_name, threading.Lock())
+
+    def copy_files_to_container(self, files: Dict[str, str]) -> None:
+        """
+        Uploads files, given as a mapping from absolute paths in the container to their contents,
+        in a single archive that is built in memory. Missing parent directories are created.
+        """
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar:
+            for target_file_path, content in files.items():
+                data = content.encode("utf-8")
+                tar_info = tarfile.TarInfo(name=target_file_path.lstrip("/"))
+                tar_info.size = len(data)
+                tar_info.mode = 0o644
+                tar_info.mtime = int(time.time())
+                tar.addfile(tar_info, io.BytesIO(data))
+        self.container.put_archive("/", buffer.getvalue())
 
     def copy_code_to_container(self, code, target_file_path):
-        target_dir = target_file_path.rsplit("/", 1)[0]
-        target_file_name = target_file_path.rsplit("/", 1)[1]
-
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            code_file = os.path.join(tmp_dir, target_file_name)
-            with open(code_file, "w") as f:
-                f.write(code)
-            tar_file = os.path.join(tmp_dir, "archive.tar")
-            with tarfile.open(tar_file, mode="w") as tar:
-                wd = getcwd()
-                try:
-                    chdir(tmp_dir)
-                    tar.add(target_file_name)
-                finally:
-                    chdir(wd)
-
-            data = open(tar_file, "rb").read()
-            self.container.put_archive(target_dir, data)
+        self.copy_files_to_container({target_file_path: code})
 
     def filter_logs(self, logs: str, container_name: str) -> str:
         import re
 
-    def execute_python_code(self, code: str, python_executable: str = "python3", timeout: Optional[int] = 900) -> Tuple[bool, str, str]:
-        append_event(Event(
-            level="INFO",
-            message=f"Executing code in container {self.container.name} with timeout {timeout} seconds.",
-            type="ExecutionStart"
-        ))
-        exec_result = self.container.exec_run("rm -rf /tmp/PatchGuru")
-
-        exec_result = self.container.exec_run("mkdir /tmp/PatchGuru")
-        self.copy_code_to_container(code, "/tmp/PatchGuru/PatchGuru_test_code.py")
-        command = (
-            f"timeout {timeout}s {python_executable} /tmp/PatchGuru/PatchGuru_test_code.py"
-        )
-
+    def _wrap_command(self, command: str) -> str:
+        """
+        Runs the command in the environment of the target project.
+        """
         if self.container.name.startswith("scipy-dev"):
             command = (
                 f"bash -c 'source /root/conda/etc/profile.d/conda.sh"
@@ -63,20 +94,173 @@ class DockerExecutor:
         elif self.container.name.startswith("keras"):
             command = (
                 f"bash -c 'cd /home/keras/"
-                f" && pip install -e ."
                 f" && {command}'"
             )
 
         elif self.container.name.startswith("marshmallow"):
             command = (
                 f"bash -c 'cd /home/marshmallow/"
-                f" && pip install -e '.[dev]'"
                 f" && {command}'"
             )
+        return command
 
-        exec_result = self.container.exec_run(command)
-        output = exec_result.output.decode("utf-8")
-        exit_code = exec_result.exit_code
+    def ensure_installed(self) -> float:
+        """
+        Re-installs the target project in editable mode only if the checked-out commit or the
+        dependency metadata changed since the last installation recorded in the container's stamp file.
+        Returns the time spent on installation (0 if it was up to date).
+        """
+        if self.project_name not in INSTALL_COMMANDS:
+            return 0
+        # hash of the checked-out commit and the packaging metadata, followed by the recorded stamp
+        read_commit = f"echo {self.commit}" if self.commit is not None else "git rev-parse HEAD 2>/dev/null || cat .git/HEAD"
+        probe = (
+            f"sh -c 'cd {self.repo_dir}"
+            f" && {{ {read_commit}; cat {' '.join(INSTALL_METADATA_FILES)} 2>/dev/null; }} | sha256sum | cut -d \" \" -f 1"
+            f" && cat {INSTALL_STAMP} 2>/dev/null'"
+        )
+        lines = self.container.exec_run(probe).output.decode("utf-8").split()
+        install_key = lines[0] if len(lines) > 0 else None
+        if install_key is not None and len(lines) > 1 and lines[1] == install_key:
+            return 0
+
+        start_time = time.time()
+        exec_result = self.container.exec_run(self._wrap_command(INSTALL_COMMANDS[self.project_name]))
+        install_time = time.time() - start_time
+        if exec_result.exit_code == 0 and install_key is not None:
+            self.container.exec_run(f"sh -c 'mkdir -p {WORK_DIR} && echo {install_key} > {INSTALL_STAMP}'")
+        append_event(Event(
+            level="INFO" if exec_result.exit_code == 0 else "WARNING",
+            message=f"Installed {self.project_name} in container {self.container.name} in {install_time:.2f} seconds (exit code {exec_result.exit_code}).",
+            type="InstallPhase",
+            info={
+                "container_name": self.container.name,
+                "install_key": install_key,
+                "exit_code": exec_result.exit_code,
+                "install_time": install_time
+            }
+        ))
+        return install_time
+
+    def _request_warm_worker(self, arguments: str) -> dict:
+        exec_result = self.container.exec_run(f"python3 {WORKER_SCRIPT} {arguments}")
+        try:
+            return json.loads(exec_result.output.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return {"error": exec_result.output.decode("utf-8", errors="replace")}
+
+    def _start_warm_worker(self) -> bool:
+        with self._worker_lock:
+            if "ok" in self._request_warm_worker(f"ping --socket {WORKER_SOCKET}{self._head_argument}"):
+                self._warm_worker_ready = True
+                return True
+
+            self.install_time += self.ensure_installed()
+            start_time = time.time()
+            with open(os.path.join(os.path.dirname(__file__), "WarmWorker.py"), "r") as f:
+                self.copy_code_to_container(f.read(), WORKER_SCRIPT)
+            command = (
+                f"python3 {WORKER_SCRIPT} serve --socket {WORKER_SOCKET}"
+                f" --module {self.module_name} --repo_dir {self.repo_dir}{self._head_argument}"
+            )
+            self.container.exec_run(self._wrap_command(command), detach=True)
+
+            while time.time() - start_time < Config.WARM_WORKER_STARTUP_TIMEOUT:
+                response = self._request_warm_worker(f"ping --socket {WORKER_SOCKET}{self._head_argument}")
+                if response.get("stale"):
+                    # the worker cannot tell which commit it imported, it never serves
+                    break
+                if "ok" in response:
+                    append_event(Event(
+                        level="INFO",
+                        message=f"Started warm worker in container {self.container.name} in {time.time() - start_time:.2f} seconds.",
+                        type="WarmWorkerStart",
+                        info={
+                            "container_name": self.container.name,
+                            "startup_time": time.time() - start_time
+                        }
+                    ))
+                    self._warm_worker_ready = True
+                    return True
+                time.sleep(0.5)
+
+            append_event(Event(
+                level="WARNING",
+                message=f"Warm worker in container {self.container.name} did not start within {Config.WARM_WORKER_STARTUP_TIMEOUT} seconds or cannot read the commit of {self.repo_dir}. Falling back to cold executions."
+            ))
+            self.use_warm_worker = False
+            return False
+
+    def warm_up(self) -> bool:
+        """
+        Starts the warm worker of the container ahead of the first execution. Returns whether it is ready.
+        """
+        return self.use_warm_worker and (self._warm_worker_ready or self._start_warm_worker())
+
+    def _execute_with_warm_worker(self, code_path: str, timeout: Optional[int]) -> Optional[Tuple[int, str]]:
+        """
+        Runs the code in a child forked from the pre-warmed worker. Returns None if the worker is unavailable.
+        """
+        arguments = f"run --socket {WORKER_SOCKET}{self._head_argument} {code_path}"
+        if timeout is not None:
+            arguments = f"run --socket {WORKER_SOCKET}{self._head_argument} --timeout {timeout} {code_path}"
+
+        for _ in range(2):
+            if not self._warm_worker_ready and not self._start_warm_worker():
+                return None
+            response = self._request_warm_worker(arguments)
+            if "exit_code" in response:
+                return response["exit_code"], response["output"]
+            if response.get("stale"):
+                append_event(Event(
+                    level="DEBUG",
+                    message=f"Warm worker in container {self.container.name} is outdated after a checkout. Restarting it."
+                ))
+            self._warm_worker_ready = False
+        append_event(Event(
+            level="WARNING",
+            message=f"Warm worker in container {self.container.name} failed twice in a row. Falling back to cold executions."
+        ))
+        self.use_warm_worker = False
+        return None
+
+    def _execution_slot(self):
+        """
+        Within the asyncio pipeline (see AsyncSpecInfer), waits for its global and per-container execution limits.
+        """
+        return limited(lambda limits: limits.executions, lambda limits: limits.container(self.container.name))
+
+    def execute_python_code(self, code: str, python_executable: str = "python3", timeout: Optional[int] = 900) -> Tuple[bool, str, str]:
+        append_event(Event(
+            level="INFO",
+            message=f"Executing code in container {self.container.name} with timeout {timeout} seconds.",
+            type="ExecutionStart"
+        ))
+        start_time = time.time()
+        self.install_time = 0
+        # a fresh directory per execution, so that concurrent executions do not overwrite each other
+        run_dir = f"{RUN_DIR}/{uuid.uuid4().hex}"
+        code_path = f"{run_dir}/PatchGuru_test_code.py"
+        self.copy_code_to_container(code, code_path)
+
+        with self._execution_slot():
+            result = None
+            if self.use_warm_worker:
+                result = self._execute_with_warm_worker(code_path, timeout)
+
+            if result is not None:
+                mode = "warm"
+                exit_code, output = result
+            else:
+                mode = "cold"
+                self.install_time += self.ensure_installed()
+                command = self._wrap_command(
+                    f"timeout {timeout}s {python_executable} {code_path}"
+                )
+                exec_result = self.container.exec_run(command)
+                output = exec_result.output.decode("utf-8")
+                exit_code = exec_result.exit_code
+        self.container.exec_run(f"rm -rf {run_dir}", detach=True)
         append_event(Event(
             level="INFO",
             message=[
@@ -87,11 +271,76 @@ class DockerExecutor:
             type="ExecutionEnd",
             info={
                 "exit_code": exit_code,
-                "output": output
+                "output": output,
+                "mode": mode,
+                "install_time": self.install_time,
+                "duration": time.time() - start_time
             }
         ))
         return exit_code, output
 
+    def execute_many(self, codes: List[str], timeout_each: Optional[int] = 300, parallelism: int = Config.BATCH_PARALLELISM) -> List[dict]:
+        """
+        Runs many scripts in a single round-trip: all scripts are uploaded in one archive and run inside
+        the container with at most `parallelism` of them at a time, each with its own timeout.
+        Returns one {"exit_code", "output", "duration"} dict per script, in the order of `codes`.
+        """
+        if len(codes) == 0:
+            return []
+        append_event(Event(
+            level="INFO",
+            message=f"Executing {len(codes)} scripts in container {self.container.name} with parallelism {parallelism} and timeout {timeout_each} seconds each.",
+            type="BatchExecutionStart"
+        ))
+        start_time = time.time()
+        self.install_time = 0
+        run_dir = f"{RUN_DIR}/{uuid.uuid4().hex}"
+        code_paths = [f"{run_dir}/PatchGuru_test_code_{idx}.py" for idx in range(len(codes))]
+        batch_script = f"{run_dir}/WarmWorker.py"
+        with open(os.path.join(os.path.dirname(__file__), "WarmWorker.py"), "r") as f:
+            files = {batch_script: f.read()}
+        files.update(zip(code_paths, codes))
+        self.copy_files_to_container(files)
+
+        arguments = f"batch --jobs {parallelism}"
+        if timeout_each is not None:
+            arguments += f" --timeout {timeout_each}"
+        with self._execution_slot():
+            if self.warm_up():
+                arguments += f" --socket {WORKER_SOCKET}{self._head_argument}"
+            else:
+                self.install_time += self.ensure_installed()
+            exec_result = self.container.exec_run(
+                self._wrap_command(f"python3 {batch_script} {arguments} {' '.join(code_paths)}"))
+        self.container.exec_run(f"rm -rf {run_dir}", detach=True)
+        try:
+            results = json.loads(exec_result.output.decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # the batch runner itself failed: no script is known to have passed, whatever the batch exit code
+            output = exec_result.output.decode("utf-8", errors="replace")
+            exit_code = exec_result.exit_code if exec_result.exit_code else 1
+            results = [{"exit_code": exit_code, "output": output, "duration": 0, "mode": "cold"} for _ in codes]
+        if any(result["mode"] == "cold" for result in results):
+            # the worker was unavailable or went stale, start a new one on the next execution
+            self._warm_worker_ready = False
+
+        append_event(Event(
+            level="INFO",
+            message=f"Batch execution of {len(codes)} scripts completed in container {self.container.name} in {time.time() - start_time:.2f} seconds.",
+            type="BatchExecutionEnd",
+            info={
+                "n_scripts": len(codes),
+                "exit_codes": [result["exit_code"] for result in results],
+                "modes": [result["mode"] for result in results],
+                "install_time": self.install_time,
+                "duration": time.time() - start_time
+            }
+        ))
+        return [
+            {"exit_code": result["exit_code"], "output": result["output"], "duration": result["duration"]}
+            for result in results
+        ]
+
     def execute_shell_command(self, command: str, timeout: int = 3600) -> Tuple[bool, str, str]:
         append_event(Event(
             level="INFO",
@@ -147,8 +396,8 @@ if __name__ == "__main__":
     pr = PullRequest(github_pr, github_repo, cloned_repo_manager)
     commit = pr.post_commit
     cloned_repo = cloned_repo_manager.get_cloned_repo(commit)
-    container_name = cloned_repo.container_name
-    docker_executor = DockerExecutor(container_name)
+    docker_executor = DockerExecutor(
+        cloned_repo.container_name, cloned_repo.module_name, cloned_repo.container_repo_dir, commit=cloned_repo.commit)
     file_path = args.file_path
     while True:
         start_time = time.time()
@@ -0,0 +1,315 @@
+"""
+Warm interpreter worker that runs inside the target containers.
+
+This file is copied into a container by `DockerExecutor` and must only depend on the
+standard library. In `serve` mode it pre-imports the project's top-level module once,
+listens on a Unix socket and forks a pre-warmed child for every script to execute, so
+that each execution skips the interpreter startup and the (expensive) project import.
+The `run` and `ping` modes are tiny clients that talk to the worker over the socket and
+print its JSON response. The `batch` mode runs many scripts with a bounded pool, through the
+worker if one is reachable and in fresh interpreters otherwise, and prints a JSON list of results.
+
+Protocol: the client sends one JSON line, e.g. {"op": "run", "path": ..., "timeout": ..., "head": ...},
+and the worker answers with one JSON object, e.g. {"exit_code": 0, "output": "..."}. The host passes
+the commit the clone is checked out at (`--head`), since the git directory of a clone may live
+outside of the container's mount; only without it does the worker read the commit itself.
+"""
+import argparse
+import importlib
+import json
+import os
+import runpy
+import signal
+import socket
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+TIMEOUT_EXIT_CODE = 124  # same exit code as coreutils' `timeout`
+
+
+def read_head(repo_dir):
+    """
+    Returns the commit the repository is checked out at, or None if it cannot be determined, e.g.,
+    if its `.git` file points to an absolute path of the host that is not mounted in the container.
+    """
+    git_dir = os.path.join(repo_dir, ".git")
+    if os.path.isfile(git_dir):
+        # worktrees and submodules have a "gitdir: <path>" file instead of a directory
+        try:
+            with open(git_dir) as f:
+                content = f.read().strip()
+        except OSError:
+            return None
+        if not content.startswith("gitdir: "):
+            return None
+        git_dir = os.path.join(repo_dir, content[len("gitdir: "):])
+    try:
+        with open(os.path.join(git_dir, "HEAD")) as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    if not head.startswith("ref: "):
+        return head
+    ref = head[len("ref: "):]
+    # the refs of a worktree are stored in the common directory of its repository
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, "commondir")) as f:
+            common_dir = os.path.join(git_dir, f.read().strip())
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(common_dir, ref)) as f:
+            return f.read().strip()
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(common_dir, "packed-refs")) as f:
+            for line in f:
+                if line.strip().endswith(" " + ref):
+                    return line.split(" ")[0]
+    except OSError:
+        pass
+    return head
+
+
+def recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def recv_line(conn):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def run_script(path):
+    """
+    Executes the script in the current (forked) process like `python3 path` would and exits.
+    """
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(path)
+    exit_code = 0
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # hide the frames of the worker itself, as in a plain interpreter run
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb)
+        exit_code = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(exit_code)
+
+
+def handle_run(request):
+    path = request["path"]
+    timeout = request.get("timeout")
+    output_path = path + ".out"
+
+    start_time = time.time()
+    pid = os.fork()
+    if pid == 0:
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+        run_script(path)
+
+    deadline = None if timeout is None else start_time + timeout
+    delay = 0.001
+    while True:
+        waited_pid, status = os.waitpid(pid, os.WNOHANG)
+        if waited_pid != 0:
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code < 0:
+                exit_code = 128 - exit_code
+            break
+        if deadline is not None and time.time() > deadline:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            exit_code = TIMEOUT_EXIT_CODE
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+    try:
+        with open(output_path, "r", errors="replace") as f:
+            output = f.read()
+        os.remove(output_path)
+    except OSError:
+        output = ""
+    return {"exit_code": exit_code, "output": output, "duration": time.time() - start_time}
+
+
+def handle_connection(conn, repo_dir, head):
+    request = json.loads(recv_line(conn).decode("utf-8"))
+    current_head = request.get("head")
+    if current_head is None and repo_dir is not None:
+        current_head = read_head(repo_dir)
+    if (current_head is not None or repo_dir is not None) and (head is None or current_head != head):
+        # the clone was checked out to another commit (or its commit is unknown), the pre-imported
+        # modules may be outdated
+        conn.sendall(json.dumps({"stale": True}).encode("utf-8"))
+        os.kill(os.getppid(), signal.SIGTERM)
+        return
+    if request["op"] == "ping":
+        response = {"ok": True, "pid": os.getppid()}
+    elif request["op"] == "run":
+        response = handle_run(request)
+    else:
+        response = {"error": f"Unknown operation: {request['op']}"}
+    conn.sendall(json.dumps(response).encode("utf-8"))
+
+
+def serve(socket_path, modules, repo_dir, head=None):
+    if head is None and repo_dir:
+        head = read_head(repo_dir)
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            traceback.print_exc()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(64)
+    # connection handlers are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        conn, _ = server.accept()
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                handle_connection(conn, repo_dir, head)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                conn.close()
+                os._exit(0)
+        conn.close()
+
+
+def send_request(socket_path, payload):
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        client.shutdown(socket.SHUT_WR)
+        response = recv_all(client).decode("utf-8")
+        client.close()
+    except OSError as e:
+        response = json.dumps({"error": str(e)})
+    if not response:
+        response = json.dumps({"error": "Empty response from warm worker"})
+    return response
+
+
+def request(socket_path, payload):
+    sys.stdout.write(send_request(socket_path, payload))
+
+
+def run_cold(path, timeout):
+    """
+    Runs the script in a fresh interpreter, like `timeout {timeout}s python3 path` would.
+    """
+    start_time = time.time()
+    try:
+        completed = subprocess.run(
+            [sys.executable, path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        exit_code, output = completed.returncode, completed.stdout
+    except subprocess.TimeoutExpired as e:
+        exit_code, output = TIMEOUT_EXIT_CODE, e.output or b""
+    return {
+        "exit_code": exit_code,
+        "output": output.decode("utf-8", errors="replace"),
+        "duration": time.time() - start_time
+    }
+
+
+def batch(paths, timeout, jobs, socket_path, head=None):
+    """
+    Runs all scripts with at most `jobs` of them at a time and prints their results in order.
+    """
+    warm = socket_path is not None and "ok" in json.loads(send_request(socket_path, {"op": "ping", "head": head}))
+
+    def run_one(path):
+        if warm:
+            try:
+                response = json.loads(send_request(
+                    socket_path, {"op": "run", "path": path, "timeout": timeout, "head": head}))
+            except json.JSONDecodeError:
+                response = {}
+            if "exit_code" in response:
+                response["mode"] = "warm"
+                return response
+        # the worker is unavailable or outdated after a checkout
+        response = run_cold(path, timeout)
+        response["mode"] = "cold"
+        return response
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = list(pool.map(run_one, paths))
+    sys.stdout.write(json.dumps(results))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm interpreter worker for PatchGuru executions")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--socket", required=True)
+    serve_parser.add_argument("--module", action="append", default=[])
+    serve_parser.add_argument("--repo_dir", default=None)
+    serve_parser.add_argument("--head", default=None)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--socket", required=True)
+    run_parser.add_argument("--timeout", type=float, default=None)
+    run_parser.add_argument("--head", default=None)
+    run_parser.add_argument("path")
+    ping_parser = subparsers.add_parser("ping")
+    ping_parser.add_argument("--socket", required=True)
+    ping_parser.add_argument("--head", default=None)
+    batch_parser = subparsers.add_parser("batch")
+    batch_parser.add_argument("--socket", default=None)
+    batch_parser.add_argument("--timeout", type=float, default=None)
+    batch_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    batch_parser.add_argument("--head", default=None)
+    batch_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve(args.socket, args.module, args.repo_dir, args.head)
+    elif args.mode == "run":
+        request(args.socket, {"op": "run", "path": args.path, "timeout": args.timeout, "head": args.head})
+    elif args.mode == "batch":
+        batch(args.paths, args.timeout, args.jobs, args.socket, args.head)
+    else:
+        request(args.socket, {"op": "ping", "head": args.head})
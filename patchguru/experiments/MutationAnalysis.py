@@ -2,6 +2,7 @@ import os
 import json
 from patchguru.utils.PullRequest import PullRequest
 from patchguru.analysis.PRRetriever import get_repo
+from patchguru.analysis.BatchPlanner import plan_batch
 from patchguru.execution.DockerExecutor import DockerExecutor
 from patchguru.utils.CodeMutation import generate_mutants, beautify_code
 from patchguru.utils.PythonCodeUtil import update_function_name
@@ -32,7 +33,8 @@ def do_mutation(spec_path, result_dir, github_repo, pr_id , cloned_repo_manager,
     commit = pr.pre_commit
     cloned_repo = cloned_repo_manager.get_cloned_repo(commit)
     container_name = cloned_repo.container_name
-    docker_executor = DockerExecutor(container_name)
+    docker_executor = DockerExecutor(
+        container_name, cloned_repo.module_name, cloned_repo.container_repo_dir, commit=cloned_repo.commit)
 
     post_fut_code_without_prefix = extract_fut_code(pr.post_fut_info)
     pre_fut_code_without_prefix = extract_fut_code(pr.prev_fut_info)
@@ -75,6 +77,9 @@ def do_mutation(spec_path, result_dir, github_repo, pr_id , cloned_repo_manager,
         n_mutant_fail_other = existing_results.get("n_mutant_fail_other", 0)
     else:
         execution_results = {}
+    pending_mutants = []
+    # hashes of the mutants queued in this run, duplicates are tested once
+    pending_hash_ids = set()
     for idx, mutant in enumerate(mutants):
         diff = difflib.unified_diff(
             post_fut_code.splitlines(),
@@ -89,33 +94,41 @@ def do_mutation(spec_path, result_dir, github_repo, pr_id , cloned_repo_manager,
         is_relevant = any(removed_line in added_lines for removed_line in removed_lines)
         if is_relevant:
             hash_id = blake2b(mutant.encode()).hexdigest()
-            if hash_id in execution_results:
+            if hash_id in execution_results or hash_id in pending_hash_ids:
                 print(f"Skipping already tested mutant {idx+1}/{len(mutants)} for PR {pr_id}")
                 continue  # Skip already tested mutants
+            pending_hash_ids.add(hash_id)
             relevant_mutants.append(mutant)
-            print(f"Testing mutant {idx+1}/{len(mutants)} for PR {pr_id}")
             before = spec.split("## After Pull Request")[0]
             after = spec.split("# Formal Specification")[1]
             mutated_spec = f"{before}## After Pull Request\n{mutant}\n# Formal Specification{after}"
-            exit_code, output = docker_executor.execute_python_code(mutated_spec, timeout=300)
-            print(output)
-            print("-" * 40)
-            mutant_file_name = f"mutant_{idx+1}_fail.py"
-            if exit_code == 0:
-                mutant_file_name = f"mutant_{idx+1}_pass.py"
-                n_mutant_pass += 1
+            pending_mutants.append((idx, hash_id, mutated_spec))
+
+    # run all relevant mutants in a single round-trip to the container
+    print(f"Testing {len(pending_mutants)} mutants for PR {pr_id}")
+    batch_results = docker_executor.execute_many(
+        [mutated_spec for _, _, mutated_spec in pending_mutants], timeout_each=300)
+    for (idx, hash_id, mutated_spec), batch_result in zip(pending_mutants, batch_results):
+        exit_code, output = batch_result["exit_code"], batch_result["output"]
+        print(f"Mutant {idx+1}/{len(mutants)} for PR {pr_id}")
+        print(output)
+        print("-" * 40)
+        mutant_file_name = f"mutant_{idx+1}_fail.py"
+        if exit_code == 0:
+            mutant_file_name = f"mutant_{idx+1}_pass.py"
+            n_mutant_pass += 1
+        else:
+            if "AssertionError" in output:
+                mutant_file_name = f"mutant_{idx+1}_assert.py"
+                n_mutant_fail_assert += 1
             else:
-                if "AssertionError" in output:
-                    mutant_file_name = f"mutant_{idx+1}_assert.py"
-                    n_mutant_fail_assert += 1
-                else:
-                    n_mutant_fail_other += 1
-            with open(os.path.join(result_dir, mutant_file_name), "w") as f:
-                    f.write(mutated_spec)
-            execution_results[hash_id] = {
-                "exit_code": exit_code,
-                "output": output,
-            }
+                n_mutant_fail_other += 1
+        with open(os.path.join(result_dir, mutant_file_name), "w") as f:
+                f.write(mutated_spec)
+        execution_results[hash_id] = {
+            "exit_code": exit_code,
+            "output": output,
+        }
     # Save mutation results
     mutation_results = {
         "total_mutants": len(mutants),
@@ -136,9 +149,8 @@ def main(repo_name, analysis_result_dir):
             target_pr_ids.append(int(line.strip()))
     target_pr_ids = sorted(target_pr_ids)
     github_repo, cloned_repo_manager = get_repo(repo_name)
+    target_pr_ids = plan_batch(github_repo, cloned_repo_manager, [pr_id for pr_id in target_pr_ids if pr_id < 2244])
     for pr_id in target_pr_ids:
-        if pr_id >= 2244:
-            continue
         phase1_spec_path = os.path.join(analysis_result_dir, str(pr_id), "specification.py")
         phase2_spec_path = os.path.join(analysis_result_dir, str(pr_id), "phase2", "specification.py")
         if os.path.exists(phase1_spec_path):
@@ -162,6 +174,7 @@ def main(repo_name, analysis_result_dir):
                 print(f"Skipping PR {pr_id} phase2 mutation analysis due to incomplete analysis.")
                 continue
             do_mutation(spec_path, result_dir, github_repo, pr_id, cloned_repo_manager, repo_name)
+    print(f"Clone checkouts: {cloned_repo_manager.statistics}")
 
 
 if __name__ == "__main__":
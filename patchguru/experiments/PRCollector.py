@@ -3,14 +3,22 @@ from patchguru.utils.Logger import get_logger
 from tqdm import tqdm
 import os
 from patchguru import Config
+from patchguru.utils.GitDiff import prefetch_diffs
+from patchguru.analysis.BatchPlanner import plan_commits
+from patchguru.utils.GitHubHttpCache import GITHUB_CACHE_MODES, get_github_http_cache, set_github_cache_mode
 import argparse
 import time
 
-# Format start time for log file naming
-start_time = time.strftime("%Y%m%d-%H%M%S")
-logger = get_logger(__name__, log_file=f"logs/pr_collector_{start_time}.log")
+def get_collector_logger():
+    """
+    Logger of the collection, created on first use rather than at import, so that importing this
+    module writes no log file. Its file is named after the start time of the first collection.
+    """
+    start_time = time.strftime("%Y%m%d-%H%M%S")
+    return get_logger(__name__, log_file=f"logs/pr_collector_{start_time}.log")
 
 def collect_single_changed_function_prs(project_name, n_prs=10):
+    logger = get_collector_logger()
     logger.info(f"Collecting PRs for project {project_name}...")
     dataset_dir = ".cache/pr_data/single_changed_function_prs"
     os.makedirs(dataset_dir, exist_ok=True)
@@ -24,40 +32,59 @@ def collect_single_changed_function_prs(project_name, n_prs=10):
                 dataset.add(pr_number)
         return dataset
 
-    github_repo, _ = get_repo(project_name)
+    repo = get_repo(project_name)
+    github_repo, cloned_repo_manager = repo
     logger.info(f"Currently collected {len(dataset)} PRs, continuing collection up to {n_prs}")
     selected_prs = github_repo.get_pulls(state="closed", sort="created", direction="desc")
     selected_prs = [pr for pr in selected_prs if pr.number >= Config.PR_CUT_OFF[project_name]]
     logger.info(f"Total PRs after filtering: {len(selected_prs)}")
-    for pr_info in tqdm(selected_prs, desc=f"Collecting PRs for {project_name}"):
+    # the PRs are diffed, planned and retrieved by chunks, selected_prs itself stays in creation order
+    batches = [
+        selected_prs[start:start + Config.GIT_DIFF_BATCH_SIZE]
+        for start in range(0, len(selected_prs), Config.GIT_DIFF_BATCH_SIZE)
+    ]
+    for batch in tqdm(batches, desc=f"Collecting PRs for {project_name}"):
         logger.info(f"Dataset size: {len(dataset)}")
         logger.info(len(dataset) >= n_prs)
         if len(dataset) >= n_prs:
             break
-        pr_number = int(pr_info.number)
+        # diff the next PRs in one git process, before their clones are checked out
+        prefetch_diffs(cloned_repo_manager.git_dir(), [pr.merge_commit_sha for pr in batch if pr.merge_commit_sha])
+        # retrieve the batch in the order that minimizes checkouts, but add its PRs in creation order,
+        # so that the dataset holds the same (newest) PRs as a PR by PR collection would
+        planned_pr_nbs = plan_commits(
+            cloned_repo_manager.git_dir(), {pr.number: pr.merge_commit_sha for pr in batch}, len(cloned_repo_manager.clone_ids))
+        selected_pr_nbs = set()
+        for pr_number in planned_pr_nbs:
+            try:
+                pr, _, _ = retrieve_pr(project_name, pr_number, repo=repo)
+                if len(pr.changed_functions) == 1 and len(pr.added_functions) == 0 and len(pr.removed_functions) == 0:
+                    selected_pr_nbs.add(pr_number)
+            except Exception as e:
+                logger.error(f"Failed to retrieve PR #{pr_number}: {e}")
 
-        try:
-            pr, _, _ = retrieve_pr(project_name, pr_number)
-            if len(pr.changed_functions) == 1 and len(pr.added_functions) == 0 and len(pr.removed_functions) == 0:
-                dataset.add(pr_number)
-                with open(dataset_path, "w") as f:
-                    for pr_number in dataset:
-                        f.write(f"{pr_number}\n")
-        except Exception as e:
-            logger.error(f"Failed to retrieve PR #{pr_number}: {e}")
-            continue
+        for pr_info in batch:
+            if pr_info.number in selected_pr_nbs and len(dataset) < n_prs:
+                dataset.add(pr_info.number)
+        with open(dataset_path, "w") as f:
+            for pr_number in dataset:
+                f.write(f"{pr_number}\n")
 
     logger.info(f"Collected {len(dataset)}{len(selected_prs)} PRs for project {project_name}. Saving to {dataset_path}")
+    logger.info(f"GitHub response cache: {get_github_http_cache().statistics}")
+    logger.info(f"Clone checkouts: {cloned_repo_manager.statistics}")
     with open(dataset_path, "w") as f:
         for pr_number in dataset:
             f.write(f"{pr_number}\n")
     return dataset
 
 def filter_backported_prs(project_name, dataset):
+    logger = get_collector_logger()
     new_dataset = []
+    repo = get_repo(project_name)
     for pr_nb in dataset:
         # Query pr infomation
-        pr, _, _ = retrieve_pr(project_name, pr_nb)
+        pr, _, _ = retrieve_pr(project_name, pr_nb, repo=repo)
         if "backport" in pr.title.lower():
             logger.info(f"Removed backported PR #{pr_nb}")
             continue
@@ -77,5 +104,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Collect PRs for a given project.")
     parser.add_argument("-p", "--project", type=str, required=True, help="Project name (e.g., 'scipy' or 'pandas')")
     parser.add_argument("-n", "--n_prs", type=int, default=100, help="Number of PRs to collect (default: 100)")
+    parser.add_argument("--github_cache", "--github-cache", type=str, choices=GITHUB_CACHE_MODES, default=Config.GITHUB_HTTP_CACHE_MODE, help="GitHub response cache mode (offline replays a local mirror and fails on a miss)")
     args = parser.parse_args()
+    set_github_cache_mode(args.github_cache)
     dataset = collect_single_changed_function_prs(args.project, n_prs=args.n_prs)
@@ -5,6 +5,7 @@ import termcolor
 from patchguru.utils.PythonCodeUtil import update_function_name, insert_print_statement
 from patchguru.utils.PullRequest import PullRequest
 from patchguru.analysis.PRRetriever import get_repo
+from patchguru.analysis.BatchPlanner import plan_batch
 from patchguru.execution.DockerExecutor import DockerExecutor
 import time
 import json
@@ -251,7 +252,8 @@ def test_pr(repo_name: str, pr_id: int, mutation_dir: str, github_repo, cloned_r
             SINGLE_TEST_CMD = ["spin", "test"]
 
     container_name = cloned_repo.container_name
-    docker_executor = DockerExecutor(container_name)
+    docker_executor = DockerExecutor(
+        container_name, cloned_repo.module_name, cloned_repo.container_repo_dir, commit=cloned_repo.commit)
     post_pr_code = list(pr.post_fut_info.values())[0]["code"]
 
     start_line = pr.post_fut_info[function_id]["start_line"]
@@ -388,12 +390,15 @@ def test_pr(repo_name: str, pr_id: int, mutation_dir: str, github_repo, cloned_r
         json.dump(summary, f, indent=4)
 
 def main(repo_name: str, mutation_dir: str):
-    pr_ids = os.listdir(mutation_dir)
+    # the mutation directory may hold other entries than the PR directories (e.g., summaries)
+    pr_ids = [pr_id for pr_id in os.listdir(mutation_dir) if pr_id.isdigit()]
     github_repo, cloned_repo_manager = get_repo(repo_name)
+    pr_ids = [str(pr_id) for pr_id in plan_batch(github_repo, cloned_repo_manager, [int(pr_id) for pr_id in pr_ids])]
 
     os.makedirs(os.path.join(".cache/mutation_testing", "regression_tests", repo_name), exist_ok=True)
     for pr_id in pr_ids:
         test_pr(repo_name, pr_id, mutation_dir, github_repo, cloned_repo_manager)
+    print(f"Clone checkouts: {cloned_repo_manager.statistics}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# modules imported by the CLIs and by the offline report scripts
+DEFAULT_MODULES = [
+    "patchguru.SpecInfer",
+    "patchguru.analysis.PRRetriever",
+    "patchguru.utils.PullRequest",
+    "patchguru.experiments.RQ1_3",
+]
+DEFAULT_BUDGET = 2.0  # seconds of cumulative import time per module
+
+
+def parse_importtime(stderr):
+    """
+    Returns the (self, cumulative, module) times in seconds reported by `python -X importtime`.
+    """
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        timings.append((int(self_us) / 1e6, int(cumulative_us) / 1e6, module.strip()))
+    return timings
+
+
+def startup_code(module, fixture_files=None):
+    """
+    Code of a startup: the import of the module and, given recorded `llm_usage.json` files, the
+    initialization of the fixture LLM backend, as `init_llm` does in a CLI run with the fixture backend.
+    """
+    code = f"import {module}"
+    if fixture_files:
+        code += (
+            "; from patchguru.llms.LLMBackend import FixtureBackend"
+            "; from patchguru.llms.OpenAI import init_llm"
+            f"; init_llm(FixtureBackend({[os.path.abspath(path) for path in fixture_files]!r}))"
+        )
+    return code
+
+
+def measure(module, runs, fixture_files=None):
+    """
+    Starts fresh interpreters that import the module (see `startup_code`), from an empty working
+    directory so that import-time side effects (log directories, token files) are detected. Returns
+    the cumulative import times, the wall times, the timings of the last run and the files created
+    by the startup.
+    """
+    cumulative_times, wall_times, timings, created_files = [], [], [], []
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            start_time = time.time()
+            completed = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", startup_code(module, fixture_files)],
+                cwd=work_dir, env=env, capture_output=True, text=True)
+            wall_times.append(time.time() - start_time)
+            if completed.returncode != 0:
+                raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+            timings = parse_importtime(completed.stderr)
+            cumulative_times.append(next(
+                (cumulative for _, cumulative, name in timings if name == module), 0.0))
+            created_files = sorted(os.listdir(work_dir))
+    return cumulative_times, wall_times, timings, created_files
+
+
+def main(modules, runs, budget, top, fixture_files=None):
+    within_budget = True
+    for module in modules:
+        cumulative_times, wall_times, timings, created_files = measure(module, runs, fixture_files)
+        median_time = statistics.median(cumulative_times)
+        status = "OK" if median_time <= budget and not created_files else "FAIL"
+        within_budget = within_budget and status == "OK"
+        print(f"[{status}] {module}: import {median_time:.3f}s (median of {runs}), interpreter wall time {statistics.median(wall_times):.3f}s, budget {budget:.3f}s")
+        if created_files:
+            print(f"    import-time side effects, created in the working directory: {', '.join(created_files)}")
+        for self_time, cumulative, name in sorted(timings, reverse=True)[:top]:
+            print(f"    {self_time:8.4f}s self {cumulative:8.4f}s cumulative  {name}")
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of PatchGuru entry points against a budget")
+    parser.add_argument("--module", action="append", default=None, help="Module to import (repeatable)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters per module")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="Maximum median cumulative import time in seconds")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to report per module")
+    parser.add_argument("--fixture", action="append", default=None, help="Recorded llm_usage.json file initializing the fixture LLM backend at startup (repeatable)")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.module or DEFAULT_MODULES, args.runs, args.budget, args.top, args.fixture) else 1)
@@ -0,0 +1,204 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+from patchguru import Config
+
+
+class LLMBackend(ABC):
+    """
+    Sends chat-completion requests. `arguments` are the keyword arguments of the OpenAI
+    `chat.completions.create` call; the result is the response text and its token usage.
+    """
+
+    name = "abstract"
+
+    def initialize(self):
+        """
+        Acquires credentials and clients ahead of the first request, so that misconfigurations fail early.
+        Intentionally a no-op by default, for backends without anything to set up.
+        """
+        return
+
+    @abstractmethod
+    def complete(self, arguments: dict) -> Tuple[str, dict]:
+        pass
+
+    async def acomplete(self, arguments: dict) -> Tuple[str, dict]:
+        return await asyncio.to_thread(self.complete, arguments)
+
+
+def _usage_of(response) -> dict:
+    prompt_tokens_details = getattr(response.usage, "prompt_tokens_details", None)
+    return {
+        "completion_tokens": response.usage.completion_tokens,
+        "prompt_tokens": response.usage.prompt_tokens,
+        "total_tokens": response.usage.total_tokens,
+        # prompt tokens served from the provider's prompt cache
+        "cached_tokens": getattr(prompt_tokens_details, "cached_tokens", None) or 0
+    }
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    The OpenAI API, or any OpenAI-compatible server at `base_url` (e.g., `StubServer`).
+    The token is read and the clients are created on first use.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url=Config.OPENAI_BASE_URL, token_file=".openai_token"):
+        self.base_url = base_url
+        self.token_file = token_file
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _api_key(self) -> str:
+        if self.base_url is not None and not os.path.exists(self.token_file):
+            # local OpenAI-compatible servers do not check the key
+            return "local"
+        with open(self.token_file) as f:
+            openai_key = f.read().strip()
+        if not openai_key:
+            raise ValueError("OpenAI API key is empty")
+        return openai_key
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                # deadlines and retries are handled by LLMRetry
+                self._client = OpenAI(api_key=self._api_key(), base_url=self.base_url, timeout=Config.LLM_REQUEST_TIMEOUT, max_retries=0)
+            return self._client
+
+    def _get_async_client(self):
+        with self._lock:
+            if self._async_client is None:
+                from openai import AsyncOpenAI
+                self._async_client = AsyncOpenAI(api_key=self._api_key(), base_url=self.base_url, timeout=Config.LLM_REQUEST_TIMEOUT, max_retries=0)
+            return self._async_client
+
+    def initialize(self):
+        self._get_client()
+
+    def complete(self, arguments: dict) -> Tuple[str, dict]:
+        response = self._get_client().chat.completions.create(**arguments)
+        return response.choices[0].message.content, _usage_of(response)
+
+    async def acomplete(self, arguments: dict) -> Tuple[str, dict]:
+        response = await self._get_async_client().chat.completions.create(**arguments)
+        return response.choices[0].message.content, _usage_of(response)
+
+
+def load_recorded_responses(paths: List[str]) -> List[dict]:
+    """
+    Loads the (prompt, response, usage) triples of the given `llm_usage.json` files or glob patterns.
+    Each query is recorded as one entry with its prompt followed by one entry with its response.
+    """
+    recorded = []
+    for pattern in paths:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            with open(path, "r") as f:
+                entries = json.load(f)
+            prompt = None
+            for entry in entries:
+                if "prompt" in entry:
+                    prompt = entry["prompt"]
+                elif "response" in entry and prompt is not None:
+                    recorded.append({
+                        "prompt": prompt,
+                        "response": entry["response"],
+                        "usage": {
+                            "completion_tokens": entry.get("completion_tokens", 0),
+                            "prompt_tokens": entry.get("prompt_tokens", 0),
+                            "total_tokens": entry.get("total_tokens", 0),
+                            "cached_tokens": entry.get("cached_tokens", 0)
+                        }
+                    })
+                    prompt = None
+    return recorded
+
+
+class FixtureBackend(LLMBackend):
+    """
+    In-process backend answering with responses recorded in `llm_usage.json` files, after a
+    configurable latency. Known prompts get their recorded responses in order; other prompts
+    get the recorded responses round-robin, unless `strict` is set.
+    """
+
+    name = "fixture"
+
+    def __init__(self, paths=Config.LLM_FIXTURE_FILES, latency=Config.LLM_FIXTURE_LATENCY, strict=False):
+        self.latency = latency
+        self.strict = strict
+        self.recorded = load_recorded_responses(paths)
+        if len(self.recorded) == 0:
+            raise ValueError(f"No recorded LLM responses found in {paths}.")
+        self.prompt_to_recorded = {}
+        for recorded in self.recorded:
+            self.prompt_to_recorded.setdefault(self._hash(recorded["prompt"]), []).append(recorded)
+        self._occurrences = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(prompt) -> str:
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _prompt_of(self, arguments) -> str:
+        return "\n".join(message["content"] for message in arguments["messages"])
+
+    def answer(self, prompt) -> dict:
+        prompt_hash = self._hash(prompt)
+        with self._lock:
+            if prompt_hash in self.prompt_to_recorded:
+                candidates = self.prompt_to_recorded[prompt_hash]
+                occurrence = self._occurrences.get(prompt_hash, 0)
+                self._occurrences[prompt_hash] = occurrence + 1
+                return candidates[occurrence % len(candidates)]
+            if self.strict:
+                raise LookupError(f"No recorded LLM response for prompt {prompt_hash}.")
+            recorded = self.recorded[self._next % len(self.recorded)]
+            self._next += 1
+            return recorded
+
+    def complete(self, arguments: dict) -> Tuple[str, dict]:
+        recorded = self.answer(self._prompt_of(arguments))
+        time.sleep(self.latency)
+        return recorded["response"], recorded["usage"]
+
+    async def acomplete(self, arguments: dict) -> Tuple[str, dict]:
+        recorded = self.answer(self._prompt_of(arguments))
+        await asyncio.sleep(self.latency)
+        return recorded["response"], recorded["usage"]
+
+
+LLM_BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    FixtureBackend.name: FixtureBackend,
+}
+
+_LLM_BACKEND = None
+_LLM_BACKEND_LOCK = threading.Lock()
+
+
+def get_llm_backend() -> LLMBackend:
+    global _LLM_BACKEND
+    with _LLM_BACKEND_LOCK:
+        if _LLM_BACKEND is None:
+            if Config.LLM_BACKEND not in LLM_BACKENDS:
+                raise ValueError(f"Unknown LLM backend: {Config.LLM_BACKEND}. Expected one of {list(LLM_BACKENDS)}.")
+            _LLM_BACKEND = LLM_BACKENDS[Config.LLM_BACKEND]()
+        return _LLM_BACKEND
+
+
+def set_llm_backend(backend: LLMBackend):
+    global _LLM_BACKEND
+    with _LLM_BACKEND_LOCK:
+        _LLM_BACKEND = backend
@@ -0,0 +1,214 @@
+"""
+Token- and cost-aware accounting of LLM queries.
+
+An `LLMBudget` tracks the queries, tokens and estimated cost of a scope (a batch, a PR) live and
+tells whether another query fits in what remains, so that retry loops stop instead of spending
+past the limits. Budgets nest through a context variable: the budget of a PR opened inside a
+batch budget charges both. The `RateLimiter` is shared by all the threads and event loops of the
+process and spaces requests out to stay under the requests/minute and tokens/minute limits of
+the API, instead of bursting into 429 errors.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from patchguru import Config
+from patchguru.utils.Tracker import Event, append_event
+
+
+class LLMBudgetExceeded(Exception):
+    """
+    Raised when a query is sent although the current budget cannot afford it.
+    """
+
+
+def estimate_tokens(prompt, max_tokens) -> int:
+    """
+    Rough number of tokens of a query before it is sent: ~4 characters per prompt token and the expected completion.
+    """
+    return len(prompt) // 4 + min(max_tokens, Config.LLM_EXPECTED_COMPLETION_TOKENS)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0) -> float:
+    """
+    Estimated cost in USD, 0 for models without a price in Config.LLM_PRICES.
+    Prompt tokens served from the provider's prompt cache are billed at a discount.
+    """
+    prompt_price, completion_price = Config.LLM_PRICES.get(model, (0.0, 0.0))
+    uncached_tokens = prompt_tokens - cached_tokens
+    return (uncached_tokens * prompt_price + cached_tokens * prompt_price * Config.LLM_CACHED_PROMPT_PRICE_RATIO + completion_tokens * completion_price) / 1e6
+
+
+class LLMBudget:
+    """
+    Queries, tokens and estimated cost of a scope, with optional limits (None means unlimited).
+    Charges are propagated to the parent budget. Thread-safe.
+    """
+
+    def __init__(self, name, max_tokens=None, max_cost=None, parent=None):
+        self.name = name
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.parent = parent
+        self.queries = 0
+        self.cached_queries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self._lock = threading.Lock()
+
+    def charge(self, model, usage, cached=False):
+        with self._lock:
+            if cached:
+                # replayed responses cost nothing
+                self.cached_queries += 1
+            else:
+                self.queries += 1
+                self.prompt_tokens += usage["prompt_tokens"]
+                self.completion_tokens += usage["completion_tokens"]
+                self.cached_tokens += usage.get("cached_tokens", 0)
+                self.cost += estimate_cost(model, usage["prompt_tokens"], usage["completion_tokens"], usage.get("cached_tokens", 0))
+        if self.parent is not None:
+            self.parent.charge(model, usage, cached)
+
+    def _expected_query(self, estimated_tokens, model):
+        """
+        Expected (tokens, cost) of the next query: the mean of the queries charged so far, or the estimate before the first one.
+        """
+        if self.queries == 0:
+            return estimated_tokens, estimate_cost(model, estimated_tokens, 0)
+        return (self.prompt_tokens + self.completion_tokens) / self.queries, self.cost / self.queries
+
+    def can_afford(self, estimated_tokens=0, model=None) -> bool:
+        if model is None:
+            model = Config.LLM_MODEL
+        with self._lock:
+            expected_tokens, expected_cost = self._expected_query(estimated_tokens, model)
+            if self.max_tokens is not None and self.prompt_tokens + self.completion_tokens + expected_tokens > self.max_tokens:
+                return False
+            if self.max_cost is not None and self.cost + expected_cost > self.max_cost:
+                return False
+        return self.parent is None or self.parent.can_afford(estimated_tokens, model)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "queries": self.queries,
+                "cached_queries": self.cached_queries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "cost": self.cost,
+                "max_tokens": self.max_tokens,
+                "max_cost": self.max_cost
+            }
+
+
+# budget of the analysis running in the current thread or task, if any
+_BUDGET = contextvars.ContextVar("llm_budget", default=None)
+
+
+@contextmanager
+def llm_budget(name, max_tokens=None, max_cost=None, pr_nb=-1):
+    """
+    Charges the LLM queries of this context (including worker threads and tasks started in it) to a
+    new budget, nested in the current one. Reports the budget's usage at the end.
+    """
+    budget = LLMBudget(name, max_tokens, max_cost, parent=_BUDGET.get())
+    token = _BUDGET.set(budget)
+    try:
+        yield budget
+    finally:
+        _BUDGET.reset(token)
+        summary = budget.summary()
+        append_event(Event(
+            level="INFO", pr_nb=pr_nb,
+            message=f"LLM usage of {name}: {summary['queries']} queries ({summary['cached_queries']} replayed), {summary['total_tokens']} tokens, ${summary['cost']:.4f}.",
+            type="LLMBudget",
+            info=summary
+        ))
+
+
+def get_llm_budget():
+    return _BUDGET.get()
+
+
+def can_query(prompt="", max_tokens=None) -> bool:
+    """
+    Whether the current budget (if any) can afford another query, which decides between retrying and stopping.
+    """
+    if max_tokens is None:
+        max_tokens = Config.LLM_EXPECTED_COMPLETION_TOKENS
+    budget = _BUDGET.get()
+    if budget is None or budget.can_afford(estimate_tokens(prompt, max_tokens)):
+        return True
+    append_event(Event(
+        level="WARNING",
+        message=f"LLM budget {budget.name} exhausted. Stopping LLM queries.",
+        type="BudgetExhausted",
+        info=budget.summary()
+    ))
+    return False
+
+
+class RateLimiter:
+    """
+    Token buckets of requests and tokens per minute (None means unlimited). `reserve` debits a query
+    and returns how long to wait before sending it; the debt is paid back as the buckets refill, so
+    concurrent callers are spaced out in arrival order.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute or 0
+        self.available_tokens = tokens_per_minute or 0
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self.last_refill) / 60
+        self.last_refill = now
+        if self.requests_per_minute is not None:
+            self.available_requests = min(self.requests_per_minute, self.available_requests + elapsed_minutes * self.requests_per_minute)
+        if self.tokens_per_minute is not None:
+            self.available_tokens = min(self.tokens_per_minute, self.available_tokens + elapsed_minutes * self.tokens_per_minute)
+
+    def reserve(self, estimated_tokens) -> float:
+        with self._lock:
+            self._refill()
+            wait_minutes = 0.0
+            if self.requests_per_minute is not None:
+                self.available_requests -= 1
+                wait_minutes = max(wait_minutes, -self.available_requests / self.requests_per_minute)
+            if self.tokens_per_minute is not None:
+                # a query larger than the bucket would never fit, it waits for a full bucket at most
+                self.available_tokens -= min(estimated_tokens, self.tokens_per_minute)
+                wait_minutes = max(wait_minutes, -self.available_tokens / self.tokens_per_minute)
+            return wait_minutes * 60
+
+    def settle(self, estimated_tokens, used_tokens):
+        """
+        Corrects the reservation of a query with the tokens it actually used.
+        """
+        if self.tokens_per_minute is None:
+            return
+        with self._lock:
+            self._refill()
+            self.available_tokens = min(self.tokens_per_minute, self.available_tokens + min(estimated_tokens, self.tokens_per_minute) - used_tokens)
+
+
+_RATE_LIMITER = None
+_RATE_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _RATE_LIMITER
+    with _RATE_LIMITER_LOCK:
+        if _RATE_LIMITER is None:
+            _RATE_LIMITER = RateLimiter(Config.LLM_REQUESTS_PER_MINUTE, Config.LLM_TOKENS_PER_MINUTE)
+        return _RATE_LIMITER
@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import threading
+from patchguru import Config
+from patchguru.utils.DiskCache import DiskCache
+
+LLM_CACHE_MODES = ["off", "read-write", "read-only", "replay-strict"]
+
+
+class LLMCacheMiss(Exception):
+    """
+    Raised in replay-strict mode when a query has no recorded response.
+    """
+
+
+class LLMCache:
+    """
+    Persistent cache of LLM responses keyed by (model, temperature, max_tokens, prompt hash).
+
+    Identical prompts are asked several times on purpose (e.g., retries after an unparsable
+    answer), so the key also contains the occurrence of the query in the current process: the
+    n-th identical query replays the n-th recorded response. Modes:
+    - off: always query the LLM;
+    - read-write: replay recorded responses and record new ones;
+    - read-only: replay recorded responses, query the LLM on a miss without recording it;
+    - replay-strict: replay recorded responses and raise `LLMCacheMiss` on a miss.
+    """
+
+    def __init__(self, mode=None, cache_dir=None, max_size_bytes=None):
+        mode = mode if mode is not None else Config.LLM_CACHE_MODE
+        cache_dir = cache_dir if cache_dir is not None else os.path.join(Config.CACHE_DIR, "llm")
+        max_size_bytes = max_size_bytes if max_size_bytes is not None else Config.LLM_CACHE_MAX_BYTES
+        if mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}. Expected one of {LLM_CACHE_MODES}.")
+        self.mode = mode
+        self.store = DiskCache(cache_dir, max_size_bytes)
+        self._occurrences = {}
+        self._lock = threading.Lock()
+
+    def key(self, model, temperature, max_tokens, prompt, response_format=None) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        base_key = f"{model}:{temperature}:{max_tokens}:{prompt_hash}"
+        if response_format is not None:
+            # structured answers are not interchangeable with free-text ones
+            base_key += ":" + hashlib.sha256(json.dumps(response_format, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._occurrences.get(base_key, 0)
+            self._occurrences[base_key] = occurrence + 1
+        return f"{base_key}:{occurrence}"
+
+    def lookup(self, key):
+        """
+        Returns the recorded {"response", "usage"} entry of the key, or None on a miss.
+        """
+        if self.mode == "off":
+            return None
+        entry = self.store.get(key)
+        if entry is None and self.mode == "replay-strict":
+            raise LLMCacheMiss(f"No recorded LLM response for {key} in replay-strict mode.")
+        return entry
+
+    def record(self, key, response, usage):
+        if self.mode != "read-write":
+            return
+        self.store.set(key, {"response": response, "usage": usage})
+
+
+_LLM_CACHE = None
+_LLM_CACHE_LOCK = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _LLM_CACHE
+    with _LLM_CACHE_LOCK:
+        if _LLM_CACHE is None:
+            _LLM_CACHE = LLMCache()
+        return _LLM_CACHE
+
+
+def set_llm_cache_mode(mode):
+    global _LLM_CACHE
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE = LLMCache(mode=mode)
@@ -0,0 +1,249 @@
+"""
+Resilient LLM requests: per-request deadlines, retries with exponential backoff and jitter for
+transient errors (rate limits, timeouts, connection and server errors), and optional hedging,
+i.e., a second identical request sent when the first one is slower than the p95 latency of its
+stage, the first answer winning. In the asyncio pipeline the losing request is cancelled. A request
+of the synchronous path runs in a thread and cannot be interrupted: when it completes after losing
+(or after the deadline), the API bills it all the same, so its tokens are charged to the LLM budget
+of the query.
+
+Every request reports an `LLMLatency` event with its stage, so that the tail latency of each
+stage can be read from the event log.
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from patchguru import Config
+from patchguru.llms.LLMBudget import get_llm_budget
+from patchguru.utils.Tracker import Event, append_event
+
+# errors of the openai package (matched by name, to keep it an optional import) worth retrying
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError"}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt, error=None) -> float:
+    """
+    Seconds to wait before retry `attempt` (0-based): exponential backoff with full jitter,
+    at least the Retry-After delay requested by the server.
+    """
+    delay = random.uniform(0, min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return max(delay, float(retry_after)) if retry_after is not None else delay
+    except ValueError:
+        return delay
+
+
+class LatencyTracker:
+    """
+    Recent successful request latencies of each stage.
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self.stage_to_latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, latency):
+        with self._lock:
+            self.stage_to_latencies.setdefault(stage, deque(maxlen=self.window)).append(latency)
+
+    def quantile(self, stage, q):
+        """
+        Returns the q-quantile of the stage's recent latencies, or None with too few samples.
+        """
+        with self._lock:
+            latencies = sorted(self.stage_to_latencies.get(stage, ()))
+        if len(latencies) < Config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[int(q * (len(latencies) - 1))]
+
+
+_LATENCIES = LatencyTracker()
+# requests of the synchronous path run in these threads, so that their deadline and hedge can be awaited
+_REQUEST_POOL = None
+_REQUEST_POOL_LOCK = threading.Lock()
+
+
+def _get_request_pool() -> ThreadPoolExecutor:
+    global _REQUEST_POOL
+    with _REQUEST_POOL_LOCK:
+        if _REQUEST_POOL is None:
+            _REQUEST_POOL = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-request")
+        return _REQUEST_POOL
+
+
+def _hedge_delay(stage):
+    if not Config.LLM_HEDGE_REQUESTS:
+        return None
+    hedge_delay = _LATENCIES.quantile(stage, Config.LLM_HEDGE_QUANTILE)
+    return hedge_delay if hedge_delay is not None and hedge_delay < Config.LLM_REQUEST_TIMEOUT else None
+
+
+def _log_latency(stage, latency, attempts, hedged, outcome):
+    append_event(Event(
+        level="DEBUG",
+        message=f"LLM request of stage {stage} finished in {latency:.1f}s ({outcome}, {attempts} attempts{', hedged' if hedged else ''})",
+        type="LLMLatency",
+        info={
+            "stage": stage,
+            "latency": latency,
+            "attempts": attempts,
+            "hedged": hedged,
+            "outcome": outcome,
+            "stage_p95": _LATENCIES.quantile(stage, 0.95)
+        }
+    ))
+
+
+def _log_retry(stage, attempt, error, delay):
+    append_event(Event(
+        level="WARNING",
+        message=f"LLM request of stage {stage} failed ({type(error).__name__}: {error!s}). Retrying in {delay:.1f}s (retry {attempt + 1}/{Config.LLM_MAX_RETRIES})...",
+        type="LLMRetry",
+        info={
+            "stage": stage,
+            "attempt": attempt + 1,
+            "error": f"{type(error).__name__}: {error!s}",
+            "delay": delay
+        }
+    ))
+
+
+def _charge_abandoned(futures, model):
+    """
+    Cancels the requests that have not started; the others are charged to the current LLM budget
+    if they complete successfully.
+    """
+    budget = get_llm_budget()
+
+    def charge(future):
+        if budget is not None and not future.cancelled() and future.exception() is None:
+            _, usage = future.result()
+            budget.charge(model, usage)
+
+    for future in futures:
+        if not future.cancel():
+            future.add_done_callback(charge)
+
+
+def _complete_hedged(backend, arguments, stage):
+    """
+    Sends the request, and a hedge if it is slower than the stage's hedge delay. Returns the first
+    successful (response, usage) and whether the request was hedged; raises TimeoutError past the deadline.
+    """
+    pool = _get_request_pool()
+    start_time = time.monotonic()
+    futures = [pool.submit(contextvars.copy_context().run, backend.complete, arguments)]
+    hedge_delay = _hedge_delay(stage)
+    if hedge_delay is not None:
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            futures.append(pool.submit(contextvars.copy_context().run, backend.complete, arguments))
+    pending = set(futures)
+    error = None
+    while pending:
+        remaining = Config.LLM_REQUEST_TIMEOUT - (time.monotonic() - start_time)
+        done, pending = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+        if not done:
+            _charge_abandoned(pending, arguments.get("model"))
+            raise TimeoutError(f"No LLM response within {Config.LLM_REQUEST_TIMEOUT}s.")
+        for future in done:
+            if future.exception() is None:
+                _charge_abandoned([other for other in futures if other is not future], arguments.get("model"))
+                return future.result(), len(futures) > 1
+            error = future.exception()
+    raise error
+
+
+async def _acomplete_hedged(backend, arguments, stage, limits):
+    async def request():
+        async with limits.llm if limits is not None else nullcontext():
+            return await backend.acomplete(arguments)
+
+    start_time = time.monotonic()
+    tasks = [asyncio.create_task(request())]
+    try:
+        hedge_delay = _hedge_delay(stage)
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                tasks.append(asyncio.create_task(request()))
+        pending = set(tasks)
+        error = None
+        while pending:
+            remaining = Config.LLM_REQUEST_TIMEOUT - (time.monotonic() - start_time)
+            done, pending = await asyncio.wait(pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"No LLM response within {Config.LLM_REQUEST_TIMEOUT}s.")
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), len(tasks) > 1
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def complete_with_retries(backend, arguments, stage="unknown"):
+    """
+    `backend.complete` with a deadline, retries of transient errors and hedging.
+    """
+    start_time = time.monotonic()
+    attempt = 0
+    while True:
+        request_start_time = time.monotonic()
+        try:
+            (response_msg, usage), hedged = _complete_hedged(backend, arguments, stage)
+        except Exception as e:
+            if attempt >= Config.LLM_MAX_RETRIES or not is_retryable(e):
+                _log_latency(stage, time.monotonic() - start_time, attempt + 1, False, type(e).__name__)
+                raise
+            delay = backoff_delay(attempt, e)
+            _log_retry(stage, attempt, e, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        _LATENCIES.record(stage, time.monotonic() - request_start_time)
+        _log_latency(stage, time.monotonic() - start_time, attempt + 1, hedged, "ok")
+        return response_msg, usage
+
+
+async def acomplete_with_retries(backend, arguments, stage="unknown", limits=None):
+    """
+    Awaitable variant of `complete_with_retries`, each request within the LLM limit of `limits`.
+    """
+    start_time = time.monotonic()
+    attempt = 0
+    while True:
+        request_start_time = time.monotonic()
+        try:
+            (response_msg, usage), hedged = await _acomplete_hedged(backend, arguments, stage, limits)
+        except Exception as e:
+            if attempt >= Config.LLM_MAX_RETRIES or not is_retryable(e):
+                _log_latency(stage, time.monotonic() - start_time, attempt + 1, False, type(e).__name__)
+                raise
+            delay = backoff_delay(attempt, e)
+            _log_retry(stage, attempt, e, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        _LATENCIES.record(stage, time.monotonic() - request_start_time)
+        _log_latency(stage, time.monotonic() - start_time, attempt + 1, hedged, "ok")
+        return response_msg, usage
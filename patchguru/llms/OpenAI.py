@@ -1,30 +1,47 @@
-import os
-
-from openai import OpenAI
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from patchguru import Config
 from patchguru.utils.Tracker import Event, append_event
 from patchguru.utils.Logger import format_info_frame
+from patchguru.utils.EventLoopBridge import get_bridge, run_on_loop
+from patchguru.llms.LLMCache import get_llm_cache
+from patchguru.llms.LLMBackend import get_llm_backend, set_llm_backend
+from patchguru.llms.LLMRetry import acomplete_with_retries, complete_with_retries
+from patchguru.llms.LLMBudget import LLMBudgetExceeded, can_query, estimate_tokens, get_llm_budget, get_rate_limiter
+from patchguru.prompts.AnswerParser import UnparsableAnswer
 
-OPENAI_KEY_EMPTY_MSG = "OpenAI API key is empty"
 
-with open(".openai_token") as f:
-    openai_key = f.read().strip()
-    if not openai_key:
+def init_llm(backend=None):
+    """
+    Explicitly initializes the LLM backend (Config.LLM_BACKEND unless `backend` is given).
+    Without it, the backend is created lazily on the first query.
+    """
+    if backend is not None:
+        set_llm_backend(backend)
+    try:
+        get_llm_backend().initialize()
+    except Exception as e:
         append_event(Event(
             level="ERROR",
-            message=OPENAI_KEY_EMPTY_MSG
+            message=f"Failed to initialize the LLM backend: {e!s}"
         ))
-        raise ValueError(OPENAI_KEY_EMPTY_MSG)
+        raise
 
-os.environ["OPENAI_API_KEY"] = openai_key
-client = OpenAI()
 
+def _completion_arguments(prompt, model, temperature, max_tokens, response_format=None):
+    if model.startswith("gpt-5"):
+        arguments = dict(model=model, messages=[{"role": "user", "content": prompt}], max_completion_tokens=max_tokens)
+    else:
+        arguments = dict(model=model, messages=[{"role": "user", "content": prompt}], temperature=temperature, max_tokens=max_tokens)
+    if response_format is not None:
+        arguments["response_format"] = response_format
+    return arguments
 
-def query_llm(prompt, model=Config.LLM_MODEL, temperature=0.7, max_tokens=16384):
-    """
-    Query the OpenAI API with the given prompt and parameters.
-    """
+
+def _log_query(prompt, model, temperature, max_tokens):
     append_event(Event(
         level="DEBUG",
         message= [
@@ -42,44 +59,264 @@ def query_llm(prompt, model=Config.LLM_MODEL, temperature=0.7, max_tokens=16384)
             "prompt": prompt
         }
     ))
-    try:
-        if model.startswith("gpt-5"):
-            response = client.chat.completions.create(
-                model=model, messages=[{"role": "user", "content": prompt}], max_completion_tokens=max_tokens
-            )
-        else:
-            response = client.chat.completions.create(
-                model=model, messages=[{"role": "user", "content": prompt}], temperature=temperature, max_tokens=max_tokens
-            )
-        response_msg = response.choices[0].message.content
-        usage = response.usage
+
+
+def _log_response(response_msg, usage, cached=False):
+    append_event(Event(
+        level="INFO",
+        message="OpenAI query completed successfully" + (" (replayed from cache)" if cached else "")
+    ))
+    append_event(Event(
+        level="DEBUG",
+        message=[
+            "___OpenAI Response___",
+            f"Response length: {len(response_msg)} characters",
+            f"Completion Tokens: {usage['completion_tokens']}",
+            f"Prompt Tokens: {usage['prompt_tokens']}",
+            f"Total Tokens: {usage['total_tokens']}",
+            f"Cached Prompt Tokens: {usage.get('cached_tokens', 0)}",
+            f"Response:\n{format_info_frame(response_msg, 'LLM RESPONSE')}..."
+        ],
+        type="LLMQuery",
+        info={
+            "response_length": len(response_msg),
+            "response": response_msg,
+            "completion_tokens": usage["completion_tokens"],
+            "prompt_tokens": usage["prompt_tokens"],
+            "total_tokens": usage["total_tokens"],
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "cached": cached
+        }
+    ))
+    return response_msg
+
+
+def _reserve_query(prompt, model, max_tokens):
+    """
+    Checks that the current budget can afford the query and reserves it in the shared rate limiter.
+    Returns the estimated tokens of the query and how long to wait before sending it.
+    """
+    estimated_tokens = estimate_tokens(prompt, max_tokens)
+    budget = get_llm_budget()
+    if budget is not None and not budget.can_afford(estimated_tokens, model):
         append_event(Event(
-            level="INFO",
-            message="OpenAI query completed successfully"
+            level="ERROR",
+            message=f"LLM budget {budget.name} cannot afford another query.",
+            type="BudgetExhausted",
+            info=budget.summary()
         ))
+        raise LLMBudgetExceeded(f"LLM budget {budget.name} cannot afford another query.")
+    delay = get_rate_limiter().reserve(estimated_tokens)
+    if delay > 0:
         append_event(Event(
             level="DEBUG",
-            message=[
-                "___OpenAI Response___",
-                f"Response length: {len(response_msg)} characters",
-                f"Completion Tokens: {usage.completion_tokens}",
-                f"Prompt Tokens: {usage.prompt_tokens}",
-                f"Total Tokens: {usage.total_tokens}",
-                f"Response:\n{format_info_frame(response_msg, 'LLM RESPONSE')}..."
-            ],
-            type="LLMQuery",
+            message=f"Rate limit reached, delaying the query by {delay:.1f}s",
+            type="RateLimited",
             info={
-                "response_length": len(response_msg),
-                "response": response_msg,
-                "completion_tokens": usage.completion_tokens,
-                "prompt_tokens": usage.prompt_tokens,
-                "total_tokens": usage.total_tokens
+                "delay": delay,
+                "estimated_tokens": estimated_tokens
             }
         ))
-        return response_msg
+    return estimated_tokens, delay
+
+
+def _charge_query(model, usage, estimated_tokens=None, cached=False):
+    if not cached:
+        get_rate_limiter().settle(estimated_tokens, usage["total_tokens"])
+    budget = get_llm_budget()
+    if budget is not None:
+        budget.charge(model, usage, cached)
+
+
+
+
+def query_llm(prompt, model=Config.LLM_MODEL, temperature=0.7, max_tokens=16384, stage="unknown", response_format=None):
+    """
+    Query the LLM backend (the OpenAI API by default, see `LLMBackend`) with the given prompt and parameters.
+    Transient errors are retried and slow requests hedged (see `LLMRetry`); latencies are reported per `stage`.
+    `response_format` requests structured output (e.g., the JSON schema of `AnswerParser.response_format`).
+    """
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.key(model, temperature, max_tokens, prompt, response_format)
+    cached = llm_cache.lookup(cache_key)
+    if cached is not None:
+        _log_query(prompt, model, temperature, max_tokens)
+        _charge_query(model, cached["usage"], cached=True)
+        return _log_response(cached["response"], cached["usage"], cached=True)
+    # a query the budget cannot afford is rejected before it is logged
+    estimated_tokens, delay = _reserve_query(prompt, model, max_tokens)
+    _log_query(prompt, model, temperature, max_tokens)
+    time.sleep(delay)
+    try:
+        arguments = _completion_arguments(prompt, model, temperature, max_tokens, response_format)
+        bridge = get_bridge()
+        if bridge is not None:
+            # called from a stage of the asyncio pipeline: send the request from its event loop, within its LLM limit
+            response_msg, usage = run_on_loop(acomplete_with_retries(get_llm_backend(), arguments, stage, bridge[1]))
+        else:
+            response_msg, usage = complete_with_retries(get_llm_backend(), arguments, stage)
+        _charge_query(model, usage, estimated_tokens)
+        llm_cache.record(cache_key, response_msg, usage)
+        return _log_response(response_msg, usage)
+    except Exception as e:
+        get_rate_limiter().settle(estimated_tokens, 0)
+        append_event(Event(
+            level="ERROR",
+            message=f"OpenAI query failed: {e!s}"
+        ))
+        raise
+
+
+async def async_query_llm(prompt, model=Config.LLM_MODEL, temperature=0.7, max_tokens=16384, limits=None, stage="unknown", response_format=None):
+    """
+    Awaitable variant of `query_llm` (built on AsyncOpenAI for the OpenAI backend), optionally within the LLM limit of `limits`.
+    """
+    llm_cache = get_llm_cache()
+    cache_key = llm_cache.key(model, temperature, max_tokens, prompt, response_format)
+    cached = llm_cache.lookup(cache_key)
+    if cached is not None:
+        _log_query(prompt, model, temperature, max_tokens)
+        _charge_query(model, cached["usage"], cached=True)
+        return _log_response(cached["response"], cached["usage"], cached=True)
+    # a query the budget cannot afford is rejected before it is logged
+    estimated_tokens, delay = _reserve_query(prompt, model, max_tokens)
+    _log_query(prompt, model, temperature, max_tokens)
+    await asyncio.sleep(delay)
+    try:
+        response_msg, usage = await acomplete_with_retries(
+            get_llm_backend(), _completion_arguments(prompt, model, temperature, max_tokens, response_format), stage, limits)
+        _charge_query(model, usage, estimated_tokens)
+        llm_cache.record(cache_key, response_msg, usage)
+        return _log_response(response_msg, usage)
     except Exception as e:
+        get_rate_limiter().settle(estimated_tokens, 0)
         append_event(Event(
             level="ERROR",
             message=f"OpenAI query failed: {e!s}"
         ))
         raise
+
+
+def query_llm_until_valid(prompt, accept, max_queries, samples=1, stage="unknown", response_format=None):
+    """
+    Queries the LLM with the same prompt until `accept` (which returns the accepted result, or None to
+    reject the response) accepts a response, at most `max_queries` times, with rounds of `samples`
+    concurrent queries. The responses of a round are checked in submission order, not in completion
+    order, so that a replay from the LLM cache accepts the same sample as the recorded run. Once one is
+    accepted, the other queries of the round are cancelled in the asyncio pipeline; elsewhere they
+    complete in the background. Returns the accepted result (None if none was accepted) and the number
+    of queries sent. An exception raised by `accept` stops the queries and propagates.
+    """
+    bridge = get_bridge()
+    if bridge is not None:
+        return run_on_loop(async_query_llm_until_valid(prompt, accept, max_queries, samples, stage, bridge[1], response_format))
+    n_queries = 0
+    pool = ThreadPoolExecutor(max_workers=samples)
+    try:
+        while n_queries < max_queries and can_query(prompt):
+            futures = [
+                pool.submit(contextvars.copy_context().run, query_llm, prompt, stage=stage, response_format=response_format)
+                for _ in range(min(samples, max_queries - n_queries))
+            ]
+            n_queries += len(futures)
+            for future in futures:
+                accepted = accept(future.result())
+                if accepted is not None:
+                    return accepted, n_queries
+        return None, n_queries
+    finally:
+        pool.shutdown(wait=False)
+
+
+async def async_query_llm_until_valid(prompt, accept, max_queries, samples=1, stage="unknown", limits=None, response_format=None):
+    """
+    Awaitable variant of `query_llm_until_valid`. Only the queries answered before acceptance are counted,
+    the others are cancelled before their response is logged.
+    """
+    n_queries = 0
+    while n_queries < max_queries and can_query(prompt):
+        tasks = [
+            asyncio.create_task(async_query_llm(prompt, limits=limits, stage=stage, response_format=response_format))
+            for _ in range(min(samples, max_queries - n_queries))
+        ]
+        try:
+            for task in tasks:
+                response = await task
+                n_queries += 1
+                accepted = accept(response)
+                if accepted is not None:
+                    return accepted, n_queries
+        finally:
+            for task in tasks:
+                task.cancel()
+    return None, n_queries
+
+
+def sample_valid_answer(prompt, prompt_template, function_name, max_queries, samples, stage, task):
+    """
+    Samples answers to the prompt with `query_llm_until_valid` and returns the first one that
+    `prompt_template` parses and finds valid for the function (None if none is), and the number of
+    queries sent. An unparsable answer is logged as a failure of the `task` (e.g., "intent analysis")
+    and raises `UnparsableAnswer`, since the analyses give up at one as their serial retries do.
+    """
+    def accept(response):
+        candidate = prompt_template.parse_answer(response)
+        if candidate is None:
+            raise UnparsableAnswer()
+        if not prompt_template.check_valid(candidate, function_name):
+            return None
+        return candidate
+
+    append_event(Event(
+        level="DEBUG",
+        message=f"Querying LLM for {task} with {samples} concurrent candidates (at most {max_queries})..."
+    ))
+    try:
+        return query_llm_until_valid(
+            prompt, accept, max_queries, samples, stage=stage, response_format=prompt_template.response_format())
+    except UnparsableAnswer:
+        append_event(Event(
+            level="ERROR",
+            message=f"Failed to parse LLM response for {task}"
+        ))
+        raise
+
+
+def query_valid_answer(prompt, prompt_template, function_name, max_queries, stage, task, samples=1):
+    """
+    Queries the LLM until `prompt_template` parses an answer it finds valid for the function, at
+    most `max_queries` times and only while the LLM budget can afford the prompt, with concurrent
+    samples if `samples` > 1 (see `sample_valid_answer`). Returns the valid answer, or None if an
+    answer is unparsable or none is valid, and the number of queries sent.
+    """
+    n_queries = 0
+    if samples > 1:
+        try:
+            answer, n_queries = sample_valid_answer(
+                prompt, prompt_template, function_name, max_queries, samples, stage, task)
+        except UnparsableAnswer:
+            return None, n_queries
+        if answer is not None:
+            return answer, n_queries
+    # retry invalid answers while the LLM budget can afford them
+    while n_queries < max_queries and can_query(prompt):
+        append_event(Event(
+            level="DEBUG",
+            message=f"Querying LLM for {task} (Attempt {n_queries + 1}/{max_queries})..."
+        ))
+        response = query_llm(prompt, stage=stage, response_format=prompt_template.response_format())
+        n_queries += 1
+        answer = prompt_template.parse_answer(response)
+        if answer is None:
+            append_event(Event(
+                level="ERROR",
+                message=f"Failed to parse LLM response for {task}"
+            ))
+            return None, n_queries
+        if prompt_template.check_valid(answer, function_name):
+            return answer, n_queries
+    append_event(Event(
+        level="ERROR",
+        message=f"Failed to get a valid response from LLM after {max_queries} attempts"
+    ))
+    return None, n_queries
@@ -0,0 +1,78 @@
+"""
+Local OpenAI-compatible chat-completions server answering with recorded responses.
+
+Run it, then point the OpenAI backend at it to benchmark the pipeline end to end without the network:
+
+    python -m patchguru.llms.StubServer --fixtures "logs/**/llm_usage.json" --port 8400 --latency 2.0
+
+and set `Config.OPENAI_BASE_URL = "http://localhost:8400/v1"`.
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from patchguru import Config
+from patchguru.llms.LLMBackend import FixtureBackend
+
+
+def create_handler(backend: FixtureBackend):
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown endpoint: {self.path}"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            arguments = json.loads(self.rfile.read(length).decode("utf-8"))
+            try:
+                response_msg, usage = backend.complete(arguments)
+            except LookupError as e:
+                self._send_json(404, {"error": {"message": str(e)}})
+                return
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": arguments.get("model", Config.LLM_MODEL),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": response_msg},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "completion_tokens": usage["completion_tokens"],
+                    "prompt_tokens": usage["prompt_tokens"],
+                    "total_tokens": usage["total_tokens"],
+                    "prompt_tokens_details": {"cached_tokens": usage.get("cached_tokens", 0)}
+                }
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChatCompletionsHandler
+
+
+def serve(backend: FixtureBackend, host="localhost", port=8400):
+    server = ThreadingHTTPServer((host, port), create_handler(backend))
+    print(f"Serving {len(backend.recorded)} recorded responses on http://{host}:{port}/v1 with latency {backend.latency}s")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server answering with recorded LLM responses")
+    parser.add_argument("--fixtures", type=str, nargs="+", default=Config.LLM_FIXTURE_FILES, help="Recorded llm_usage.json files or glob patterns")
+    parser.add_argument("--latency", type=float, default=Config.LLM_FIXTURE_LATENCY, help="Seconds to wait before answering")
+    parser.add_argument("--strict", action="store_true", help="Answer unknown prompts with an error instead of recorded responses round-robin")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=8400)
+    args = parser.parse_args()
+    serve(FixtureBackend(args.fixtures, args.latency, args.strict), args.host, args.port)
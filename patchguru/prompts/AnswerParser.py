@@ -0,0 +1,140 @@
+"""
+Shared parser of LLM answers. Answers either wrap their sections in tags (<reasoning>...</reasoning>),
+as asked by the output format instructions of the prompts, or, in structured-output mode
+(Config.LLM_STRUCTURED_OUTPUT), are JSON objects with one string field per tag, as enforced by the
+JSON schema sent with the query. Parse failures are counted per template and reported as
+`ParseFailure` events.
+"""
+import json
+import re
+import threading
+from patchguru import Config
+from patchguru.utils.Tracker import Event, append_event
+
+_PYTHON_FENCE = re.compile(r"```python(.*?)(?:```|\Z)", re.DOTALL)
+_FENCE = re.compile(r"```(.*?)(?:```|\Z)", re.DOTALL)
+
+# template name -> [parsed answers, failed answers]
+_STATISTICS = {}
+_STATISTICS_LOCK = threading.Lock()
+
+
+class UnparsableAnswer(Exception):
+    """
+    Raised by the `accept` callbacks of `query_llm_until_valid` to stop sampling at an answer that
+    cannot be parsed, as the sequential retry loops stop at one.
+    """
+
+
+def strip_code_fence(code: str) -> str:
+    """
+    Returns the content of the first (python) code fence of the text, or the text without fences.
+    """
+    if "```" not in code:
+        return code
+    match = _PYTHON_FENCE.search(code) if "```python" in code else _FENCE.search(code)
+    return match.group(1).strip()
+
+
+def parse_statistics() -> dict:
+    """
+    Returns the number of parsed answers, failures and failure rate of each template.
+    """
+    with _STATISTICS_LOCK:
+        return {
+            template: {"answers": answers, "failures": failures, "failure_rate": failures / answers}
+            for template, (answers, failures) in _STATISTICS.items()
+        }
+
+
+class AnswerParser:
+    """
+    Extracts the `required_tags` and `optional_tags` sections of the answers of a prompt template,
+    stored under their tag name unless renamed in `keys`. Sections in `code_tags` are unwrapped
+    from their code fence.
+    """
+
+    def __init__(self, template_name, required_tags, optional_tags=(), code_tags=(), keys=None):
+        self.template_name = template_name
+        self.required_tags = list(required_tags)
+        self.optional_tags = list(optional_tags)
+        self.code_tags = set(code_tags)
+        self.keys = keys or {}
+        self.tag_patterns = {
+            tag: re.compile(rf"<{tag}>(.*?)</{tag}>", re.DOTALL)
+            for tag in self.optional_tags + self.required_tags
+        }
+
+    def response_format(self):
+        """
+        The JSON schema of the answers, sent with the query in structured-output mode, else None.
+        """
+        if not Config.LLM_STRUCTURED_OUTPUT:
+            return None
+        tags = self.optional_tags + self.required_tags
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": self.template_name,
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {tag: {"type": "string"} for tag in tags},
+                    "required": tags,
+                    "additionalProperties": False
+                }
+            }
+        }
+
+    def _sections(self, answer) -> dict:
+        if answer.lstrip().startswith("{"):
+            try:
+                fields = json.loads(answer)
+                if isinstance(fields, dict):
+                    return {tag: fields[tag] for tag in self.tag_patterns if isinstance(fields.get(tag), str)}
+            except json.JSONDecodeError:
+                pass
+        sections = {}
+        for tag, pattern in self.tag_patterns.items():
+            match = pattern.search(answer)
+            if match is not None:
+                sections[tag] = match.group(1)
+        return sections
+
+    def _record(self, failed):
+        with _STATISTICS_LOCK:
+            statistics = _STATISTICS.setdefault(self.template_name, [0, 0])
+            statistics[0] += 1
+            statistics[1] += int(failed)
+            return statistics[1] / statistics[0]
+
+    def parse(self, answer: str) -> dict | None:
+        sections = self._sections(answer)
+        for tag in self.optional_tags:
+            if tag not in sections:
+                append_event(Event(
+                    level="WARNING",
+                    message=f"Missing required tag: <{tag}>"
+                ))
+        missing_tags = [tag for tag in self.required_tags if tag not in sections]
+        failure_rate = self._record(len(missing_tags) > 0)
+        if len(missing_tags) > 0:
+            append_event(Event(
+                level="ERROR",
+                message=f"LLM response is missing required tag: <{missing_tags[0]}>",
+                type="ParseFailure",
+                info={
+                    "template": self.template_name,
+                    "missing_tags": missing_tags,
+                    "failure_rate": failure_rate
+                }
+            ))
+            return None
+
+        results = {}
+        for tag, section in sections.items():
+            section = section.strip()
+            if tag in self.code_tags:
+                section = strip_code_fence(section)
+            results[self.keys.get(tag, tag)] = section
+        return results
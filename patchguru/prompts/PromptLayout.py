@@ -0,0 +1,19 @@
+"""
+Prompts are laid out as a static prefix (role, guidelines, output format instructions) followed by
+a variable suffix (the inputs of the query). The prefix is byte-identical across the queries of a
+template version, so that provider-side prompt caching reuses it; the savings are reported as
+`cached_tokens` in `llm_usage.json`.
+"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def render_static(template: str) -> str:
+    """
+    Renders a static section (without placeholders, with doubled braces escaped) once per template version.
+    """
+    return template.format()
+
+
+def assemble_prompt(static_template: str, input_template: str, **inputs) -> str:
+    return render_static(static_template) + input_template.format(**inputs)
@@ -1,20 +1,10 @@
+from patchguru.prompts.AnswerParser import AnswerParser
+from patchguru.prompts.PromptLayout import assemble_prompt
 from patchguru.utils.Tracker import Event, append_event
 
-class BugTriggerPrompt:
-    def __init__(self):
-        pass
 
-    def create_prompt(
-        self,
-        specification: str,
-        pull_request_details: str,
-        prev_fut_code: str,
-        prev_fut_names: str,
-        post_fut_code: str,
-        enclosing_class: str = "",
-        available_import: str = "",
-    ) -> str:
-        template = """
+# role, guidelines and output format: the static prefix shared by all queries
+STATIC_TEMPLATE = """
 # Role
 You are an expert software developer. You will be provided an specification written in form of Python assertions that describes the relationship between the pre-PR and post-PR versions of the function(s). Your task is to generate more potential input test cases for the assertions in the specification. These test cases should be designed to trigger potential bugs in the post-PR version of the function(s). Your goal is to create test cases that can effectively validate the correctness of the post-PR implementation.
 
@@ -60,39 +50,6 @@ This understanding will help you focus your testing on the most relevant aspects
     Each generated test case should ideally test one specific concept or bug trigger. Clearly document the **intent** of each generated test (e.g., "Test for off-by-one error at maximum allowed size," or "Test for type conversion failure with float input").
 
 
-# Input
-
-You will be provided specification written in Python assertions that describes the relationship between the pre-PR and post-PR versions of the function(s), along with pull request details, including the PR title, description, and conversations between developers,the source code of the function(s) before and after PR, as follows:
-
-## Specification
-
-{specification}
-
-## Pull Request Details
-
-{pr_details}
-
-## Enclosing Class of target function (s) (If Applicable)
-
-{context}
-
-## Source code of target function(s) before the pull request
-
-```python
-{prev_fut_code}
-```
-
-## Source code of target function(s) after the pull request
-
-```python
-{post_fut_code}
-```
-
-## Available Imports
-You can also refer to the available imports and assume they are already imported in the test driver:
-```python
-{available_import}
-```
 
 # Output Format Instructions
 
@@ -102,7 +59,7 @@ You can also refer to the available imports and assume they are already imported
 
 3. Test drivers should be carefully documented in the comments to describe how test cases are generated and what behaviors they are testing.
 
-4. MUST NOT provide concrete implementation of the function(s) {prev_fut_names} in the test driver. These concrete implementations will be added later in the placeholders in the section "# Source Code of target function(s)".
+4. MUST NOT provide concrete implementation of the target function(s) listed in the input in the test driver. These concrete implementations will be added later in the placeholders in the section "# Source Code of target function(s)".
 
 5. DON'T USE pytest or unittest libraries in the test drivers. Instead, use Python's built-in assert statements to create assertions.
 
@@ -135,7 +92,66 @@ You can also refer to the available imports and assume they are already imported
 ## [Put your generalized specification with added test cases here. Make sure to keep existing information intact and only add more test cases or generalize existing assertions.]
 
 </test_driver>
-        """
+"""
+
+# inputs of the query: the variable suffix
+INPUT_TEMPLATE = """
+# Input
+
+You will be provided specification written in Python assertions that describes the relationship between the pre-PR and post-PR versions of the function(s), along with pull request details, including the PR title, description, and conversations between developers,the source code of the function(s) before and after PR, as follows:
+
+## Specification
+
+{specification}
+
+## Pull Request Details
+
+{pr_details}
+
+## Enclosing Class of target function (s) (If Applicable)
+
+{context}
+
+## Source code of target function(s) before the pull request
+
+```python
+{prev_fut_code}
+```
+
+## Source code of target function(s) after the pull request
+
+```python
+{post_fut_code}
+```
+
+## Available Imports
+You can also refer to the available imports and assume they are already imported in the test driver:
+```python
+{available_import}
+```
+
+## Target Function(s)
+
+{prev_fut_names}
+"""
+
+ANSWER_PARSER = AnswerParser("BugTriggerPromptV1", ["test_driver"], optional_tags=["reasoning", "hypothesis"], code_tags=["test_driver"], keys={"test_driver": "specification"})
+
+
+class BugTriggerPrompt:
+    def __init__(self):
+        pass
+
+    def create_prompt(
+        self,
+        specification: str,
+        pull_request_details: str,
+        prev_fut_code: str,
+        prev_fut_names: str,
+        post_fut_code: str,
+        enclosing_class: str = "",
+        available_import: str = "",
+    ) -> str:
         if len(enclosing_class) > 0:
             if len(enclosing_class) > 3000:
                 enclosing_class = enclosing_class[:3000]
@@ -149,7 +165,9 @@ Target function (s) are defined in the following class:
 """
         else:
             context = "Target function(s) are defined in the global scope. There is no enclosing class."
-        query = template.format(
+        query = assemble_prompt(
+            STATIC_TEMPLATE,
+            INPUT_TEMPLATE,
             specification=specification,
             pr_details=pull_request_details,
             prev_fut_code=prev_fut_code,
@@ -161,55 +179,10 @@ Target function (s) are defined in the following class:
         return query
 
     def parse_answer(self, answer: str) -> dict | None:
-        results = {}
-        if "<reasoning>" not in answer or "</reasoning>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="Missing required tag: <reasoning>"
-            ))
-        else:
-            reasoning_start = answer.index("<reasoning>") + len("<reasoning>")
-            reasoning_end = answer.index("</reasoning>")
-            results["reasoning"] = answer[reasoning_start:reasoning_end].strip()
-
-
-        if "<hypothesis>" not in answer or "</hypothesis>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="<issing required tag: <hypothesis>"
-            ))
-        else:
-            hypothesis_start = answer.index("<hypothesis>") + len("<hypothesis>")
-            hypothesis_end = answer.index("</hypothesis>")
-            results["hypothesis"] = answer[hypothesis_start:hypothesis_end].strip()
-
-        if "<test_driver>" not in answer or "</test_driver>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="LLM response is missing required tag: <test_driver>"
-            ))
-            return None
-
-        try:
-            specification_start = answer.index("<test_driver>") + len("<test_driver>")
-            specification_end = answer.index("</test_driver>")
-            specification = answer[specification_start:specification_end].strip()
-
-            if "```" in specification:
-                if "```python" in specification:
-                    specification = specification.split("```python")[1].split("```")[0].strip()
-                else:
-                    specification = specification.split("```")[1].split("```")[0].strip()
-            results["specification"] = specification
-
-        except ValueError as e:
-            append_event(Event(
-                level="ERROR",
-                message=f"Error while parsing LLM response: {e}"
-            ))
-            return None
+        return ANSWER_PARSER.parse(answer)
 
-        return results
+    def response_format(self):
+        return ANSWER_PARSER.response_format()
 
     def check_valid(self, parsed_response: str, func_name: str) -> bool:
         specification = parsed_response["specification"]
@@ -1,11 +1,10 @@
+from patchguru.prompts.AnswerParser import AnswerParser
+from patchguru.prompts.PromptLayout import assemble_prompt
 from patchguru.utils.Tracker import Event, append_event
 
-class SyntaxErrorRepairPrompt:
-    def __init__(self):
-        pass
 
-    def create_prompt(self, code, error_message):
-        template = """
+# role, guidelines and output format: the static prefix shared by all queries
+STATIC_TEMPLATE = """
 # Role
 You are an expert Python software engineer. Your task is to correct syntax errors in the provided Python code based on the accompanying error message.
 
@@ -22,6 +21,26 @@ You are an expert Python software engineer. Your task is to correct syntax error
     * **Incorrect Indentation:** Python uses indentation to define code blocks. Mixing spaces and tabs or having an inconsistent number of spaces will cause an `IndentationError`.
     * **Missing Dependencies:** Ensure all necessary imports are present and correctly spelled.
 
+
+# Output Format Instructions
+
+1. Make sure that fixed code is structurally similar to the input code. The fixed code should still contain three main sections: "# Neccessary imports", "# Specification", and "# Source Code of target function(s)".
+
+2. You can assume that the "# Source Code of target function(s)" section is unchanged and do not need to provide it again in your response. But you should still include the section header "# Source Code of target function(s)" between # Neccessary imports and # Specification sections in your response.
+
+3. Provide your response in the following format:
+
+<reasoning>
+[Put your reasoning chain here including the analysis of the error message and the test driver code. This should include your thought process on how you arrived at the fix.]
+</reasoning>
+
+<fixed_code>
+[Put the fixed code here that resolves the syntax error. Ensure that the code is executable and maintains the original semantics of the test driver.]
+</fixed_code>
+"""
+
+# inputs of the query: the variable suffix
+INPUT_TEMPLATE = """
 # Input
 
 You will be provided a test driver that is used to validate the expected relationship between two versions of a function: before and after a pull request. The code is expected to run without errors. However, it is currently faced with SYNTAX errors as follows:
@@ -37,67 +56,29 @@ You will be provided a test driver that is used to validate the expected relatio
 ```
 {error_message}
 ```
+"""
 
-# Output Format Instructions
-
-1. Make sure that fixed code is structurally similar to the input code. The fixed code should still contain three main sections: "# Neccessary imports", "# Specification", and "# Source Code of target function(s)".
-
-2. You can assume that the "# Source Code of target function(s)" section is unchanged and do not need to provide it again in your response. But you should still include the section header "# Source Code of target function(s)" between # Neccessary imports and # Specification sections in your response.
+ANSWER_PARSER = AnswerParser("SyntaxErrorRepairPromptV1", ["fixed_code"], optional_tags=["reasoning"], code_tags=["fixed_code"])
 
-3. Provide your response in the following format:
 
-<reasoning>
-[Put your reasoning chain here including the analysis of the error message and the test driver code. This should include your thought process on how you arrived at the fix.]
-</reasoning>
+class SyntaxErrorRepairPrompt:
+    def __init__(self):
+        pass
 
-<fixed_code>
-[Put the fixed code here that resolves the syntax error. Ensure that the code is executable and maintains the original semantics of the test driver.]
-</fixed_code>
-    """
-        query = template.format(
+    def create_prompt(self, code, error_message):
+        query = assemble_prompt(
+            STATIC_TEMPLATE,
+            INPUT_TEMPLATE,
             code=code,
             error_message=error_message
         )
         return query
 
     def parse_answer(self, answer):
-        results = {}
-        if "<reasoning>" not in answer or "</reasoning>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="Missing required tag: <reasoning>"
-            ))
-        else:
-            reasoning_start = answer.index("<reasoning>") + len("<reasoning>")
-            reasoning_end = answer.index("</reasoning>")
-            results["reasoning"] = answer[reasoning_start:reasoning_end].strip()
-
-        if "<fixed_code>" not in answer or "</fixed_code>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="Missing required tag: <fixed_code>"
-            ))
-            return None
-
-        try:
-            fixed_code_start = answer.index("<fixed_code>") + len("<fixed_code>")
-            fixed_code_end = answer.index("</fixed_code>")
-            fixed_code = answer[fixed_code_start:fixed_code_end].strip()
-
-            if "```" in fixed_code:
-                if "```python" in fixed_code:
-                    fixed_code = fixed_code.split("```python")[1].split("```")[0].strip()
-                else:
-                    fixed_code = fixed_code.split("```")[1].split("```")[0].strip()
-
-            results["fixed_code"] = fixed_code
-        except ValueError as e:
-            append_event(Event(
-                level="ERROR",
-                message=f"Error while parsing answer: {str(e)}"
-            ))
-            return None
-        return results
+        return ANSWER_PARSER.parse(answer)
+
+    def response_format(self):
+        return ANSWER_PARSER.response_format()
 
     def insert_code(self, prev_fut_code: str, post_fut_code: str, specification: str) -> str:
             """
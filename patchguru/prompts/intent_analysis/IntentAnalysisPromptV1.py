@@ -1,19 +1,10 @@
+from patchguru.prompts.AnswerParser import AnswerParser
+from patchguru.prompts.PromptLayout import assemble_prompt
 from patchguru.utils.Tracker import Event, append_event
 
-class IntentAnalysisPrompt:
-    def __init__(self):
-        pass
 
-    def create_prompt(
-        self,
-        pull_request_details: str,
-        prev_fut_code: str,
-        prev_fut_names: str,
-        post_fut_signatures: str,
-        available_import: str = "",
-        enclosing_class: str = "",
-    ) -> str:
-        template = """
+# role, guidelines and output format: the static prefix shared by all queries
+STATIC_TEMPLATE = """
 # Role
 You are an expert software developer. Your task is to:
 - Infer the developer's intent behind the pull request (PR).
@@ -140,35 +131,6 @@ if __name__ == "__main__":
 ```
 8.  **Document and Explain:** In your review, present your findings clearly and concisely. Start by stating the inferred intent, provide the test driver code, and then explain exactly what the assertions prove. This makes your review a clear, actionable guide for the developer.
 
-# Input
-
-You will be provided the pull request details, including the PR title, description, and conversations between developers, and the source code of the function(s) before the PR, as follows:
-
-## Pull Request Details
-
-{pr_details}
-
-## Enclosing Class of target function (s) (If Applicable)
-
-{context}
-
-## Source code of target function(s) before the pull request
-
-```python
-{prev_fut_code}
-```
-
-## Function signatures of target function(s) after the pull request
-
-```python
-{post_fut_signatures}
-```
-
-## Available Imports
-You can also refer to the available imports and assume they are already imported in the test driver:
-```python
-{available_import}
-```
 
 # Output Format Instructions
 
@@ -181,7 +143,7 @@ You can also refer to the available imports and assume they are already imported
 
 3. Test drivers should be carefully documented in the comments to describe how test cases are generated and what behaviors they are testing.
 
-4. MUST NOT provide concrete implementation of the function(s) {prev_fut_names} in the test driver. These concrete implementations will be added later in the placeholders in the section "# Source Code of target function(s)".
+4. MUST NOT provide concrete implementation of the target function(s) listed in the input in the test driver. These concrete implementations will be added later in the placeholders in the section "# Source Code of target function(s)".
 
 5. DON'T USE pytest or unittest libraries in the test drivers. Instead, use Python's built-in assert statements to create assertions.
 
@@ -214,7 +176,61 @@ You can also refer to the available imports and assume they are already imported
 ## [Put Python assertions comparing the pre-PR and post-PR versions of the function(s) here, along with a main function to execute the assertions. DON'T PROVIDE concrete implementation or placeholders for target function(s) here. These will be added later in the placeholders in the section "# Source Code of target function(s)".]
 
 </test_driver>
-        """
+"""
+
+# inputs of the query: the variable suffix
+INPUT_TEMPLATE = """
+# Input
+
+You will be provided the pull request details, including the PR title, description, and conversations between developers, and the source code of the function(s) before the PR, as follows:
+
+## Pull Request Details
+
+{pr_details}
+
+## Enclosing Class of target function (s) (If Applicable)
+
+{context}
+
+## Source code of target function(s) before the pull request
+
+```python
+{prev_fut_code}
+```
+
+## Function signatures of target function(s) after the pull request
+
+```python
+{post_fut_signatures}
+```
+
+## Available Imports
+You can also refer to the available imports and assume they are already imported in the test driver:
+```python
+{available_import}
+```
+
+## Target Function(s)
+
+{prev_fut_names}
+"""
+
+ANSWER_PARSER = AnswerParser("IntentAnalysisPromptV1", ["test_driver"], optional_tags=["reasoning", "hypothesis"], code_tags=["test_driver"], keys={"test_driver": "specification"})
+
+
+class IntentAnalysisPrompt:
+    def __init__(self):
+        pass
+
+    def create_prompt(
+        self,
+        pull_request_details: str,
+        prev_fut_code: str,
+        prev_fut_names: str,
+        post_fut_signatures: str,
+        available_import: str = "",
+        enclosing_class: str = "",
+    ) -> str:
         if len(enclosing_class) > 0:
             if len(enclosing_class) > 3000:
                 enclosing_class = enclosing_class[:3000]
@@ -228,7 +244,9 @@ Target function (s) are defined in the following class:
 """
         else:
             context = "Target function(s) are defined in the global scope. There is no enclosing class."
-        query = template.format(
+        query = assemble_prompt(
+            STATIC_TEMPLATE,
+            INPUT_TEMPLATE,
             pr_details=pull_request_details,
             prev_fut_code=prev_fut_code,
             prev_fut_names=prev_fut_names,
@@ -239,55 +257,10 @@ Target function (s) are defined in the following class:
         return query
 
     def parse_answer(self, answer: str) -> dict | None:
-        results = {}
-        if "<reasoning>" not in answer or "</reasoning>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="Missing required tag: <reasoning>"
-            ))
-        else:
-            reasoning_start = answer.index("<reasoning>") + len("<reasoning>")
-            reasoning_end = answer.index("</reasoning>")
-            results["reasoning"] = answer[reasoning_start:reasoning_end].strip()
-
-
-        if "<hypothesis>" not in answer or "</hypothesis>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="<issing required tag: <hypothesis>"
-            ))
-        else:
-            hypothesis_start = answer.index("<hypothesis>") + len("<hypothesis>")
-            hypothesis_end = answer.index("</hypothesis>")
-            results["hypothesis"] = answer[hypothesis_start:hypothesis_end].strip()
-
-        if "<test_driver>" not in answer or "</test_driver>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="LLM response is missing required tag: <test_driver>"
-            ))
-            return None
-
-        try:
-            specification_start = answer.index("<test_driver>") + len("<test_driver>")
-            specification_end = answer.index("</test_driver>")
-            specification = answer[specification_start:specification_end].strip()
-
-            if "```" in specification:
-                if "```python" in specification:
-                    specification = specification.split("```python")[1].split("```")[0].strip()
-                else:
-                    specification = specification.split("```")[1].split("```")[0].strip()
-            results["specification"] = specification
-
-        except ValueError as e:
-            append_event(Event(
-                level="ERROR",
-                message=f"Error while parsing LLM response: {e}"
-            ))
-            return None
+        return ANSWER_PARSER.parse(answer)
 
-        return results
+    def response_format(self):
+        return ANSWER_PARSER.response_format()
 
     def check_valid(self, parsed_response: str, func_name: str) -> bool:
         specification = parsed_response["specification"]
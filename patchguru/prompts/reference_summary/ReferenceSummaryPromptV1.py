@@ -1,15 +1,9 @@
-from patchguru.utils.Tracker import Event, append_event
+from patchguru.prompts.AnswerParser import AnswerParser
+from patchguru.prompts.PromptLayout import assemble_prompt
 
-class ReferenceSummaryPrompt:
-    def __init__(self):
-        pass
 
-    def create_prompt(
-        self,
-        pull_request_details: str,
-        references: str
-    ) -> str:
-        template = """
+# role, guidelines and output format: the static prefix shared by all queries
+STATIC_TEMPLATE = """
 # Role
 You are an expert software developer. Your task is to extract and summarize relevant information of a pull request (PR) from its references, such as linked issues and related pull requests. This summary will help reviewers and integrators quickly understand the context, motivation, and impact of the changes.
 
@@ -25,6 +19,17 @@ You are an expert software developer. Your task is to extract and summarize rele
 
 5.  **Identify and Flag Review Hot Spots:** Based on the references, proactively point out areas that require extra attention or specialized knowledge. For example, if a linked issue indicates a complex race condition, mention: "**Critical Review Focus:** Check concurrency logic around `UserService.update` to prevent race condition described in [Issue #1234]." Or, if a change crosses system boundaries, mention: "**Integration Point:** Requires coordination with deployment of Backend Service X."
 
+
+# Output Format
+
+Your output should be a concise summary in the following format:
+<summary>
+[Your concise summary here, following the guidelines above.]
+</summary>
+"""
+
+# inputs of the query: the variable suffix
+INPUT_TEMPLATE = """
 # Input
 You will be provided with the following information: (1) Detailed information about the target pull request, including its title, description, and developer's comments, (2) A list of linked issues and related pull requests with their details.
 
@@ -33,42 +38,31 @@ You will be provided with the following information: (1) Detailed information ab
 
 ## References
 {references}
+"""
 
-# Output Format
+ANSWER_PARSER = AnswerParser("ReferenceSummaryPromptV1", ["summary"])
 
-Your output should be a concise summary in the following format:
-<summary>
-[Your concise summary here, following the guidelines above.]
-</summary>
-        """
 
-        query = template.format(
+class ReferenceSummaryPrompt:
+    def __init__(self):
+        pass
+
+    def create_prompt(
+        self,
+        pull_request_details: str,
+        references: str
+    ) -> str:
+
+        query = assemble_prompt(
+            STATIC_TEMPLATE,
+            INPUT_TEMPLATE,
             pull_request_details=pull_request_details,
             references=references
         )
         return query
 
     def parse_answer(self, answer: str) -> dict | None:
-        results = {}
-        if "<summary>" not in answer or "</summary>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="LLM response is missing required tag: <summary>"
-            ))
-            return None
-
-        try:
-            summary_start = answer.index("<summary>") + len("<summary>")
-            summary_end = answer.index("</summary>")
-            summary = answer[summary_start:summary_end].strip()
-
-            results["summary"] = summary
-
-        except ValueError as e:
-            append_event(Event(
-                level="ERROR",
-                message=f"Error while parsing LLM response: {e}"
-            ))
-            return None
-
-        return results
+        return ANSWER_PARSER.parse(answer)
+
+    def response_format(self):
+        return ANSWER_PARSER.response_format()
@@ -1,20 +1,10 @@
+from patchguru.prompts.AnswerParser import AnswerParser
+from patchguru.prompts.PromptLayout import assemble_prompt
 from patchguru.utils.Tracker import Event, append_event
 
-class SelfReviewPrompt:
-    def __init__(self):
-        pass
 
-    def create_prompt(
-        self,
-        pull_request_details,
-        prev_fut_code,
-        post_fut_signatures,
-        enclosing_class,
-        test_driver,
-        error_message,
-        code_changes,
-    ):
-        template = """
+# role, guidelines and output format: the static prefix shared by all queries
+STATIC_TEMPLATE = """
 # Role
 You are an expert software developer. Your task is to analyze a test driver that is generated by an AI system for testing a pull request (PR) in a codebase. The test driver is failing with assertion errors when run against the new code introduced by the PR. Your goal is to determine whether the failure indicates a real bug in the PR or a flawed test driver that does not accurately reflect the developer's intent.
 
@@ -42,6 +32,26 @@ Your task is to act as a detective, distinguishing between a real bug and a flaw
 
 10. **Suggest Corrections if Needed:** If you identify a mismatch, suggest how the test driver could be updated to better reflect the intended behavior of the code. You might recommend changes to the test's assertions, input values, or even its overall purpose. You MUST NOT suggest changes to the PR code itself. If you find a bug, you should not do anything further than identifying it, as fixing the bug is outside the scope of your role.
 
+
+# Output Format Instructions
+
+Provide your response in the following format:
+
+<reasoning>
+[Put your reasoning chain here including the analysis of the pull request details, the function code before the PR, and the test driver. This should include your thought process on how you arrived at your conclusion.]
+</reasoning>
+
+<conclusion>
+[State your conclusion here: "BUG" if the failure indicates a real bug in the PR, or "MISMATCH" if the failure is due to a flawed test. Only put "BUG" or "MISMATCH" here in uppercase letters.]
+</conclusion>
+
+<test_driver>
+[Put the corrected test driver here if you concluded "MISMATCH". Make sure that fixed code is structurally similar to the input code. The fixed code should still contain three main sections: "# Neccessary imports", "# Specification", and "# Source Code of target function(s)". You can assume that the "# Source Code of target function(s)" section is unchanged and do not need to provide it again in your response. But you should still include the section header "# Source Code of target function(s)" between # Neccessary imports and # Specification sections in your response. If you concluded "BUG", you MUST leave this section empty.]
+</test_driver>
+"""
+
+# inputs of the query: the variable suffix
+INPUT_TEMPLATE = """
 # Input
 
 You will be provided the test driver, the error message from the failed test, pull request details, including the PR title, description, and conversations between developers, and code changes introduced by the PR, as follows:
@@ -65,23 +75,25 @@ You will be provided the test driver, the error message from the failed test, pu
 ## Error Message
 
 {error_message}
+"""
 
-# Output Format Instructions
+ANSWER_PARSER = AnswerParser("SelfReviewPromptV1", ["conclusion", "test_driver"], optional_tags=["reasoning"], code_tags=["test_driver"], keys={"test_driver": "specification"})
 
-Provide your response in the following format:
-
-<reasoning>
-[Put your reasoning chain here including the analysis of the pull request details, the function code before the PR, and the test driver. This should include your thought process on how you arrived at your conclusion.]
-</reasoning>
 
-<conclusion>
-[State your conclusion here: "BUG" if the failure indicates a real bug in the PR, or "MISMATCH" if the failure is due to a flawed test. Only put "BUG" or "MISMATCH" here in uppercase letters.]
-</conclusion>
+class SelfReviewPrompt:
+    def __init__(self):
+        pass
 
-<test_driver>
-[Put the corrected test driver here if you concluded "MISMATCH". Make sure that fixed code is structurally similar to the input code. The fixed code should still contain three main sections: "# Neccessary imports", "# Specification", and "# Source Code of target function(s)". You can assume that the "# Source Code of target function(s)" section is unchanged and do not need to provide it again in your response. But you should still include the section header "# Source Code of target function(s)" between # Neccessary imports and # Specification sections in your response. If you concluded "BUG", you MUST leave this section empty.]
-</test_driver>
-        """
+    def create_prompt(
+        self,
+        pull_request_details,
+        prev_fut_code,
+        post_fut_signatures,
+        enclosing_class,
+        test_driver,
+        error_message,
+        code_changes,
+    ):
         if len(enclosing_class) > 0:
             if len(enclosing_class) > 3000:
                 enclosing_class = enclosing_class[:3000]
@@ -95,7 +107,9 @@ Target function (s) are defined in the following class:
 """
         else:
             context = "Target function(s) are defined in the global scope. There is no enclosing class."
-        query = template.format(
+        query = assemble_prompt(
+            STATIC_TEMPLATE,
+            INPUT_TEMPLATE,
             pr_details=pull_request_details,
             prev_fut_code=prev_fut_code,
             context=context,
@@ -107,56 +121,14 @@ Target function (s) are defined in the following class:
         return query
 
     def parse_answer(self, answer):
-        results = {}
-        if "<reasoning>" not in answer or "</reasoning>" not in answer:
-            append_event(Event(
-                level="WARNING",
-                message="Missing required tag: <reasoning>"
-            ))
-        else:
-            reasoning_start = answer.index("<reasoning>") + len("<reasoning>")
-            reasoning_end = answer.index("</reasoning>")
-            results["reasoning"] = answer[reasoning_start:reasoning_end].strip()
-
-        if "<conclusion>" not in answer or "</conclusion>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="Missing required tag: <conclusion>"
-            ))
-            return None
-
-        if "<test_driver>" not in answer or "</test_driver>" not in answer:
-            append_event(Event(
-                level="ERROR",
-                message="LLM response is missing required tag: <test_driver>"
-            ))
-            return None
-
-        try:
-            conclusion_start = answer.index("<conclusion>") + len("<conclusion>")
-            conclusion_end = answer.index("</conclusion>")
-            results["conclusion"] = answer[conclusion_start:conclusion_end].strip().upper()
-
-            specification_start = answer.index("<test_driver>") + len("<test_driver>")
-            specification_end = answer.index("</test_driver>")
-            specification = answer[specification_start:specification_end].strip()
-
-            if "```" in specification:
-                if "```python" in specification:
-                    specification = specification.split("```python")[1].split("```")[0].strip()
-                else:
-                    specification = specification.split("```")[1].split("```")[0].strip()
-            results["specification"] = specification
-
-        except ValueError as e:
-            append_event(Event(
-                level="ERROR",
-                message=f"Error while parsing LLM response: {e}"
-            ))
-            return None
-
+        results = ANSWER_PARSER.parse(answer)
+        if results is not None:
+            results["conclusion"] = results["conclusion"].upper()
         return results
 
+    def response_format(self):
+        return ANSWER_PARSER.response_format()
+
     def check_valid(self, parsed_response, func_name):
         conclusion = parsed_response["conclusion"]
         if conclusion not in ["BUG", "MISMATCH"]:
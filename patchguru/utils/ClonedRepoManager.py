@@ -1,11 +1,19 @@
 # This file is developed based on the code from the [Testora](https://github.com/michaelpradel/Testora) project by Michael Pradel.
 from dataclasses import dataclass
+from contextlib import contextmanager
+import atexit
+import fcntl
 import json
+import os
 from os.path import exists
-from typing import List
+from typing import List, Optional, Tuple
+import docker
 from git import Repo
+import threading
 import time
+from patchguru import Config
 from patchguru.utils.PythonLanguageServer import PythonLanguageServer
+from patchguru.utils.Tracker import Event, append_event
 
 
 @dataclass
@@ -13,113 +21,473 @@ class ClonedRepo:
     repo: Repo
     container_name: str
     language_server: PythonLanguageServer
+    module_name: str  # top-level module of the project
+    container_repo_dir: str  # path at which the container mounts the clone
+    commit: Optional[str]  # commit the clone is checked out at, None if unknown
 
 
 class ClonedRepoManager:
-    nb_clones = 3
+    """
+    Pool of checkouts (slots) of a repository, `{pool_dir}/clone{i}/{repo_name}`, each mounted in
+    the container `{container_base_name}{i}`; slots without a container are not used. clone1 is a
+    full clone; missing slots are created as local clones of clone1, whose objects are hardlinked
+    rather than downloaded, so that adding a slot costs a checkout rather than a clone. Each slot
+    keeps its own `.git` directory, since the containers only mount their slot and git must work
+    inside them. A process owns the slots it holds an exclusive flock on, and only ever checks out
+    those, so that several processes can share a pool.
+    """
 
-    def __init__(self, pool_dir, repo_name, repo_id, container_base_name, module_name):
+    def __init__(self, pool_dir, repo_name, repo_id, container_base_name, module_name, nb_clones=Config.CLONE_POOL_SIZE, fetch_ttl=Config.CLONE_FETCH_TTL):
         self.pool_dir = pool_dir
         self.repo_name = repo_name
         self.repo_id = repo_id
         self.container_base_name = container_base_name
         self.module_name = module_name
+        self.nb_clones = nb_clones
+        self.fetch_ttl = fetch_ttl
 
         self.clone_state_file = f"{self.pool_dir}/clone_state_{repo_name}.json"
+        self.pool_lock_file = f"{self.pool_dir}/.pool_{repo_name}.lock"
         self._read_clone_state()
+        self.slot_ids = self._slots_with_containers()
+        self._create_clones()
+        self._lock_slots()
 
-        self.usage_order: List[str] = [f"clone{i}" for i in range(
-            1, self.nb_clones + 1)]  # last = last used
+        self.usage_order: List[str] = list(self.clone_ids)  # last = last used
+        # number of active leases per clone; leased clones are never checked out to another commit
+        self.clone_id_to_leases = {clone_id: 0 for clone_id in self.clone_ids}
+        self._condition = threading.Condition(threading.RLock())
+        # requests served by a clone already at the commit (hits) or by a checkout (misses), and checkout costs
+        self.statistics = {
+            "hits": 0,
+            "misses": 0,
+            "changed_files": 0,
+            "checkout_time": 0.0,
+            "submodule_updates": 0,
+            "submodule_skips": 0,
+            "submodule_time": 0.0
+        }
 
         self._reset_and_clean_all_clones()
 
         # start one language server for each clone
         self.clone_id_to_language_server = {}
-        for i in range(1, self.nb_clones + 1):
-            if not exists(f"{self.pool_dir}/clone{i}/{self.repo_name}"):
-                raise FileNotFoundError(
-                    f"Clone directory {self.pool_dir}/clone{i}/{self.repo_name} does not exist.")
-            server = PythonLanguageServer(
-                f"{self.pool_dir}/clone{i}/{self.repo_name}")
-            self.clone_id_to_language_server[f"clone{i}"] = server
+        for clone_id in self.clone_ids:
+            server = PythonLanguageServer(self._clone_dir(clone_id))
+            self.clone_id_to_language_server[clone_id] = server
+        atexit.register(self.shutdown_language_servers)
 
-    def _read_clone_state(self):
-        if not exists(self.clone_state_file):
-            self.clone_id_to_state = {
-                f"clone{i}": {"commit": "unknown", "container_name": f"{self.container_base_name}{i}"} for i in range(1, self.nb_clones + 1)}
-            return
+    def _clone_dir(self, clone_id) -> str:
+        return f"{self.pool_dir}/{clone_id}/{self.repo_name}"
+
+    @contextmanager
+    def _pool_lock(self):
+        """
+        Serializes the changes of the pool (slots, state file) across processes.
+        """
+        with open(self.pool_lock_file, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _slots_with_containers(self) -> List[str]:
+        """
+        Returns the slots whose container exists (the containers are created by the setup scripts
+        of .devcontainer), since a slot without one cannot run anything. Without a docker daemon
+        (e.g., when collecting PRs), returns the slots that are already cloned.
+        """
+        all_clone_ids = [f"clone{i}" for i in range(1, self.nb_clones + 1)]
+        try:
+            container_names = {container.name for container in docker.from_env().containers.list(all=True)}
+        except docker.errors.DockerException:
+            return [clone_id for clone_id in all_clone_ids if exists(self._clone_dir(clone_id))]
+        slot_ids = []
+        for clone_id in all_clone_ids:
+            container_name = self.clone_id_to_state[clone_id]["container_name"]
+            if container_name in container_names:
+                slot_ids.append(clone_id)
+            else:
+                append_event(Event(
+                    level="WARNING",
+                    message=f"Container {container_name} does not exist, slot {clone_id} of {self.repo_name} is not used."
+                ))
+        return slot_ids
+
+    def _create_clones(self):
+        main_dir = self._clone_dir("clone1")
+        if not exists(main_dir):
+            raise FileNotFoundError(f"Clone directory {main_dir} does not exist.")
+        with self._pool_lock():
+            missing_clone_ids = [clone_id for clone_id in self.slot_ids if not exists(self._clone_dir(clone_id))]
+            if len(missing_clone_ids) == 0:
+                return
+            main_repo = Repo(main_dir)
+            for clone_id in missing_clone_ids:
+                os.makedirs(f"{self.pool_dir}/{clone_id}", exist_ok=True)
+                # --local hardlinks the objects of clone1 (or copies them across file systems)
+                cloned_repo = Repo.clone_from(main_dir, self._clone_dir(clone_id), local=True, no_checkout=True)
+                cloned_repo.remotes.origin.set_url(main_repo.remotes.origin.url)
+                cloned_repo.git.checkout('--detach', main_repo.head.commit.hexsha)
+                append_event(Event(
+                    level="INFO",
+                    message=f"Created clone {self._clone_dir(clone_id)} for container {self.clone_id_to_state[clone_id]['container_name']}.",
+                    type="CloneCreate",
+                    info={"clone_id": clone_id, "path": self._clone_dir(clone_id)}
+                ))
+
+    def _lock_slots(self):
+        """
+        Takes the flock of this process's share of the slots (CLONE_POOL_PROCESSES processes share
+        the pool), among those not owned by another process. Waits for the slots of other processes
+        if fewer than two (a pre- and a post-commit checkout) are free.
+        """
+        if len(self.slot_ids) == 0:
+            raise RuntimeError(f"No slot of {self.repo_name} has a container.")
+        min_slots = min(2, len(self.slot_ids))
+        share = max(min_slots, len(self.slot_ids) // max(1, Config.CLONE_POOL_PROCESSES))
+        self.clone_id_to_lock_file = {}
+        for clone_id in self.slot_ids:
+            if len(self.clone_id_to_lock_file) >= share:
+                break
+            lock_file = open(f"{self.pool_dir}/{clone_id}/.{self.repo_name}.lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.clone_id_to_lock_file[clone_id] = lock_file
+            except BlockingIOError:
+                lock_file.close()
+        for clone_id in self.slot_ids:
+            if len(self.clone_id_to_lock_file) >= min_slots:
+                break
+            if clone_id in self.clone_id_to_lock_file:
+                continue
+            append_event(Event(
+                level="WARNING",
+                message=f"Slot {clone_id} of {self.repo_name} is used by another process. Waiting for it..."
+            ))
+            lock_file = open(f"{self.pool_dir}/{clone_id}/.{self.repo_name}.lock", "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.clone_id_to_lock_file[clone_id] = lock_file
+        self.clone_ids = [clone_id for clone_id in self.slot_ids if clone_id in self.clone_id_to_lock_file]
+
+    def shutdown_language_servers(self):
+        for server in self.clone_id_to_language_server.values():
+            server.stop()
 
-        with open(self.clone_state_file, "r") as f:
-            self.clone_id_to_state = json.load(f)
+    def _read_clone_state(self):
+        clone_id_to_state = {}
+        if exists(self.clone_state_file):
+            with open(self.clone_state_file, "r") as f:
+                clone_id_to_state = json.load(f)
 
-        assert len(self.clone_id_to_state) == self.nb_clones
+        self.clone_id_to_state = {
+            f"clone{i}": clone_id_to_state.get(f"clone{i}", {"commit": "unknown", "container_name": f"{self.container_base_name}{i}"})
+            for i in range(1, self.nb_clones + 1)}
 
     def _write_clone_state(self):
-        assert len(self.clone_id_to_state) == self.nb_clones
-        with open(self.clone_state_file, "w") as f:
-            json.dump(self.clone_id_to_state, f)
+        # other processes own other slots: only update the states of the slots of this process
+        with self._pool_lock():
+            clone_id_to_state = {}
+            if exists(self.clone_state_file):
+                with open(self.clone_state_file, "r") as f:
+                    clone_id_to_state = json.load(f)
+            for clone_id in self.clone_ids:
+                clone_id_to_state[clone_id] = self.clone_id_to_state[clone_id]
+            with open(self.clone_state_file, "w") as f:
+                json.dump(clone_id_to_state, f)
+
+    def fetch(self, force=False) -> int:
+        """
+        Fetches origin into clone1, unless it was fetched less than `fetch_ttl` seconds ago (None
+        never fetches), then updates the other slots of this process from clone1, locally. The slots
+        do not share an object store, but the pool fetches from the network once. Returns the number
+        of fetches from origin (0 or 1).
+        """
+        main_dir = self._clone_dir("clone1")
+        main_repo = Repo(main_dir)
+        # git rewrites FETCH_HEAD on every fetch
+        main_fetch_head = os.path.join(main_repo.common_dir, "FETCH_HEAD")
+        n_fetches = 0
+        # clone1 may belong to another process, fetches into it are serialized by the pool lock
+        with self._pool_lock():
+            if force or (self.fetch_ttl is not None and not (
+                    exists(main_fetch_head) and time.time() - os.path.getmtime(main_fetch_head) < self.fetch_ttl)):
+                main_repo.remotes.origin.fetch()
+                n_fetches += 1
+        if not exists(main_fetch_head):
+            return n_fetches
+        for clone_id in self.clone_ids:
+            cloned_repo = Repo(self._clone_dir(clone_id))
+            if cloned_repo.common_dir == main_repo.common_dir:
+                continue
+            fetch_head = os.path.join(cloned_repo.common_dir, "FETCH_HEAD")
+            if exists(fetch_head) and os.path.getmtime(fetch_head) >= os.path.getmtime(main_fetch_head):
+                continue
+            cloned_repo.git.fetch(main_dir, "+refs/remotes/origin/*:refs/remotes/origin/*")
+        return n_fetches
+
+    def _is_clean(self, clone_id, cloned_repo: Repo) -> bool:
+        """
+        Whether the clone has no local changes and is at the commit recorded in its state.
+        """
+        if cloned_repo.git.status('--porcelain') != "":
+            return False
+        try:
+            return cloned_repo.head.commit.hexsha == self.clone_id_to_state[clone_id]["commit"]
+        except ValueError:
+            # no valid HEAD
+            return False
 
     def _reset_and_clean_all_clones(self):
-        for clone_id, _ in self.clone_id_to_state.items():
+        start_time = time.time()
+        reset_clone_ids = []
+        for clone_id in self.clone_ids:
             print(clone_id)
-            cloned_repo_dir = f"{self.pool_dir}/{clone_id}/{self.repo_name}"
-            cloned_repo = Repo(cloned_repo_dir)
+            cloned_repo = Repo(self._clone_dir(clone_id))
+            if self._is_clean(clone_id, cloned_repo):
+                continue
             cloned_repo.git.rm('--cached', '-rf', '.')
             cloned_repo.git.reset('--hard')
             cloned_repo.git.clean('-f', '-d')
-            origin = cloned_repo.remotes.origin
-            origin.fetch()
+            # the recorded commit cannot be trusted, do not reuse the clone for it
+            self.clone_id_to_state[clone_id]["commit"] = "unknown"
+            reset_clone_ids.append(clone_id)
+        if len(reset_clone_ids) > 0:
+            self._write_clone_state()
+        n_fetches = self.fetch()
+        append_event(Event(
+            level="DEBUG",
+            message=f"Prepared {len(self.clone_ids)} clones of {self.repo_name} in {time.time() - start_time:.1f}s ({len(reset_clone_ids)} reset, {n_fetches} fetched).",
+            type="CloneStartup",
+            info={
+                "clone_ids": self.clone_ids,
+                "reset_clone_ids": reset_clone_ids,
+                "fetches": n_fetches,
+                "duration": time.time() - start_time
+            }
+        ))
 
-    def _get_least_recently_used_clone_id(self) -> str:
-        return self.usage_order[0]
+    def _changed_files(self, clone_id, commit):
+        """
+        Returns the (old mode, new mode, path) of the files that differ between the commit of the
+        clone and `commit` (from `git diff --raw`, which compares trees without diffing contents),
+        or None if unknown.
+        """
+        current_commit = self.clone_id_to_state[clone_id]["commit"]
+        if current_commit == "unknown":
+            return None
+        try:
+            raw_diff = Repo(self._clone_dir(clone_id)).git.diff('--raw', '--no-renames', current_commit, commit)
+        except Exception:
+            # e.g., a commit that is not fetched yet
+            return None
+        changed_files = []
+        for line in raw_diff.splitlines():
+            # :<old mode> <new mode> <old sha> <new sha> <status>\t<path>
+            fields, _, path = line.partition("\t")
+            old_mode, new_mode = fields[1:].split()[:2]
+            changed_files.append((old_mode, new_mode, path))
+        return changed_files
+
+    def _get_cheapest_clone_id(self, commit, excluded=()) -> Tuple[Optional[str], Optional[list]]:
+        """
+        Returns the free clone with the fewest files to change to check out the commit, the least
+        recently used one among equals (or when the costs are unknown), and its changed files (see
+        `_changed_files`), which the checkout reuses. Returns (None, None) if no clone is free.
+        """
+        best_clone_id, best_changed_files, best_cost = None, None, None
+        for clone_id in self.usage_order:
+            if self.clone_id_to_leases[clone_id] != 0 or clone_id in excluded:
+                continue
+            changed_files = self._changed_files(clone_id, commit)
+            cost = len(changed_files) if changed_files is not None else float("inf")
+            if best_clone_id is None or cost < best_cost:
+                best_clone_id, best_changed_files, best_cost = clone_id, changed_files, cost
+        return best_clone_id, best_changed_files
+
+    def _find_clone_id(self, commit) -> str:
+        for clone_id in self.clone_ids:
+            if self.clone_id_to_state[clone_id]["commit"] == commit:
+                return clone_id
+        return None
 
     def _have_used_clone_id(self, clone_id: str):
         self.usage_order.remove(clone_id)
         self.usage_order.append(clone_id)
 
-    def _safe_checkout(self, cloned_repo: Repo, commit: str):
+    def _update_submodules(self, cloned_repo: Repo, changed_files):
+        """
+        Updates the submodules unless the checkout changed neither `.gitmodules` nor a submodule
+        commit (gitlinks have mode 160000).
+        """
+        if changed_files is not None and not any(
+                path == ".gitmodules" or "160000" in (old_mode, new_mode)
+                for old_mode, new_mode, path in changed_files):
+            self.statistics["submodule_skips"] += 1
+            return 0.0
+        start_time = time.time()
+        cloned_repo.git.submodule('update', '--init', '--recursive')
+        self.statistics["submodule_updates"] += 1
+        self.statistics["submodule_time"] += time.time() - start_time
+        return time.time() - start_time
+
+    def _safe_checkout(self, cloned_repo: Repo, commit: str, changed_files=None):
         try:
-            cloned_repo.git.checkout(commit)
-            cloned_repo.git.submodule('update', '--init', '--recursive')
+            # detached, the clones are moved between commits, not along branches
+            cloned_repo.git.checkout('--detach', commit)
+            return self._update_submodules(cloned_repo, changed_files)
         except Exception as e:
             if commit == "main":
-                self._safe_checkout(cloned_repo, "master")
+                return self._safe_checkout(cloned_repo, "master")
             elif commit == "master":
-                self._safe_checkout(cloned_repo, "dev")
+                return self._safe_checkout(cloned_repo, "dev")
             else:
                 cloned_repo.git.rm('--cached', '-rf', '.')
                 cloned_repo.git.reset('--hard')
                 cloned_repo.git.clean('-f', '-d')
-                origin = cloned_repo.remotes.origin
-                origin.fetch()
-                cloned_repo.git.checkout(commit)
+                # e.g., a commit merged after the last fetch
+                self.fetch(force=True)
+                cloned_repo.git.checkout('--detach', commit)
+                return self._update_submodules(cloned_repo, None)
 
-    def get_cloned_repo(self, commit) -> ClonedRepo:
-        # reuse existing clone if possible
-        for clone_id, state in self.clone_id_to_state.items():
-            if state["commit"] == commit:
-                self._have_used_clone_id(clone_id)
-                cloned_repo_dir = f"{self.pool_dir}/{clone_id}/{self.repo_name}"
-
-                return ClonedRepo(Repo(cloned_repo_dir),
-                                  state["container_name"],
-                                  self.clone_id_to_language_server[clone_id])
-
-        # checkout desired commit
-        clone_id = self._get_least_recently_used_clone_id()
-        cloned_repo_dir = f"{self.pool_dir}/{clone_id}/{self.repo_name}"
-        cloned_repo = Repo(cloned_repo_dir)
-        self._safe_checkout(cloned_repo, commit)
+    def _checkout_clone(self, clone_id, commit, changed_files):
+        """
+        Checks out the commit in the clone, given the files it changes as computed by `_changed_files`.
+        """
+        start_time = time.time()
+        previous_commit = self.clone_id_to_state[clone_id]["commit"]
+        cloned_repo = Repo(self._clone_dir(clone_id))
+        submodule_time = self._safe_checkout(cloned_repo, commit, changed_files)
+        # the session of this clone has indexed the previous commit
+        self.clone_id_to_language_server[clone_id].restart()
 
         # update clone state
         state = self.clone_id_to_state[clone_id]
         state["commit"] = commit
         self.clone_id_to_state[clone_id] = state
         self._write_clone_state()
-        self._have_used_clone_id(clone_id)
 
         time.sleep(1)
 
-        return ClonedRepo(cloned_repo,
-                          state["container_name"],
-                          self.clone_id_to_language_server)
+        checkout_time = time.time() - start_time
+        self.statistics["misses"] += 1
+        self.statistics["changed_files"] += len(changed_files) if changed_files is not None else 0
+        self.statistics["checkout_time"] += checkout_time
+        append_event(Event(
+            level="DEBUG",
+            message=f"Checked out {commit} in {clone_id} in {checkout_time:.1f}s ({len(changed_files) if changed_files is not None else 'unknown'} changed files).",
+            type="CloneCheckout",
+            info={
+                "clone_id": clone_id,
+                "previous_commit": previous_commit,
+                "commit": commit,
+                "changed_files": len(changed_files) if changed_files is not None else None,
+                "checkout_time": checkout_time,
+                "submodule_time": submodule_time,
+                "hit_rate": self.hit_rate()
+            }
+        ))
+
+    def hit_rate(self) -> float:
+        requests = self.statistics["hits"] + self.statistics["misses"]
+        return self.statistics["hits"] / requests if requests > 0 else 0.0
+
+    def git_dir(self) -> str:
+        """
+        Directory of a clone, to run git commands that do not depend on the checked-out commit.
+        """
+        return f"{self.pool_dir}/clone1/{self.repo_name}"
+
+    def _to_cloned_repo(self, clone_id) -> ClonedRepo:
+        commit = self.clone_id_to_state[clone_id]["commit"]
+        return ClonedRepo(Repo(self._clone_dir(clone_id)),
+                          self.clone_id_to_state[clone_id]["container_name"],
+                          self.clone_id_to_language_server[clone_id],
+                          self.module_name,
+                          f"/home/{self.repo_name}",
+                          commit if commit != "unknown" else None)
+
+    def find_cloned_repo(self, commit) -> ClonedRepo:
+        """
+        Returns the clone currently checked out at the commit without checking out any clone, or None.
+        """
+        with self._condition:
+            clone_id = self._find_clone_id(commit)
+            return self._to_cloned_repo(clone_id) if clone_id is not None else None
+
+    def get_cloned_repo(self, commit) -> ClonedRepo:
+        with self._condition:
+            while True:
+                # reuse existing clone if possible
+                clone_id = self._find_clone_id(commit)
+                if clone_id is not None:
+                    self.statistics["hits"] += 1
+                    break
+                # checkout desired commit, waiting for a clone without leases if needed
+                clone_id, changed_files = self._get_cheapest_clone_id(commit)
+                if clone_id is not None:
+                    self._checkout_clone(clone_id, commit, changed_files)
+                    break
+                self._condition.wait()
+            self._have_used_clone_id(clone_id)
+            return self._to_cloned_repo(clone_id)
+
+    def _assign_clone_ids(self, commits) -> dict:
+        """
+        Maps each commit to the clone it is (or will be) checked out in and the files the checkout
+        changes (empty if the clone is already at the commit), or returns None if not enough clones
+        are free.
+        """
+        commit_to_assignment = {}
+        for commit in commits:
+            clone_id = self._find_clone_id(commit)
+            if clone_id is not None:
+                commit_to_assignment[commit] = (clone_id, [])
+        for commit in commits:
+            if commit in commit_to_assignment:
+                continue
+            clone_id, changed_files = self._get_cheapest_clone_id(
+                commit, excluded=[clone_id for clone_id, _ in commit_to_assignment.values()])
+            if clone_id is None:
+                return None
+            commit_to_assignment[commit] = (clone_id, changed_files)
+        return commit_to_assignment
+
+    def acquire(self, commits) -> List[ClonedRepo]:
+        """
+        Checks out all commits at once and leases their clones, so that concurrent analyses do
+        not check them out to other commits until `release` is called. Blocks until enough
+        clones are free.
+        """
+        commits = list(dict.fromkeys(commits))
+        if len(commits) == 0:
+            return []
+        if len(commits) > len(self.clone_ids):
+            raise ValueError(f"Cannot lease {len(commits)} commits with only {len(self.clone_ids)} clones.")
+        with self._condition:
+            commit_to_assignment = self._condition.wait_for(lambda: self._assign_clone_ids(commits))
+            for commit, (clone_id, changed_files) in commit_to_assignment.items():
+                if self.clone_id_to_state[clone_id]["commit"] != commit:
+                    self._checkout_clone(clone_id, commit, changed_files)
+                else:
+                    self.statistics["hits"] += 1
+                self.clone_id_to_leases[clone_id] += 1
+                self._have_used_clone_id(clone_id)
+            return [self._to_cloned_repo(commit_to_assignment[commit][0]) for commit in commits]
+
+    def release(self, commits):
+        with self._condition:
+            for commit in dict.fromkeys(commits):
+                clone_id = self._find_clone_id(commit)
+                if clone_id is not None and self.clone_id_to_leases[clone_id] > 0:
+                    self.clone_id_to_leases[clone_id] -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, commits):
+        cloned_repos = self.acquire(commits)
+        try:
+            yield cloned_repos
+        finally:
+            self.release(commits)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class DiskCache:
+    """
+    Small on-disk key/value store with LRU eviction.
+
+    Each entry is a JSON file sharded by the SHA-256 of its key. Reads bump the file's
+    modification time, so evicting the oldest files first drops the least recently used
+    entries once the total size exceeds `max_size_bytes`.
+    """
+
+    def __init__(self, cache_dir, max_size_bytes):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._total_size = None
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+        if entry.get("key") != key:
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"]
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"key": key, "value": value})
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            if self._total_size is None:
+                self._total_size = self._compute_total_size()
+            else:
+                self._total_size += len(data) - old_size
+            if self._total_size > self.max_size_bytes:
+                self._evict()
+
+    def _list_entries(self):
+        entries = []
+        if not os.path.exists(self.cache_dir):
+            return entries
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for file_name in os.listdir(shard_dir):
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(shard_dir, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _compute_total_size(self):
+        return sum(size for _, size, _ in self._list_entries())
+
+    def _evict(self):
+        # evict down to 90% of the limit so that eviction does not run on every write
+        target_size = int(self.max_size_bytes * 0.9)
+        entries = sorted(self._list_entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= target_size:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except FileNotFoundError:
+                pass
+        self._total_size = total_size
@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import threading
+from contextlib import contextmanager
+from patchguru import Config
+
+
+class ResourceLimits:
+    """
+    Global concurrency limits of an asyncio pipeline, one semaphore per resource.
+    The semaphores belong to the event loop they are created in.
+    """
+
+    def __init__(
+            self,
+            max_llm_requests=Config.ASYNC_MAX_LLM_REQUESTS,
+            max_executions=Config.ASYNC_MAX_EXECUTIONS,
+            max_executions_per_container=Config.ASYNC_MAX_EXECUTIONS_PER_CONTAINER,
+            max_clone_leases=Config.ASYNC_MAX_CLONE_LEASES,
+        ):
+        self.llm = asyncio.Semaphore(max_llm_requests)
+        self.executions = asyncio.Semaphore(max_executions)
+        self.clones = asyncio.Semaphore(max_clone_leases)
+        self.max_executions_per_container = max_executions_per_container
+        self._container_semaphores = {}
+        self._container_semaphores_lock = threading.Lock()
+
+    def container(self, container_name) -> asyncio.Semaphore:
+        # may be called from worker threads, the lock keeps a single semaphore per container
+        with self._container_semaphores_lock:
+            if container_name not in self._container_semaphores:
+                self._container_semaphores[container_name] = asyncio.Semaphore(self.max_executions_per_container)
+            return self._container_semaphores[container_name]
+
+
+# (event loop, limits) of the pipeline that runs the current synchronous stage in a worker thread
+_BRIDGE = contextvars.ContextVar("event_loop_bridge", default=None)
+
+
+@contextmanager
+def bridge_to(loop, limits):
+    """
+    Makes LLM queries and container executions of synchronous code called in this context
+    (including worker threads started with `asyncio.to_thread`) go through the event loop and its limits.
+    """
+    token = _BRIDGE.set((loop, limits))
+    try:
+        yield
+    finally:
+        _BRIDGE.reset(token)
+
+
+def get_bridge():
+    return _BRIDGE.get()
+
+
+def run_on_loop(coro):
+    """
+    Runs the coroutine on the bridged event loop and waits for its result in the calling thread.
+    """
+    loop, _ = _BRIDGE.get()
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+@contextmanager
+def limited(*semaphore_getters):
+    """
+    Holds the bridged pipeline's semaphores, selected by the given functions of its limits,
+    in the calling (worker) thread. Does nothing outside of a bridge.
+    """
+    bridge = _BRIDGE.get()
+    if bridge is None:
+        yield
+        return
+    loop, limits = bridge
+    semaphores = []
+    try:
+        for semaphore_getter in semaphore_getters:
+            semaphore = semaphore_getter(limits)
+            asyncio.run_coroutine_threadsafe(semaphore.acquire(), loop).result()
+            semaphores.append(semaphore)
+        yield
+    finally:
+        for semaphore in reversed(semaphores):
+            loop.call_soon_threadsafe(semaphore.release)
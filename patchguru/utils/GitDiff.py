@@ -0,0 +1,145 @@
+"""
+Diffs of PRs computed from the local clones.
+
+The diff of a PR is the diff between the first parent of its merge commit and the merge commit,
+the same commits the analysis checks out. `prefetch_diffs` computes the diffs of a whole list of
+merge commits in one `git diff-tree --stdin` process; `get_diff` serves them, or diffs a single
+pair of commits on a miss. Diffs are kept in a bounded in-memory cache shared by the PRs of the
+process, since a diff is consumed once when the PR's patch is parsed.
+"""
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from patchguru import Config
+from patchguru.utils.Tracker import Event, append_event
+
+_COMMIT_ID = re.compile(r"^[0-9a-f]{40}([0-9a-f]{24})?$")
+
+# (pre_commit, post_commit) -> diff, oldest first
+_DIFFS = OrderedDict()
+_DIFFS_LOCK = threading.Lock()
+
+
+def _git(repo_dir, args, input) -> str:
+    completed = subprocess.run(
+        ["git"] + args, cwd=repo_dir, input=input.encode("utf-8"),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return completed.stdout.decode("utf-8", errors="replace")
+
+
+def missing_commits(repo_dir, commits) -> set:
+    """
+    Returns the commits that are not in the object store of the clone.
+    """
+    if len(commits) == 0:
+        return set()
+    output = _git(repo_dir, ["cat-file", "--batch-check"], "".join(f"{commit}\n" for commit in commits))
+    return {commit for commit, line in zip(commits, output.splitlines()) if line.endswith(" missing")}
+
+
+def first_parents(repo_dir, commits) -> dict:
+    """
+    Returns the first parent of each commit (which must exist locally), in one process.
+    """
+    if len(commits) == 0:
+        return {}
+    output = _git(repo_dir, ["rev-list", "--no-walk=unsorted", "--parents", "--stdin"], "".join(f"{commit}\n" for commit in commits))
+    commit_to_parent = {}
+    for line in output.splitlines():
+        ids = line.split()
+        if len(ids) > 1:
+            commit_to_parent[ids[0]] = ids[1]
+    return commit_to_parent
+
+
+def commit_times(repo_dir, commits) -> dict:
+    """
+    Returns the committer timestamp of each commit (which must exist locally), in one process.
+    """
+    if len(commits) == 0:
+        return {}
+    output = _git(repo_dir, ["log", "--no-walk=unsorted", "--format=%H %ct", "--stdin"], "".join(f"{commit}\n" for commit in commits))
+    commit_to_time = {}
+    for line in output.splitlines():
+        commit, _, timestamp = line.partition(" ")
+        commit_to_time[commit] = int(timestamp)
+    return commit_to_time
+
+
+def diff_many(repo_dir, commit_pairs) -> dict:
+    """
+    Returns the diff of each (pre_commit, post_commit) pair (which must exist locally), in one
+    `git diff-tree --stdin` process. The diffs are formatted as by `git diff pre_commit post_commit`.
+    """
+    if len(commit_pairs) == 0:
+        return {}
+    # "<commit> <parent>" lines diff the commit against the given parent; with --always, each
+    # line starts its output with the commit id, even when the diff is empty
+    output = _git(
+        repo_dir, ["diff-tree", "--stdin", "--always", "-r", "-p", "-M"],
+        "".join(f"{post_commit} {pre_commit}\n" for pre_commit, post_commit in commit_pairs))
+
+    pair_to_diff = {}
+    pairs = iter(commit_pairs)
+    current_pair, lines = None, []
+    next_pair = next(pairs, None)
+    for line in output.splitlines(keepends=True):
+        # diff lines never consist of a bare commit id, they start with a prefix (" ", "+", "diff", ...)
+        if next_pair is not None and line.rstrip("\n") == next_pair[1] and _COMMIT_ID.match(next_pair[1]):
+            if current_pair is not None:
+                pair_to_diff[current_pair] = "".join(lines)
+            current_pair, lines = next_pair, []
+            next_pair = next(pairs, None)
+            continue
+        lines.append(line)
+    if current_pair is not None:
+        pair_to_diff[current_pair] = "".join(lines)
+    return pair_to_diff
+
+
+def _store(pair_to_diff):
+    with _DIFFS_LOCK:
+        for pair, diff in pair_to_diff.items():
+            _DIFFS[pair] = diff
+            _DIFFS.move_to_end(pair)
+        while len(_DIFFS) > Config.GIT_DIFF_CACHE_SIZE:
+            _DIFFS.popitem(last=False)
+
+
+def prefetch_diffs(repo_dir, post_commits) -> dict:
+    """
+    Computes the diffs of the merge commits of a list of PRs against their first parents with
+    three git processes in total. Returns the first parent of each merge commit found locally.
+    """
+    start_time = time.time()
+    post_commits = list(dict.fromkeys(post_commits))
+    missing = missing_commits(repo_dir, post_commits)
+    commit_to_parent = first_parents(repo_dir, [commit for commit in post_commits if commit not in missing])
+    pair_to_diff = diff_many(repo_dir, [(parent, commit) for commit, parent in commit_to_parent.items()])
+    _store(pair_to_diff)
+    append_event(Event(
+        level="DEBUG",
+        message=f"Computed {len(pair_to_diff)} PR diffs in {time.time() - start_time:.2f}s ({len(missing)} merge commits missing locally).",
+        type="GitDiff",
+        info={
+            "diffs": len(pair_to_diff),
+            "missing": len(missing),
+            "duration": time.time() - start_time
+        }
+    ))
+    return commit_to_parent
+
+
+def get_diff(repo_dir, pre_commit, post_commit):
+    """
+    Returns the diff between the commits, or None if one of them is not in the clone.
+    """
+    with _DIFFS_LOCK:
+        diff = _DIFFS.pop((pre_commit, post_commit), None)
+    if diff is not None:
+        return diff
+    if len(missing_commits(repo_dir, [pre_commit, post_commit])) > 0:
+        return None
+    return diff_many(repo_dir, [(pre_commit, post_commit)]).get((pre_commit, post_commit), "")
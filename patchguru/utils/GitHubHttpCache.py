@@ -0,0 +1,178 @@
+"""
+On-disk HTTP cache of the REST requests of PyGithub.
+
+GET responses are stored with their ETag/Last-Modified validators and revalidated with
+If-None-Match/If-Modified-Since: GitHub answers unchanged resources with 304 Not Modified, which
+does not count against the rate limit, and the stored body is replayed. Modes:
+- off: requests go to GitHub uncached;
+- revalidate: stored responses are revalidated with conditional requests, new ones are recorded;
+- offline: stored responses are replayed without any request, a miss raises `GitHubCacheMiss`,
+  so that collection and analysis run from a local mirror of the cache directory.
+
+The cache is plugged into PyGithub as its HTTPS connection class, so it applies to every client
+of the process, including the lazy completion of PyGithub objects.
+"""
+import os
+import threading
+from github import Auth, Github
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from patchguru import Config
+from patchguru.utils.DiskCache import DiskCache
+
+GITHUB_CACHE_MODES = ["off", "revalidate", "offline"]
+
+
+class GitHubCacheMiss(Exception):
+    """
+    Raised in offline mode when a request has no stored response.
+    """
+
+
+class _Response:
+    """
+    Response with the interface PyGithub reads from its connections.
+    """
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def read(self):
+        return self.body
+
+
+class GitHubHttpCache:
+    def __init__(self, mode=None, cache_dir=None, max_size_bytes=None):
+        mode = mode if mode is not None else Config.GITHUB_HTTP_CACHE_MODE
+        cache_dir = cache_dir if cache_dir is not None else os.path.join(Config.CACHE_DIR, "github_http")
+        max_size_bytes = max_size_bytes if max_size_bytes is not None else Config.GITHUB_HTTP_CACHE_MAX_BYTES
+        if mode not in GITHUB_CACHE_MODES:
+            raise ValueError(f"Unknown GitHub cache mode: {mode}. Expected one of {GITHUB_CACHE_MODES}.")
+        self.mode = mode
+        self.store = DiskCache(cache_dir, max_size_bytes)
+        # request outcome -> count: hit (offline), revalidated (304), miss (200 recorded), uncached
+        self.statistics = {"hit": 0, "revalidated": 0, "miss": 0, "uncached": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, outcome):
+        with self._lock:
+            self.statistics[outcome] += 1
+
+    def key(self, host, url, headers) -> str:
+        # responses depend on the media type asked for (e.g., the diff of a PR vs its JSON)
+        accept = {name.lower(): value for name, value in (headers or {}).items()}.get("accept", "")
+        return f"{host}{url}:{accept}"
+
+    def request(self, connection, verb, url, input, headers) -> _Response:
+        if self.mode == "off" or verb != "GET":
+            return self._send(connection, verb, url, input, headers)
+        key = self.key(connection.host, url, headers)
+        entry = self.store.get(key)
+        if self.mode == "offline":
+            if entry is None:
+                raise GitHubCacheMiss(f"No stored GitHub response for GET {url} in offline mode.")
+            self._count("hit")
+            return _Response(entry["status"], entry["headers"], entry["body"])
+
+        headers = dict(headers or {})
+        if entry is not None:
+            if "etag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["etag"]
+            if "last-modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        response = self._send(connection, verb, url, input, headers)
+        if response.status == 304 and entry is not None:
+            self._count("revalidated")
+            # fresh rate limit headers, stored validators and body
+            return _Response(entry["status"], {**entry["headers"], **response.headers}, entry["body"])
+        if response.status == 200 and ("etag" in response.headers or "last-modified" in response.headers):
+            self._count("miss")
+            self.store.set(key, {"status": response.status, "headers": response.headers, "body": response.body})
+        else:
+            self._count("uncached")
+        return response
+
+    @staticmethod
+    def _send(connection, verb, url, input, headers) -> _Response:
+        connection.connection.request(verb, url, input, headers)
+        response = connection.connection.getresponse()
+        return _Response(response.status, {name.lower(): value for name, value in response.getheaders()}, response.read())
+
+
+_HTTP_CACHE = None
+_HTTP_CACHE_LOCK = threading.Lock()
+
+
+def get_github_http_cache() -> GitHubHttpCache:
+    global _HTTP_CACHE
+    with _HTTP_CACHE_LOCK:
+        if _HTTP_CACHE is None:
+            _HTTP_CACHE = GitHubHttpCache()
+        return _HTTP_CACHE
+
+
+def set_github_cache_mode(mode):
+    global _HTTP_CACHE
+    with _HTTP_CACHE_LOCK:
+        _HTTP_CACHE = GitHubHttpCache(mode=mode)
+
+
+# PyGithub does not keep injected connections alive across requests, the sessions are kept per thread instead
+_SESSIONS = threading.local()
+
+
+class CachingHTTPSConnection(HTTPSRequestsConnectionClass):
+    """
+    HTTPS connection class of PyGithub answering GET requests through the GitHub HTTP cache.
+    """
+
+    def __init__(self, host, *args, **kwargs):
+        self.host = host
+        if not hasattr(_SESSIONS, "host_to_connection"):
+            _SESSIONS.host_to_connection = {}
+        if host not in _SESSIONS.host_to_connection:
+            _SESSIONS.host_to_connection[host] = HTTPSRequestsConnectionClass(host, *args, **kwargs)
+        self.connection = _SESSIONS.host_to_connection[host]
+        self._response = None
+
+    def request(self, verb, url, input, headers, stream=False):
+        if stream:
+            # streamed downloads are read lazily by the caller, they are not cached
+            self.connection.request(verb, url, input, headers, stream)
+            self._response = self.connection.getresponse()
+        else:
+            self._response = get_github_http_cache().request(self, verb, url, input, headers)
+
+    def getresponse(self):
+        return self._response
+
+    def close(self):
+        pass
+
+
+_GITHUB = None
+_GITHUB_LOCK = threading.Lock()
+
+
+def get_github() -> Github:
+    """
+    Returns the GitHub client shared by the process, authenticated with the token in `.github_token`
+    (optional in offline mode).
+    """
+    global _GITHUB
+    with _GITHUB_LOCK:
+        if _GITHUB is None:
+            Requester.injectConnectionClasses(HTTPRequestsConnectionClass, CachingHTTPSConnection)
+            try:
+                with open(".github_token", "r") as f:
+                    auth = Auth.Token(f.read().strip())
+            except FileNotFoundError:
+                if get_github_http_cache().mode != "offline":
+                    raise
+                auth = None
+            _GITHUB = Github(auth=auth)
+        return _GITHUB
@@ -12,16 +12,35 @@ from patchguru.utils.PythonCodeUtil import (
     get_class_name
 )
 from patchguru import Config
+import hashlib
 import os
 import pickle
+from patchguru.utils.DiskCache import DiskCache
+from patchguru.utils.GitDiff import get_diff
 from patchguru.utils.Tracker import append_event, Event
 
+# Hover results only depend on the repository contents at a commit and on where the file is in it
+_HOVER_CACHE = DiskCache(os.path.join(Config.CACHE_DIR, "hover"), Config.HOVER_CACHE_MAX_BYTES)
+
+
+def hover_cache_key(commit, file_path, blob_hash, line, column) -> str:
+    # identical files at different paths resolve imports (e.g., relative ones) differently
+    return f"{commit}:{file_path}:{blob_hash}:{line}:{column}"
+
+
+def git_blob_hash(content: bytes) -> str:
+    """
+    Returns the hash git assigns to a blob with the given content.
+    """
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
 class PullRequest:
     def __init__(self, github_pr, github_repo, cloned_repo_manager):
 
         self.github_pr = github_pr
         self.cloned_repo_manager = cloned_repo_manager
         self.number = github_pr.number
+        self.repo_full_name = github_repo.full_name
         self.title = github_pr.title
         self.post_commit = github_pr.merge_commit_sha
         self.parents = github_repo.get_commit(self.post_commit).parents
@@ -63,9 +82,11 @@ class PullRequest:
                     level="WARNING", pr_nb=self.number,
                     message=f"Failed to load cache for PR #{self.number}: {e}. Re-initializing from scratch."
                 ))
+        # keep both clones at their commits while other PRs are analyzed concurrently
+        self.cloned_repo_manager.acquire([self.pre_commit, self.post_commit])
         try:
 
-            self._pr_url_to_patch()
+            self._compute_patch()
             self._compute_non_test_modified_files()
             self._compute_modified_lines()
 
@@ -122,6 +143,21 @@ class PullRequest:
                 }
                 pickle.dump(cached_data, f)
             raise e
+        finally:
+            self.cloned_repo_manager.release([self.pre_commit, self.post_commit])
+
+    def _compute_patch(self):
+        post_commit_cloned_repo = self.cloned_repo_manager.get_cloned_repo(
+            self.post_commit)
+        diff = get_diff(post_commit_cloned_repo.repo.working_dir, self.pre_commit, self.post_commit)
+        if diff is None:
+            append_event(Event(
+                level="WARNING", pr_nb=self.number,
+                message=f"Commits of PR #{self.number} are missing in the local clone, downloading its diff from GitHub."
+            ))
+            self._pr_url_to_patch()
+        else:
+            self.patch = PatchSet(diff)
 
     def _pr_url_to_patch(self):
         diff_url = self.github_pr.html_url + ".diff"
@@ -311,13 +347,7 @@ class PullRequest:
         self.old_file_path_to_modified_lines = {}
         self.new_file_path_to_modified_lines = {}
 
-        post_commit_cloned_repo = self.cloned_repo_manager.get_cloned_repo(
-            self.post_commit)
-        diff = post_commit_cloned_repo.repo.git.diff(
-            self.pre_commit, self.post_commit)
-        patch = PatchSet(diff)
-
-        for patched_file in patch:
+        for patched_file in self.patch:
             self.old_file_path_to_modified_lines[patched_file.path] = set()
             self.new_file_path_to_modified_lines[patched_file.path] = set()
             for hunk in patched_file:
@@ -334,34 +364,59 @@ class PullRequest:
         Returns a list of docstrings that are relevant to the changed functions.
         """
         if version == "post_commit":
-            cloned_repo = self.cloned_repo_manager.get_cloned_repo(self.post_commit)
+            commit = self.post_commit
             fut_info = self.post_fut_info
         elif version == "pre_commit":
-            cloned_repo = self.cloned_repo_manager.get_cloned_repo(self.pre_commit)
+            commit = self.pre_commit
             fut_info = self.prev_fut_info
         else:
             raise ValueError(f"Unexpected version: {version}. Expected 'pre_commit' or 'post_commit'.")
+        cloned_repo = self.cloned_repo_manager.get_cloned_repo(commit)
 
         result = ""
+        cache_hits = 0
+        cache_misses = 0
         for fut_name, fut_data in fut_info.items():
             file_path = fut_data["file_path"]
             start_line = fut_data["start_line"]
             end_line = fut_data["end_line"]
-            f"{cloned_repo.repo.working_dir}/{file_path}"
-            with open(f"{cloned_repo.repo.working_dir}/{file_path}", "r") as f:
+            # the key hashes the bytes of the file, the analysis reads it with universal newlines as before
+            with open(f"{cloned_repo.repo.working_dir}/{file_path}", "rb") as f:
+                blob_hash = git_blob_hash(f.read())
+            with open(f"{cloned_repo.repo.working_dir}/{file_path}", "r", newline=None) as f:
                 file_content = f.read()
 
             call_locations = get_locations_of_calls_by_range(
                 file_content, start_line, end_line
             )
 
-
-            server = cloned_repo.language_server
-            docs = []
+            positions = []
             for call_location in call_locations:
                 line = call_location.start.line - 1  # LSP lines are 0-based
                 column = call_location.start.column
-                doc = server.get_hover_text(file_path, line, column + 1)
+                positions.append((line, column + 1))
+
+            # serve known hovers from the cache, ask the language server for the rest only
+            hover_texts = {}
+            missing_positions = []
+            for line, column in positions:
+                cached_text = _HOVER_CACHE.get(hover_cache_key(commit, file_path, blob_hash, line, column))
+                if cached_text is None:
+                    missing_positions.append((line, column))
+                else:
+                    hover_texts[(line, column)] = cached_text
+            cache_hits += len(positions) - len(missing_positions)
+            cache_misses += len(missing_positions)
+
+            if len(missing_positions) > 0:
+                server = cloned_repo.language_server
+                for position, text in zip(missing_positions, server.get_hover_texts(file_path, missing_positions)):
+                    hover_texts[position] = text
+                    _HOVER_CACHE.set(hover_cache_key(commit, file_path, blob_hash, position[0], position[1]), text)
+
+            docs = []
+            for position in positions:
+                doc = hover_texts[position]
                 if doc not in docs:
                     docs.append(doc)
 
@@ -370,4 +425,14 @@ class PullRequest:
                 result += "\n\n-------\n"
                 result += doc[:2000]
 
+        append_event(Event(
+            level="DEBUG", pr_nb=self.number,
+            message=f"Hover cache: {cache_hits} hits, {cache_misses} misses",
+            type="HoverCache",
+            info={
+                "commit": commit,
+                "hits": cache_hits,
+                "misses": cache_misses
+            }
+        ))
         return result[:6000]  # limit to 6000 chars in total
@@ -1,33 +1,175 @@
 # This file is developed based on the code from the [Testora](https://github.com/michaelpradel/Testora) project by Michael Pradel.
+from contextlib import ExitStack
 from multilspy import SyncLanguageServer
 from multilspy.multilspy_config import MultilspyConfig
 from multilspy.multilspy_logger import MultilspyLogger
 from pathlib import Path
+import threading
+import time
+from patchguru import Config
+from patchguru.utils.Tracker import append_event, Event
 
 
 class PythonLanguageServer:
-    def __init__(self, repo_path):
+    """
+    Long-lived session around a jedi-language-server process for one clone.
+
+    The server is started lazily on the first request and kept alive across requests
+    and PRs. It is restarted when it crashes or when the clone is checked out to
+    another commit (see `restart`), and shut down after `Config.LSP_IDLE_TIMEOUT`
+    seconds without requests.
+    """
+
+    def __init__(self, repo_path, idle_timeout=Config.LSP_IDLE_TIMEOUT):
+        self.repo_path = str(Path(repo_path).resolve())
+        self.idle_timeout = idle_timeout
+        self.lsp = None
+        self._session = None
+        self._lock = threading.RLock()
+        self._idle_timer = None
+        self._last_used = 0.0
+
+    def _create_lsp(self):
         config = MultilspyConfig.from_dict({"code_language": "python"})
         logger = MultilspyLogger()
-        absolute_repo_path = str(Path(repo_path).resolve())
-        self.lsp = SyncLanguageServer.create(
-            config, logger, absolute_repo_path)
+        return SyncLanguageServer.create(config, logger, self.repo_path)
+
+    def start(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            start_time = time.time()
+            self.lsp = self._create_lsp()
+            session = ExitStack()
+            session.enter_context(self.lsp.start_server())
+            self._session = session
+            append_event(Event(
+                level="DEBUG",
+                message=f"Started language server for {self.repo_path} in {time.time() - start_time:.2f} seconds",
+                type="LanguageServerStart",
+                info={
+                    "repo_path": self.repo_path,
+                    "startup_time": time.time() - start_time
+                }
+            ))
+
+    def stop(self):
+        with self._lock:
+            self._cancel_idle_timer()
+            if self._session is None:
+                return
+            session = self._session
+            self._session = None
+            try:
+                session.close()
+            except Exception as e:
+                append_event(Event(
+                    level="WARNING",
+                    message=f"Failed to shut down language server for {self.repo_path} cleanly: {e}"
+                ))
+            finally:
+                self.lsp = None
+
+    def restart(self):
+        """
+        Drops the current session, e.g., after the clone was checked out to another commit.
+        A new server is started lazily on the next request.
+        """
+        with self._lock:
+            self.stop()
+
+    def is_alive(self) -> bool:
+        """
+        Health check: the session is open, its event loop is running and the server process has not exited.
+        """
+        with self._lock:
+            if self._session is None or self.lsp is None:
+                return False
+            if self.lsp.loop is None or not self.lsp.loop.is_running():
+                return False
+            process = self.lsp.language_server.server.process
+            return process is not None and process.returncode is None
+
+    def _ensure_alive(self):
+        if self._session is not None and not self.is_alive():
+            append_event(Event(
+                level="WARNING",
+                message=f"Language server for {self.repo_path} is not responding. Restarting it."
+            ))
+            self.stop()
+        self.start()
+
+    def _cancel_idle_timer(self):
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _schedule_idle_shutdown(self):
+        self._last_used = time.time()
+        if self.idle_timeout is None or self.idle_timeout <= 0:
+            return
+        self._cancel_idle_timer()
+        self._idle_timer = threading.Timer(self.idle_timeout, self._shutdown_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _shutdown_if_idle(self):
+        with self._lock:
+            if time.time() - self._last_used >= self.idle_timeout:
+                append_event(Event(
+                    level="DEBUG",
+                    message=f"Shutting down idle language server for {self.repo_path}"
+                ))
+                self.stop()
+
+    def _request(self, request_fn):
+        with self._lock:
+            self._cancel_idle_timer()
+            self._ensure_alive()
+            try:
+                return request_fn(self.lsp)
+            except Exception as e:
+                # the server may have crashed mid-request, retry once on a fresh session
+                append_event(Event(
+                    level="WARNING",
+                    message=f"Language server request failed for {self.repo_path}: {e}. Retrying on a fresh session."
+                ))
+                self.stop()
+                self.start()
+                return request_fn(self.lsp)
+            finally:
+                self._schedule_idle_shutdown()
+
+    @staticmethod
+    def _hover_to_text(raw_result):
+        if type(raw_result) == dict and "contents" in raw_result:
+            return raw_result["contents"]["value"]
+        else:
+            return ""
 
     def get_hover_text(self, file_path, line, column):
-        with self.lsp.start_server():
-            raw_result = self.lsp.request_hover(file_path, line, column)
-            if type(raw_result) == dict and "contents" in raw_result:
-                return raw_result["contents"]["value"]
-            else:
-                return ""
+        raw_result = self._request(
+            lambda lsp: lsp.request_hover(file_path, line, column))
+        return self._hover_to_text(raw_result)
+
+    def get_hover_texts(self, file_path, positions, max_concurrency=Config.LSP_MAX_CONCURRENT_REQUESTS):
+        """
+        Resolves the hover texts of all (line, column) positions of a file in one round-trip.
+        Results are returned in the order of the given positions.
+        """
+        if len(positions) == 0:
+            return []
+        raw_results = self._request(
+            lambda lsp: lsp.request_hover_many(file_path, positions, max_concurrency))
+        return [self._hover_to_text(raw_result) for raw_result in raw_results]
 
     def get_definition(self, file_path, line, column):
-        with self.lsp.start_server():
-            raw_result = self.lsp.request_definition(file_path, line, column)
-            if type(raw_result) == dict and "targetUri" in raw_result:
-                return raw_result["targetUri"]
-            else:
-                return ""
+        raw_result = self._request(
+            lambda lsp: lsp.request_definition(file_path, line, column))
+        if type(raw_result) == dict and "targetUri" in raw_result:
+            return raw_result["targetUri"]
+        else:
+            return ""
 
 
 # for testing
@@ -1,6 +1,9 @@
 from pydantic import BaseModel
 from typing import List
+from contextlib import contextmanager
+import contextvars
 import json
+import threading
 import time
 import os
 from patchguru import Config
@@ -10,26 +13,68 @@ import atexit
 # Global event list
 _USAGE = []
 
-# Create event logs directory
-_initialized_time = time.strftime("%Y%m%d-%H%M%S")
-log_dir = os.path.join(Config.LOG_DIR, _initialized_time)
-while os.path.exists(log_dir):
-    time.sleep(1)
-    _initialized_time = time.strftime("%Y%m%d-%H%M%S")
-    log_dir = os.path.join(Config.LOG_DIR, _initialized_time)
+# Event logs directory of the process, created on first use (see `init_tracker`)
+log_dir = None
+text_log_file = None
+json_log_file = None
+logger = None
 
-os.makedirs(log_dir)
+_LOCK = threading.Lock()
+# (log directory, events file, usage list) of the PR analyzed in the current thread, if any
+_PR_LOG = contextvars.ContextVar("pr_log", default=None)
 
-text_log_file = os.path.join(log_dir, "events.log")
-json_log_file = os.path.join(log_dir, f"events.jsonl")
-setup_logging("DEBUG", log_file=text_log_file)
-logger = get_logger("PatchGuru")
+def init_tracker(log_root=None) -> str:
+    """
+    Creates the event logs directory of the process under `log_root` (Config.LOG_DIR by default)
+    and sets up logging. Called by the CLIs, and otherwise on the first event. Returns the directory.
+    """
+    global log_dir, text_log_file, json_log_file, logger
+    with _LOCK:
+        if log_dir is not None:
+            return log_dir
+        log_root = Config.LOG_DIR if log_root is None else log_root
+        initialized_time = time.strftime("%Y%m%d-%H%M%S")
+        candidate = os.path.join(log_root, initialized_time)
+        suffix = 0
+        while True:
+            try:
+                os.makedirs(candidate)
+                break
+            except FileExistsError:
+                # another process started within the same second
+                suffix += 1
+                candidate = os.path.join(log_root, f"{initialized_time}-{suffix}")
 
-def store_usage():
-    with open(os.path.join(log_dir, f"llm_usage.json"), "w") as f:
-        json.dump(_USAGE, f, indent=2)
+        text_log_file = os.path.join(candidate, "events.log")
+        json_log_file = os.path.join(candidate, "events.jsonl")
+        setup_logging("DEBUG", log_file=text_log_file)
+        logger = get_logger("PatchGuru")
+        log_dir = candidate
+        atexit.register(store_usage)
+        return log_dir
 
-atexit.register(store_usage)
+def store_usage(usage_dir=None, usage=None):
+    if usage_dir is None:
+        usage_dir, usage = log_dir, _USAGE
+    with _LOCK:
+        with open(os.path.join(usage_dir, "llm_usage.json"), "w") as f:
+            json.dump(usage, f, indent=2)
+
+@contextmanager
+def pr_log_dir(pr_nb):
+    """
+    Routes the events and LLM usage of the current thread to a log directory of its own,
+    so that PRs analyzed concurrently keep one PR per log directory.
+    """
+    pr_dir = f"{init_tracker()}-pr{pr_nb}"
+    os.makedirs(pr_dir, exist_ok=True)
+    usage = []
+    token = _PR_LOG.set((pr_dir, os.path.join(pr_dir, "events.jsonl"), usage))
+    try:
+        yield pr_dir
+    finally:
+        _PR_LOG.reset(token)
+        store_usage(pr_dir, usage)
 
 
 
@@ -42,6 +87,8 @@ class Event(BaseModel):
     info: dict = {}
 
 def append_event(evt):
+    if log_dir is None:
+        init_tracker()
     evt.timestamp = time.strftime("%Y%m%d-%H%M%S")
     if isinstance(evt.message, list):
         evt.message = "\n".join(evt.message)
@@ -55,8 +102,11 @@ def append_event(evt):
         assert evt.level == "INFO", f"Unknown log level: {evt.level}"
         logger.info(f"{evt.type} - {evt.message}")
 
-    if evt.type == "LLMQuery":
-        _USAGE.append(evt.info)
-    # Append events to event logs file as json format
-    with open(json_log_file, "a") as f:
-        f.write(json.dumps(evt.dict()) + "\n")
+    pr_log = _PR_LOG.get()
+    events_file, usage = (json_log_file, _USAGE) if pr_log is None else pr_log[1:]
+    with _LOCK:
+        if evt.type == "LLMQuery":
+            usage.append(evt.info)
+        # Append events to event logs file as json format
+        with open(events_file, "a") as f:
+            f.write(json.dumps(evt.dict()) + "\n")
@@ -0,0 +1,9 @@
+import pytest
+
+from patchguru.utils import Tracker
+
+
+@pytest.fixture(autouse=True, scope="session")
+def tracker_log_dir(tmp_path_factory):
+    # keep the event logs of the tests out of the repository
+    return Tracker.init_tracker(str(tmp_path_factory.mktemp("logs")))
@@ -0,0 +1,47 @@
+import json
+
+from patchguru import Config
+from patchguru.prompts.AnswerParser import AnswerParser, parse_statistics, strip_code_fence
+
+
+def make_parser(name):
+    return AnswerParser(name, ["specification"], optional_tags=["reasoning"], code_tags=["specification"],
+                        keys={"reasoning": "explanation"})
+
+
+def test_parses_tagged_answer():
+    answer = "<reasoning> Because. </reasoning>\n<specification>\n```python\nassert f(1) == 2\n```\n</specification>"
+    assert make_parser("tagged").parse(answer) == {"explanation": "Because.", "specification": "assert f(1) == 2"}
+
+
+def test_parses_structured_answer():
+    answer = json.dumps({"reasoning": "Because.", "specification": "assert f(1) == 2"})
+    assert make_parser("structured").parse(answer) == {"explanation": "Because.", "specification": "assert f(1) == 2"}
+
+
+def test_optional_tag_may_be_missing():
+    assert make_parser("optional").parse("<specification>assert True</specification>") == {"specification": "assert True"}
+
+
+def test_missing_required_tag_is_counted_as_failure():
+    parser = make_parser("failures")
+    assert parser.parse("<reasoning>Because.</reasoning>") is None
+    assert parser.parse("<specification>assert True</specification>") is not None
+    assert parse_statistics()["failures"] == {"answers": 2, "failures": 1, "failure_rate": 0.5}
+
+
+def test_strip_code_fence():
+    assert strip_code_fence("x = 1") == "x = 1"
+    assert strip_code_fence("```\nx = 1\n```") == "x = 1"
+    assert strip_code_fence("text\n```python\nx = 1\n```\n```\ny = 2\n```") == "x = 1"
+    # an answer cut off inside its fence
+    assert strip_code_fence("```python\nx = 1") == "x = 1"
+
+
+def test_response_format_only_in_structured_output_mode(monkeypatch):
+    parser = make_parser("schema")
+    monkeypatch.setattr(Config, "LLM_STRUCTURED_OUTPUT", False)
+    assert parser.response_format() is None
+    monkeypatch.setattr(Config, "LLM_STRUCTURED_OUTPUT", True)
+    schema = parser.response_format()["json_schema"]["schema"]
+    assert schema["required"] == ["reasoning", "specification"]
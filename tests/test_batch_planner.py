@@ -0,0 +1,33 @@
+from patchguru.analysis.BatchPlanner import count_checkouts, order_by_adjacency
+
+
+def test_count_checkouts_reuses_checked_out_commits():
+    # a chain of PRs: the pre-commit of each PR is the post-commit of the previous one
+    chain = [("a", "b"), ("b", "c"), ("c", "d")]
+    assert count_checkouts(chain, nb_clones=2) == 4
+    # an unrelated PR in the middle of the chain evicts the commit the next PR starts from
+    assert count_checkouts([("a", "b"), ("b", "c"), ("x", "y")], nb_clones=2) == 5
+    assert count_checkouts([("a", "b"), ("x", "y"), ("b", "c")], nb_clones=2) == 6
+    assert count_checkouts(chain, nb_clones=2, checked_out=["a"]) == 3
+
+
+def test_count_checkouts_never_evicts_the_other_commit_of_the_pair():
+    # with two clones, checking out "d" must evict "a" (least recently used) rather than "c"
+    assert count_checkouts([("a", "b"), ("c", "d"), ("c", "e")], nb_clones=2) == 5
+
+
+def test_order_by_adjacency_follows_chains_in_merge_order():
+    pr_to_commits = {
+        1: ("c", "d"),  # continues the chain of PR 3
+        2: ("x", "y"),
+        3: ("a", "c"),
+    }
+    commit_to_time = {"d": 30, "y": 20, "c": 10}
+    assert order_by_adjacency(pr_to_commits, commit_to_time) == [3, 1, 2]
+
+
+def test_order_by_adjacency_keeps_every_pr_once():
+    # two PRs with the same pre-commit, only one of them can directly follow PR 1
+    pr_to_commits = {1: ("a", "b"), 2: ("b", "c"), 3: ("b", "d")}
+    commit_to_time = {"b": 1, "c": 2, "d": 3}
+    assert order_by_adjacency(pr_to_commits, commit_to_time) == [1, 2, 3]
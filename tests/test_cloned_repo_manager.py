@@ -0,0 +1,42 @@
+import subprocess
+
+import pytest
+from git import Repo
+
+from patchguru.utils.ClonedRepoManager import ClonedRepoManager
+
+
+@pytest.fixture
+def clone(tmp_path):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    (tmp_path / "module.py").write_text("x = 1\n")
+    subprocess.run(["git", "add", "-A"], cwd=tmp_path, check=True)
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", "commit", "-q", "-m", "base"],
+                   cwd=tmp_path, check=True)
+    return Repo(tmp_path)
+
+
+def make_manager(commit):
+    manager = ClonedRepoManager.__new__(ClonedRepoManager)
+    manager.clone_id_to_state = {"clone1": {"commit": commit}}
+    return manager
+
+
+def test_clone_at_the_recorded_commit_is_clean(clone):
+    assert make_manager(clone.head.commit.hexsha)._is_clean("clone1", clone)
+
+
+def test_clone_at_another_commit_is_not_clean(clone):
+    assert not make_manager("unknown")._is_clean("clone1", clone)
+
+
+@pytest.mark.parametrize("file_name", ["module.py", "untracked.py"])
+def test_clone_with_local_changes_is_not_clean(clone, file_name):
+    with open(f"{clone.working_dir}/{file_name}", "w") as f:
+        f.write("x = 2\n")
+    assert not make_manager(clone.head.commit.hexsha)._is_clean("clone1", clone)
+
+
+def test_clone_without_commits_is_not_clean(tmp_path):
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    assert not make_manager("unknown")._is_clean("clone1", Repo(tmp_path))
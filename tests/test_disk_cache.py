@@ -0,0 +1,33 @@
+import json
+import os
+
+from patchguru.utils.DiskCache import DiskCache
+
+
+def entry_size(key, value):
+    return len(json.dumps({"key": key, "value": value}))
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    value = "x" * 100
+    # room for three and a half entries, eviction goes down to 90% of it, i.e., three entries
+    cache = DiskCache(str(tmp_path), max_size_bytes=int(3.5 * entry_size("a", value)))
+    for mtime, key in [(998, "c"), (999, "b"), (1000, "a")]:
+        cache.set(key, value)
+        # explicit modification times, whatever the file system's resolution
+        os.utime(cache._path(key), (mtime, mtime))
+    assert cache.get("c") == value  # bumps "c", "b" is now the least recently used
+
+    cache.set("d", value)
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+    assert cache.get("d") == value
+
+
+def test_get_ignores_entries_of_colliding_paths(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size_bytes=10_000)
+    cache.set("key", "value")
+    with open(cache._path("key"), "w") as f:
+        json.dump({"key": "other", "value": "stale"}, f)
+    assert cache.get("key", "default") == "default"
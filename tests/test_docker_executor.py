@@ -0,0 +1,58 @@
+import threading
+from types import SimpleNamespace
+
+from patchguru import SpecInfer
+from patchguru.execution.DockerExecutor import DockerExecutor
+
+
+class FakeContainer:
+    """
+    Container whose commands all print `output` and exit with `exit_code`.
+    """
+
+    name = "marshmallow-dev1"
+
+    def __init__(self, output, exit_code=0):
+        self.output = output
+        self.exit_code = exit_code
+
+    def put_archive(self, path, data):
+        pass
+
+    def exec_run(self, command, detach=False):
+        return SimpleNamespace(output=self.output, exit_code=self.exit_code)
+
+
+def make_executor(container):
+    executor = DockerExecutor.__new__(DockerExecutor)
+    executor.container = container
+    executor.project_name = "unknown"
+    executor.module_name = None
+    executor.repo_dir = "/home/unknown"
+    executor.commit = None
+    executor._head_argument = ""
+    executor.use_warm_worker = False
+    executor._warm_worker_ready = False
+    executor.install_time = 0
+    executor._worker_lock = threading.Lock()
+    return executor
+
+
+def test_execute_many_non_json_output_fails_every_script():
+    executor = make_executor(FakeContainer(b"mamba: environment activated\n", exit_code=0))
+    results = executor.execute_many(["print(1)", "print(2)", "print(3)"])
+    assert len(results) == 3
+    assert all(result["exit_code"] != 0 for result in results)
+    # one dict per script
+    assert len({id(result) for result in results}) == 3
+
+
+def test_repair_speculatively_accepts_no_candidate_on_non_json_output(monkeypatch):
+    candidates = iter(["candidate_1", "candidate_2"])
+    monkeypatch.setattr(SpecInfer, "repair", lambda *args: next(candidates))
+    executor = make_executor(FakeContainer(b"not json", exit_code=0))
+    states = {"specification_traces": []}
+    specification, exit_code, output = SpecInfer.repair_speculatively(
+        states, executor, "spec", "stdout", "prev", "post", "fut", n_candidates=2, pr_nb=1)
+    assert exit_code != 0
+    assert all(candidate["exit_code"] != 0 for candidate in states["repair_candidates"][-1])
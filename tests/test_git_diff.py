@@ -0,0 +1,41 @@
+import subprocess
+
+import pytest
+
+from patchguru.utils.GitDiff import diff_many
+
+
+def git(repo_dir, *args):
+    return subprocess.run(
+        ["git", *args], cwd=repo_dir, stdout=subprocess.PIPE, check=True).stdout.decode("utf-8")
+
+
+def commit(repo_dir, message):
+    git(repo_dir, "add", "-A")
+    git(repo_dir, "-c", "user.name=test", "-c", "user.email=test@example.com",
+        "commit", "-q", "--allow-empty", "-m", message)
+    return git(repo_dir, "rev-parse", "HEAD").strip()
+
+
+@pytest.fixture
+def commits(tmp_path):
+    git(tmp_path, "init", "-q")
+    (tmp_path / "module.py").write_text("def f():\n    return 1\n")
+    base = commit(tmp_path, "base")
+    (tmp_path / "module.py").write_text("def f():\n    return 2\n")
+    changed = commit(tmp_path, "change f")
+    empty = commit(tmp_path, "empty")
+    # a line that looks like the commit id separators of the diff-tree output
+    (tmp_path / "ids.txt").write_text(f"{changed}\n")
+    added = commit(tmp_path, "add a file")
+    return tmp_path, [base, changed, empty, added]
+
+
+def test_diff_many_matches_git_diff(commits):
+    repo_dir, (base, changed, empty, added) = commits
+    pairs = [(base, changed), (changed, empty), (empty, added), (base, added)]
+    pair_to_diff = diff_many(str(repo_dir), pairs)
+    assert list(pair_to_diff) == pairs
+    for pre_commit, post_commit in pairs:
+        assert pair_to_diff[(pre_commit, post_commit)] == git(repo_dir, "diff", "-M", pre_commit, post_commit)
+    assert pair_to_diff[(changed, empty)] == ""
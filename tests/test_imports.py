@@ -0,0 +1,41 @@
+"""
+Import smoke checks of the entry points, so that a dependency API change breaks the suite rather than every run.
+"""
+import importlib
+
+import pytest
+
+ENTRY_POINTS = [
+    "patchguru.SpecInfer",
+    "patchguru.AsyncSpecInfer",
+    "patchguru.experiments.PRCollector",
+    "patchguru.experiments.RegressionTestsCoverage",
+    "patchguru.utils.GitHubHttpCache",
+    "patchguru.analysis.GitHubPrefetcher",
+]
+
+
+@pytest.mark.parametrize("module", ENTRY_POINTS)
+def test_import(module):
+    importlib.import_module(module)
+
+
+def test_import_mutation_analysis():
+    # the mutation operators come from the vendored mutmut, installed separately
+    pytest.importorskip("mutmut.file_mutation")
+    importlib.import_module("patchguru.experiments.MutationAnalysis")
+
+
+def test_github_cache_connection_class():
+    from github.Requester import HTTPSRequestsConnectionClass
+
+    from patchguru.utils.GitHubHttpCache import CachingHTTPSConnection
+    assert issubclass(CachingHTTPSConnection, HTTPSRequestsConnectionClass)
+
+
+def test_import_writes_no_files():
+    from patchguru.experiments.StartupBenchmark import measure
+
+    # the collector used to open its log file in logs/ at import
+    _, _, _, created_files = measure("patchguru.experiments.PRCollector", runs=1)
+    assert created_files == []
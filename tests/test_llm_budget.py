@@ -0,0 +1,70 @@
+from patchguru.llms import OpenAI
+from patchguru.llms.LLMBudget import RateLimiter, llm_budget
+
+
+class FakeTemplate:
+    """
+    Template whose answers parse unless they are "unparsable" and are valid if they are "valid".
+    """
+
+    @staticmethod
+    def parse_answer(response):
+        return None if response == "unparsable" else {"answer": response}
+
+    @staticmethod
+    def check_valid(answer, function_name):
+        return answer["answer"] == "valid"
+
+    @staticmethod
+    def response_format():
+        return None
+
+
+def fake_llm(monkeypatch, responses):
+    responses = iter(responses)
+    monkeypatch.setattr(OpenAI, "query_llm", lambda prompt, stage, response_format: next(responses))
+
+
+def test_retries_invalid_answers(monkeypatch):
+    fake_llm(monkeypatch, ["invalid", "valid", "unused"])
+    answer, n_queries = OpenAI.query_valid_answer("prompt", FakeTemplate, "f", 3, "stage", "test")
+    assert answer == {"answer": "valid"}
+    assert n_queries == 2
+
+
+def test_stops_at_unparsable_answer(monkeypatch):
+    fake_llm(monkeypatch, ["invalid", "unparsable", "valid"])
+    assert OpenAI.query_valid_answer("prompt", FakeTemplate, "f", 3, "stage", "test") == (None, 2)
+
+
+def test_stops_after_max_queries(monkeypatch):
+    fake_llm(monkeypatch, ["invalid"] * 3)
+    assert OpenAI.query_valid_answer("prompt", FakeTemplate, "f", 2, "stage", "test") == (None, 2)
+
+
+def test_stops_when_the_budget_cannot_afford_the_prompt(monkeypatch):
+    fake_llm(monkeypatch, ["valid"])
+    with llm_budget("test", max_tokens=1):
+        assert OpenAI.query_valid_answer("prompt", FakeTemplate, "f", 3, "stage", "test") == (None, 0)
+
+
+def test_rate_limiter_spaces_out_requests_beyond_the_bucket():
+    limiter = RateLimiter(requests_per_minute=1)
+    assert limiter.reserve(0) == 0
+    # the bucket held one request: the next ones wait a minute each, in arrival order
+    assert 59 < limiter.reserve(0) <= 60
+    assert 119 < limiter.reserve(0) <= 120
+
+
+def test_rate_limiter_settles_reserved_tokens_with_used_tokens():
+    limiter = RateLimiter(tokens_per_minute=600)
+    assert limiter.reserve(600) == 0
+    assert limiter.reserve(600) > 59
+    # the first query used 100 tokens out of its 600, the other 500 are paid back
+    limiter.settle(600, 100)
+    assert 9 < limiter.reserve(0) < 11
+
+
+def test_rate_limiter_without_limits_never_waits():
+    limiter = RateLimiter()
+    assert all(limiter.reserve(10**6) == 0 for _ in range(100))
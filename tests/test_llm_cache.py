@@ -0,0 +1,62 @@
+import pytest
+
+from patchguru.llms.LLMCache import LLMCache, LLMCacheMiss
+
+USAGE = {"prompt_tokens": 3, "completion_tokens": 4}
+
+
+def record(cache_dir, responses):
+    cache = LLMCache(mode="read-write", cache_dir=str(cache_dir), max_size_bytes=1_000_000)
+    for response in responses:
+        cache.record(cache.key("model", 0.7, 100, "prompt"), response, USAGE)
+
+
+def test_identical_queries_replay_their_responses_in_order(tmp_path):
+    record(tmp_path, ["first", "second"])
+    cache = LLMCache(mode="read-only", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    assert cache.lookup(cache.key("model", 0.7, 100, "prompt"))["response"] == "first"
+    assert cache.lookup(cache.key("model", 0.7, 100, "prompt"))["response"] == "second"
+    assert cache.lookup(cache.key("model", 0.7, 100, "prompt")) is None
+
+
+def test_key_depends_on_parameters_and_response_format(tmp_path):
+    cache = LLMCache(mode="read-write", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    keys = {
+        cache.key("model", 0.7, 100, "prompt"),
+        cache.key("other-model", 0.7, 100, "prompt"),
+        cache.key("model", 0.0, 100, "prompt"),
+        cache.key("model", 0.7, 200, "prompt"),
+        cache.key("model", 0.7, 100, "other prompt"),
+        cache.key("model", 0.7, 100, "prompt", {"type": "json_object"}),
+    }
+    assert len(keys) == 6
+
+
+def test_off_mode_neither_replays_nor_records(tmp_path):
+    record(tmp_path, ["first"])
+    cache = LLMCache(mode="off", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    key = cache.key("model", 0.7, 100, "prompt")
+    assert cache.lookup(key) is None
+    cache.record(cache.key("model", 0.7, 100, "new prompt"), "new", USAGE)
+    reader = LLMCache(mode="read-only", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    assert reader.lookup(reader.key("model", 0.7, 100, "new prompt")) is None
+
+
+def test_read_only_mode_does_not_record(tmp_path):
+    cache = LLMCache(mode="read-only", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    key = cache.key("model", 0.7, 100, "prompt")
+    cache.record(key, "response", USAGE)
+    assert cache.lookup(key) is None
+
+
+def test_replay_strict_mode_raises_on_a_miss(tmp_path):
+    record(tmp_path, ["first"])
+    cache = LLMCache(mode="replay-strict", cache_dir=str(tmp_path), max_size_bytes=1_000_000)
+    assert cache.lookup(cache.key("model", 0.7, 100, "prompt"))["usage"] == USAGE
+    with pytest.raises(LLMCacheMiss):
+        cache.lookup(cache.key("model", 0.7, 100, "prompt"))
+
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LLMCache(mode="write-only", cache_dir=str(tmp_path))
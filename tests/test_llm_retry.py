@@ -0,0 +1,40 @@
+import threading
+import time
+
+from patchguru.llms import LLMRetry
+from patchguru.llms.LLMBackend import LLMBackend
+from patchguru.llms.LLMBudget import llm_budget
+
+
+class SlowFirstBackend(LLMBackend):
+    """
+    Backend whose first request answers after `delay` seconds and the next ones immediately.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.n_requests = 0
+        self._lock = threading.Lock()
+
+    def complete(self, arguments):
+        with self._lock:
+            self.n_requests += 1
+            is_first = self.n_requests == 1
+        if is_first:
+            time.sleep(self.delay)
+        return "answer", {"prompt_tokens": 10, "completion_tokens": 5}
+
+
+def test_losing_hedge_is_charged_to_the_budget(monkeypatch):
+    monkeypatch.setattr(LLMRetry, "_hedge_delay", lambda stage: 0.05)
+    backend = SlowFirstBackend(delay=0.3)
+    with llm_budget("test") as budget:
+        (response, usage), hedged = LLMRetry._complete_hedged(backend, {"model": "gpt-4o-mini"}, "test")
+    assert hedged
+    assert backend.n_requests == 2
+    # the winner is charged by the caller, the loser when it completes
+    deadline = time.time() + 5
+    while budget.queries < 1 and time.time() < deadline:
+        time.sleep(0.05)
+    assert budget.queries == 1
+    assert budget.prompt_tokens == 10
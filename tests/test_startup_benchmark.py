@@ -0,0 +1,16 @@
+import json
+
+from patchguru.experiments import StartupBenchmark
+
+
+def test_startup_with_fixture_backend_is_within_budget(tmp_path):
+    fixture_path = tmp_path / "llm_usage.json"
+    fixture_path.write_text(json.dumps([
+        {"prompt": "Describe the change."},
+        {"response": "It fixes a bug.", "prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7},
+    ]))
+    cumulative_times, wall_times, timings, created_files = StartupBenchmark.measure(
+        "patchguru.SpecInfer", runs=1, fixture_files=[str(fixture_path)])
+    assert cumulative_times[0] <= StartupBenchmark.DEFAULT_BUDGET
+    # neither the import nor the backend initialization writes to the working directory
+    assert created_files == []
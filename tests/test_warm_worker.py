@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from patchguru.execution import WarmWorker
+
+WORKER_SCRIPT = WarmWorker.__file__
+
+
+def request(*arguments):
+    completed = subprocess.run([sys.executable, WORKER_SCRIPT, *arguments], stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout.decode("utf-8"))
+
+
+@pytest.fixture
+def worktree_slot(tmp_path):
+    # a worktree whose git directory is an absolute path of the host, not mounted in the container
+    repo_dir = tmp_path / "slot"
+    repo_dir.mkdir()
+    (repo_dir / ".git").write_text("gitdir: /nonexistent/.git/worktrees/slot\n")
+    return repo_dir
+
+
+def test_read_head_of_unmounted_gitdir_is_unknown(worktree_slot):
+    assert WarmWorker.read_head(str(worktree_slot)) is None
+
+
+def test_worker_compares_the_commit_passed_by_the_host(worktree_slot, tmp_path):
+    socket_path = str(tmp_path / "worker.sock")
+    worker = subprocess.Popen([
+        sys.executable, WORKER_SCRIPT, "serve", "--socket", socket_path,
+        "--repo_dir", str(worktree_slot), "--head", "abc"])
+    try:
+        deadline = time.time() + 10
+        while not os.path.exists(socket_path) and time.time() < deadline:
+            time.sleep(0.05)
+
+        assert "ok" in request("ping", "--socket", socket_path, "--head", "abc")
+        script = tmp_path / "script.py"
+        script.write_text("print('warm')\n")
+        response = request("run", "--socket", socket_path, "--head", "abc", str(script))
+        assert response["exit_code"] == 0
+        assert response["output"] == "warm\n"
+
+        # the clone was checked out to another commit
+        assert request("ping", "--socket", socket_path, "--head", "def").get("stale")
+        worker.wait(timeout=10)
+    finally:
+        worker.kill()
+        worker.wait()